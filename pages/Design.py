@@ -4,6 +4,7 @@ import pandas as pd
 import plotly.graph_objects as go
 import numpy as np
 import math
+import time
 import networkx as nx
 
 # ══════════════════════════════════════════
@@ -25,6 +26,7 @@ if "ai_parsed_concept" not in st.session_state: st.session_state.ai_parsed_conce
 
 # State สำหรับเก็บผลลัพธ์ Graph Generation
 if "graph_results"       not in st.session_state: st.session_state.graph_results       = None
+if "placement_report"    not in st.session_state: st.session_state.placement_report    = None
 
 # ── [NEW] Multi-Rank Navigation State ────────────────────────
 if "all_graphs_json"     not in st.session_state: st.session_state.all_graphs_json     = []
@@ -334,6 +336,237 @@ def build_default_matrices(rooms: list) -> tuple[list, list]:
                 C[i][j] = c_val; W[i][j] = w_val
     return C, W
 
+# ══════════════════════════════════════════════════════════════
+# 🪑  FurniturePlacer — Local Constraint Solver (Offline Prompt B)
+# ══════════════════════════════════════════════════════════════
+class SpatialHash:
+    """Uniform-grid spatial index ของ AABB (x0, y0, x1, y1) ใน Local Coordinates ของห้อง"""
+
+    def __init__(self, cell: float = 0.5):
+        self.cell  = cell
+        self.cells = {}
+        self.rects = {}
+        self._next = 0
+
+    def _keys(self, r):
+        c = self.cell
+        for i in range(int(math.floor(r[0] / c)), int(math.floor(r[2] / c)) + 1):
+            for j in range(int(math.floor(r[1] / c)), int(math.floor(r[3] / c)) + 1):
+                yield (i, j)
+
+    def insert(self, rect, tag) -> int:
+        rid = self._next; self._next += 1
+        self.rects[rid] = (rect, tag)
+        for k in self._keys(rect): self.cells.setdefault(k, set()).add(rid)
+        return rid
+
+    def remove(self, rid: int):
+        rect, _ = self.rects.pop(rid)
+        for k in self._keys(rect):
+            bucket = self.cells.get(k)
+            if bucket is not None:
+                bucket.discard(rid)
+                if not bucket: del self.cells[k]
+
+    def hits(self, rect, tags, eps: float = 1e-6) -> bool:
+        seen = set()
+        for k in self._keys(rect):
+            for rid in self.cells.get(k, ()):
+                if rid in seen: continue
+                seen.add(rid)
+                other, tag = self.rects[rid]
+                if tag[0] not in tags: continue
+                if (rect[0] < other[2] - eps and other[0] < rect[2] - eps and
+                        rect[1] < other[3] - eps and other[1] < rect[3] - eps):
+                    return True
+        return False
+
+
+class FurniturePlacer:
+    """
+    วางเฟอร์นิเจอร์ลงใน layout_rects แบบ Deterministic ไม่ต้องพึ่ง LLM:
+      • Body ต้องอยู่ในห้อง และไม่ทับ Body / Clearance ของชิ้นอื่น
+      • Clearance (ด้านหน้า, ตาม orientation_deg) ต้องอยู่ในห้องและไม่ทับ Body อื่น
+      • Body ห้ามทับ Door Swing / Sliding Zone และของสูงห้ามบังหน้าต่าง
+    orientation_deg: 0 = หลังชิดผนัง south (หันหน้า +y), 90 = east, 180 = north, 270 = west
+    """
+
+    MODE_PRIORITY = {"corner": 0, "wall-mounted": 1, "island": 2, "free": 3}
+    SLIDING_DEPTH = 0.6
+    WINDOW_DEPTH  = 0.3
+
+    def __init__(self, layout_rects: list, openings: list, grid_step: float = 0.1,
+                 beam: int = 12, check_budget: int = 20000):
+        self.rooms       = {rd["room"]: rd for rd in layout_rects}
+        self.openings    = openings or []
+        self.grid_step   = grid_step
+        self.beam        = beam
+        self.check_budget = check_budget
+        self._windows    = []
+
+    # ── Geometry helpers ─────────────────────────────────────
+    @staticmethod
+    def footprint(item: dict) -> tuple:
+        w, d = float(item.get("w_m", 0.5)), float(item.get("d_m", 0.5))
+        return (d, w) if int(item.get("orientation_deg", 0)) % 180 == 90 else (w, d)
+
+    @staticmethod
+    def clearance_rect(x, y, fw, fd, orient, cl):
+        if cl <= 0: return None
+        if orient == 0:   return (x, y + fd, x + fw, y + fd + cl)
+        if orient == 90:  return (x - cl, y, x, y + fd)
+        if orient == 180: return (x, y - cl, x + fw, y)
+        return (x + fw, y, x + fw + cl, y + fd)
+
+    def opening_zones(self, room: str) -> list:
+        """Door swing / sliding / window zones ของห้อง (Local Coordinates)"""
+        rd = self.rooms[room]; W, H = rd["w"], rd["h"]
+        zones = []
+        for op in self.openings:
+            if op.get("room") != room: continue
+            ot   = op.get("type", "door"); off = float(op.get("offset_m", 0)); ow = float(op.get("width_m", 0.9))
+            wall = op.get("wall", "south")
+            if ot == "door":      depth, tag = ow, ("swing", op.get("id", ""))
+            elif ot == "sliding": depth, tag = self.SLIDING_DEPTH, ("swing", op.get("id", ""))
+            elif ot == "window":  depth, tag = self.WINDOW_DEPTH, ("window", float(op.get("sill_height_m", 0.9)))
+            else: continue
+            if wall == "south":  rect = (off, 0.0, off + ow, depth)
+            elif wall == "north": rect = (off, H - depth, off + ow, H)
+            elif wall == "west":  rect = (0.0, off, depth, off + ow)
+            else:                rect = (W - depth, off, W, off + ow)
+            zones.append((rect, tag))
+        return zones
+
+    # ── Candidate generation ─────────────────────────────────
+    def _axis(self, lo, hi):
+        if hi < lo - 1e-9: return []
+        n = int(math.floor((hi - lo) / self.grid_step + 1e-9))
+        vals = [lo + k * self.grid_step for k in range(n + 1)]
+        if hi - vals[-1] > 1e-9: vals.append(hi)
+        return vals
+
+    def candidates(self, item: dict, W: float, H: float) -> list:
+        mode = item.get("placement_mode", "free")
+        w, d = float(item.get("w_m", 0.5)), float(item.get("d_m", 0.5))
+        out = []
+        for orient in (0, 90, 180, 270):
+            fw, fd = (d, w) if orient % 180 == 90 else (w, d)
+            if fw > W + 1e-9 or fd > H + 1e-9: continue
+            if mode in ("wall-mounted", "corner"):
+                if orient == 0:     pts = [(x, 0.0) for x in self._axis(0.0, W - fw)]
+                elif orient == 180: pts = [(x, H - fd) for x in self._axis(0.0, W - fw)]
+                elif orient == 90:  pts = [(W - fw, y) for y in self._axis(0.0, H - fd)]
+                else:               pts = [(0.0, y) for y in self._axis(0.0, H - fd)]
+                if mode == "corner":
+                    pts = [p for p in pts if (p[0] < 1e-6 or W - fw - p[0] < 1e-6) and (p[1] < 1e-6 or H - fd - p[1] < 1e-6)]
+            else:
+                pts = [(x, y) for x in self._axis(0.0, W - fw) for y in self._axis(0.0, H - fd)]
+            for x, y in pts:
+                cx, cy = x + fw / 2.0, y + fd / 2.0
+                if mode == "island":
+                    score = abs(cx - W / 2.0) + abs(cy - H / 2.0)
+                else:
+                    wall_gap = min(x, y, W - fw - x, H - fd - y)
+                    score = wall_gap + 0.01 * (abs(cx - W / 2.0) + abs(cy - H / 2.0))
+                out.append((round(score, 6), orient, round(x, 4), round(y, 4), fw, fd))
+        out.sort()
+        return out
+
+    # ── Constraint check ─────────────────────────────────────
+    def _blocks_window(self, body, item):
+        h_m = float(item.get("h_m", 0.0))
+        return any(tag[0] == "window" and h_m > tag[1] and
+                   body[0] < r[2] and r[0] < body[2] and body[1] < r[3] and r[1] < body[3]
+                   for r, tag in self._windows)
+
+    def _try(self, index, cand, item, W, H):
+        _, orient, x, y, fw, fd = cand
+        body = (x, y, x + fw, y + fd)
+        if index.hits(body, {"body", "clear", "swing"}): return None
+        if self._blocks_window(body, item): return None
+        clr = self.clearance_rect(x, y, fw, fd, orient, float(item.get("clearance_m", 0)))
+        if clr is not None:
+            if clr[0] < -1e-6 or clr[1] < -1e-6 or clr[2] > W + 1e-6 or clr[3] > H + 1e-6: return None
+            if index.hits(clr, {"body"}): return None
+        return body, clr
+
+    # ── Search ───────────────────────────────────────────────
+    def _place_room(self, room: str, items: list):
+        rd = self.rooms[room]; W, H = rd["w"], rd["h"]
+        index = SpatialHash(cell=max(0.25, min(W, H) / 4.0))
+        self._windows = []
+        for rect, tag in self.opening_zones(room):
+            if tag[0] == "window": self._windows.append((rect, tag))
+            else: index.insert(rect, tag)
+
+        order = sorted(items, key=lambda it: (self.MODE_PRIORITY.get(it.get("placement_mode", "free"), 3),
+                                              -float(it.get("w_m", 0.5)) * float(it.get("d_m", 0.5)),
+                                              str(it.get("id", ""))))
+        cand_cache = {}
+        checks = [0]
+
+        def feasible(k, budgeted=True):
+            item = order[k]
+            if k not in cand_cache: cand_cache[k] = self.candidates(item, W, H)
+            for cand in cand_cache[k]:
+                if budgeted:
+                    checks[0] += 1
+                    if checks[0] > self.check_budget: return
+                placed = self._try(index, cand, item, W, H)
+                if placed is not None: yield cand, placed
+
+        placements = {}
+
+        def put(k, cand, body, clr):
+            ids = [index.insert(body, ("body", k))]
+            if clr is not None: ids.append(index.insert(clr, ("clear", k)))
+            placements[k] = (cand, ids)
+
+        def dfs(k):
+            if k == len(order): return True
+            for tried, (cand, (body, clr)) in enumerate(feasible(k)):
+                if tried >= self.beam: break
+                put(k, cand, body, clr)
+                if dfs(k + 1): return True
+                for rid in placements.pop(k)[1]: index.remove(rid)
+            return False
+
+        if not dfs(0):
+            # Budget หมด / ไม่มีคำตอบครบทุกชิ้น → Greedy ทีละชิ้น (ข้ามชิ้นที่วางไม่ได้)
+            for _, ids in placements.values():
+                for rid in ids: index.remove(rid)
+            placements.clear()
+            for k in range(len(order)):
+                for cand, (body, clr) in feasible(k, budgeted=False):
+                    put(k, cand, body, clr)
+                    break
+
+        placed, unplaced = [], []
+        for k, item in enumerate(order):
+            if k not in placements:
+                unplaced.append(item); continue
+            (_, orient, x, y, _, _), _ = placements[k]
+            out = dict(item)
+            out.update({"x_m": round(x, 3), "y_m": round(y, 3), "orientation_deg": float(orient)})
+            placed.append((item, out))
+        return placed, unplaced
+
+    def solve(self, furniture: list) -> dict:
+        """คืนค่า {"Furniture": [...], "Unplaced": [...]} — พิกัด x_m/y_m เป็น Local ของห้อง"""
+        by_room = {}
+        unplaced = []
+        rank = {id(item): i for i, item in enumerate(furniture)}
+        for item in furniture:
+            rm = item.get("room", "")
+            if rm in self.rooms: by_room.setdefault(rm, []).append(item)
+            else: unplaced.append(item)
+        placed = []
+        for rm in sorted(by_room):
+            p, u = self._place_room(rm, by_room[rm])
+            placed.extend(p); unplaced.extend(u)
+        placed.sort(key=lambda pair: rank[id(pair[0])])
+        return {"Furniture": [out for _, out in placed], "Unplaced": unplaced}
+
 # ══════════════════════════════════════════
 # 🗂️  Tabs
 # ══════════════════════════════════════════
@@ -909,7 +1142,34 @@ if st.session_state.get("plan_generated", False):
                 "Checks": {"overlaps":[],"clearance_violations":[],"door_swing_conflicts":[]},
             }, ensure_ascii=False, indent=2)
 
-            of_json = st.text_area("⬇️ วาง Openings + Furniture JSON จาก AI (Prompt B)", value=MOCK_OF, height=200, key="of_json")
+            # ค่าเริ่มต้นใส่ผ่าน session_state ครั้งเดียว — run_local_placement เขียนทับ key นี้ได้โดยไม่ชนกับ value=
+            st.session_state.setdefault("of_json", MOCK_OF)
+            of_json = st.text_area("⬇️ วาง Openings + Furniture JSON จาก AI (Prompt B)", height=200, key="of_json")
+
+            # ── Local Placement Solver (ไม่ต้องส่ง LLM ซ้ำเพื่อแก้ Overlap) ──
+            def run_local_placement(rects):
+                try:
+                    src = json.loads(st.session_state.of_json)
+                    t0  = time.perf_counter()
+                    sol = FurniturePlacer(rects, src.get("Openings", [])).solve(src.get("Furniture", []))
+                    ms  = (time.perf_counter() - t0) * 1000.0
+                    src["Furniture"] = sol["Furniture"]
+                    src["Checks"] = {
+                        "overlaps": [], "clearance_violations": [], "door_swing_conflicts": [],
+                        "unplaced": [f"{u.get('id','')} ({u.get('type','')}) ใน {u.get('room','')}" for u in sol["Unplaced"]],
+                    }
+                    st.session_state.of_json = json.dumps(src, ensure_ascii=False, indent=2)
+                    st.session_state.placement_report = (len(sol["Furniture"]), len(sol["Unplaced"]), ms)
+                except Exception as e:
+                    st.session_state.placement_report = str(e)
+
+            st.button("🧩 Auto-place Furniture (Local Solver)", on_click=run_local_placement, args=(layout_rects,),
+                      help="จัดวางเฟอร์นิเจอร์ใหม่ตามขนาด/Clearance/ช่องเปิด ใน JSON ด้านบน แบบ Offline และ Deterministic")
+            _pr = st.session_state.get("placement_report")
+            if isinstance(_pr, tuple):
+                st.caption(f"🧩 วางได้ {_pr[0]} ชิ้น | วางไม่ได้ {_pr[1]} ชิ้น | ใช้เวลา {_pr[2]:.0f} ms")
+            elif _pr:
+                st.error(f"❌ Local Solver ผิดพลาด: {_pr}")
 
             if st.button("🪑 Visualize Openings + Furniture", type="primary"):
                 try:
@@ -956,8 +1216,7 @@ if st.session_state.get("plan_generated", False):
                         rd = room_lookup[rm]
                         fx = rd["x"] + fi_item.get("x_m", 0)
                         fy = rd["y"] + fi_item.get("y_m", 0)
-                        fw = fi_item.get("w_m", 0.5)
-                        fd = fi_item.get("d_m", 0.5)
+                        fw, fd = FurniturePlacer.footprint(fi_item)
 
                         fig_of.add_shape(type="rect", x0=fx, y0=fy, x1=fx+fw, y1=fy+fd,
                                          fillcolor=FURN_CLR, opacity=0.55, line=dict(color="#FFFFFF", width=1))
@@ -998,7 +1257,8 @@ if st.session_state.get("plan_generated", False):
                         rm = fi_item.get("room","")
                         if rm not in room_lookup: continue
                         rd = room_lookup[rm]
-                        fx, fy, fw, fd = fi_item.get("x_m",0), fi_item.get("y_m",0), fi_item.get("w_m",0), fi_item.get("d_m",0)
+                        fx, fy = fi_item.get("x_m",0), fi_item.get("y_m",0)
+                        fw, fd = FurniturePlacer.footprint(fi_item)
                         if fx < 0 or fy < 0 or fx+fw > rd["w"]+0.01 or fy+fd > rd["h"]+0.01:
                             auto_warnings.append(f"⚠️ {fi_item.get('id','')} ({fi_item.get('type','')}) ใน {rm} ล้นออกนอกขอบห้อง!")
 
@@ -1010,6 +1270,9 @@ if st.session_state.get("plan_generated", False):
                     if overlaps:      st.warning("**Overlap Details:**");            st.json(overlaps)
                     if cl_violations: st.warning("**Clearance Violation Details:**"); st.json(cl_violations)
                     if swing_conf:    st.warning("**Door Swing Conflict Details:**"); st.json(swing_conf)
+                    unplaced_items = checks.get("unplaced", [])
+                    if unplaced_items:
+                        auto_warnings.extend(f"⚠️ Local Solver วางไม่ได้: {u}" for u in unplaced_items)
                     if auto_warnings:
                         st.warning("**Auto-detected Warnings:**")
                         for w in auto_warnings: st.markdown(f"- {w}")
@@ -18,35 +18,51 @@ from folium.plugins import Fullscreen, MeasureControl, MousePosition
 from branca.element import MacroElement, Template
 from streamlit_folium import st_folium
 import requests
-from shapely.geometry import shape, mapping
-from shapely.ops import unary_union
+from shapely.geometry import shape, mapping, MultiLineString, Point, Polygon, MultiPolygon
+from shapely.ops import unary_union, transform as shapely_transform
+from shapely.prepared import prep
 from shapely import wkt
+import shapely
 import json
 import networkx as nx
 import osmnx as ox
 import matplotlib
-import matplotlib.colors as colors
-from typing import List, Dict, Any, Optional, Tuple
+from typing import Callable, List, Dict, Any, Optional, Tuple
 import time
+import threading
 import hashlib
+import uuid
 import pickle
 import os
+import shutil
 from pathlib import Path
+from contextlib import contextmanager
 import zipfile
 import io
 import xml.etree.ElementTree as ET
+import numpy as np
 import pandas as pd
+from concurrent.futures import ThreadPoolExecutor
+from requests.adapters import HTTPAdapter
 from math import radians, sin, cos, sqrt, atan2, log, exp, pi
+from utils.analysis_jobs import JobCancelled, JobManager
+from utils.network_centrality import sample_sources, undirected_csr
 
-# scipy เป็น optional accelerator สำหรับ closeness (fallback เป็น networkx ถ้าไม่มี)
+# scipy เป็น optional accelerator สำหรับ closeness / betweenness (fallback เป็น networkx ถ้าไม่มี)
 try:
-    import numpy as np
     from scipy.sparse import csr_matrix
-    from scipy.sparse.csgraph import dijkstra as csgraph_dijkstra
+    from scipy.sparse.csgraph import dijkstra as csgraph_dijkstra, connected_components
+    from utils.network_centrality import adaptive_closeness, edge_betweenness, exact_closeness
     HAS_SCIPY: bool = True
 except Exception:
     HAS_SCIPY = False
 
+# fcntl (POSIX) ใช้ล็อก index ของ graph cache ข้าม process — ไม่มี (Windows) → ไฟล์ lock แบบ O_EXCL
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
 
 # ============================================================================
 # SECTION 1: CONSTANTS & CONFIGURATION
@@ -120,6 +136,39 @@ TIME_OPTIONS: List[int] = [5, 10, 15, 20, 30, 45, 60]
 CACHE_DIR: Path = Path("./cache")
 CACHE_DIR.mkdir(exist_ok=True)
 
+# OSM graph cache แบบ columnar: หนึ่งโฟลเดอร์ต่อกราฟ osm_graph_<key>/ (โหลดผ่าน memory map)
+#   meta.json (manifest — เขียนเป็นไฟล์สุดท้าย), attrs.json (vocabulary ของ attribute),
+#   <array>.npy ตาม GRAPH_CACHE_ARRAYS, node_<i>.npy / edge_<i>.npy (codes), geom.wkb (WKB ต่อกัน)
+GRAPH_CACHE_FORMAT: int = 2     # 1 = osm_graph_<key>.pkl (migrate อัตโนมัติเมื่อเจอ)
+GRAPH_CACHE_ARRAYS: Tuple[str, ...] = (
+    "node_id", "x", "y", "indptr", "v", "key", "length", "geom_offsets",
+)
+
+# Index ของ graph cache (LRU ตามเวลาใช้ล่าสุด + metadata ต่อ entry) — สร้างใหม่จาก manifest ได้เสมอ
+GRAPH_INDEX_FILE: Path = CACHE_DIR / "graph_index.json"
+GRAPH_INDEX_LOCK_FILE: Path = CACHE_DIR / "graph_index.lock"
+GRAPH_CACHE_CONFIG: Dict[str, Any] = {
+    "max_bytes": 1024 * 1024 * 1024,    # งบขนาดรวมของกราฟ — เกินแล้วลบที่ใช้ล่าสุดนานที่สุดก่อน
+    "touch_interval_s": 60,             # บันทึก last access ลง index ไม่ถี่กว่านี้
+}
+
+# ดาวน์โหลดกราฟเป็น grid tile (เก็บใน cache แยกต่อ tile) แล้วต่อกัน — ขยับหมุดแล้วโหลดแค่ tile ใหม่
+OSM_TILE_CONFIG: Dict[str, Any] = {
+    "enabled": True,
+    "tile_deg": 0.02,           # ขนาด tile (องศา) ≈ 2.2 กม. ที่ละติจูดประเทศไทย
+    "buffer_m": 500,            # เหมือน ox.graph_from_polygon: simplify บนพื้นที่ขยาย แล้วค่อยตัด
+    "max_workers": 2,           # Overpass สาธารณะให้ ~2 slot ต่อ IP (ox.settings.overpass_rate_limit รอ slot ให้)
+    "max_tiles": 200,           # พื้นที่ใหญ่กว่านี้ → ดาวน์โหลดก้อนเดียวแทน
+}
+
+# Persistent isochrone store (Geoapify responses) — อยู่รอด restart และไปกับ bundle.zip
+ISOCHRONE_CACHE_DIR: Path = CACHE_DIR / "isochrones"
+ISOCHRONE_CACHE_CONFIG: Dict[str, Any] = {
+    "coord_precision": 5,       # ทศนิยมของ lat/lon ใน key (5 ≈ 1.1 m)
+    "max_entries": 2000,        # เกินนี้ลบไฟล์ที่ใช้ล่าสุดนานที่สุดก่อน (LRU ตาม mtime)
+    "max_age_days": 180,        # เก่ากว่านี้ถือว่าหมดอายุ (ถนนเปลี่ยน)
+}
+
 # Network Analysis Configuration
 NETWORK_CONFIG: Dict[str, Any] = {
     "min_closeness_threshold": 0.0,
@@ -130,8 +179,19 @@ NETWORK_CONFIG: Dict[str, Any] = {
     "click_distance_threshold_meters": 10,
     "large_graph_threshold": 2000,
     "betweenness_k_samples": 400,
-    "closeness_exact_threshold": 3000,
-    "closeness_k_pivots": 600,
+    "betweenness_workers": None,         # process สำหรับ betweenness ต่องาน (None = จำนวน CPU ÷ analysis_workers)
+    "analysis_workers": 2,               # งาน Network Analysis ที่รันพร้อมกันได้ (Process Pool)
+    "analysis_poll_seconds": 1.0,        # ความถี่ที่หน้าเว็บ poll ความคืบหน้าของงาน
+    "analysis_result_cache": 8,          # ผลที่เก็บไว้ให้ทุก session ใช้ซ้ำ (อายุ cache_ttl_seconds)
+    "closeness_exact_threshold": 12000,  # exact แบบ streaming (หน่วยความจำ O(n)) ถึงขนาดนี้
+    "closeness_block_mb": 32,            # งบหน่วยความจำของ distance block ต่อ Dijkstra call
+    "closeness_pivot_batch": 100,        # pivot ที่เพิ่มต่อรอบ (กราฟใหญ่กว่า exact threshold)
+    "closeness_min_pivots": 200,
+    "closeness_max_pivots": 3000,
+    "closeness_stable_top_k": 10,        # top-k ต้องซ้อนทับรอบก่อน ≥ tolerance
+    "closeness_rank_tolerance": 0.9,
+    "closeness_stable_rounds": 2,
+    "closeness_verify_max": 300,         # ตัวเต็งที่คำนวณ closeness exact ซ้ำ
     "golden_land_top_n": 10,
     "golden_land_weights": {
         "closeness": 0.50,
@@ -140,6 +200,11 @@ NETWORK_CONFIG: Dict[str, Any] = {
     },
 }
 
+# Geometry stage ของ Isochrone (parse ครั้งเดียว → union ต่อหมุด → simplify → intersect)
+GEOMETRY_CONFIG: Dict[str, Any] = {
+    "simplify_tolerance_m": 0.0,    # 0 = ไม่ simplify (ค่า default: CBD ตรงกับ polygon จริง); >0 ใช้กับ polygon ที่ใช้หา CBD เท่านั้น
+}
+
 # Rent Gradient (Bid-Rent Model: Alonso-Muth-Mills) Configuration
 # หลักการ: ค่าเช่า/มูลค่าที่ดินลดลงแบบ negative exponential ตามระยะจาก CBD
 #   R(d) = R₀ · e^(−λ·d)
@@ -169,8 +234,17 @@ TIMEOUT_API: int = 15
 TIMEOUT_INIT: int = 3
 TIMEOUT_GITHUB_LIST: int = 10
 TIMEOUT_GITHUB_DOWNLOAD: int = 60
+
+# Isochrone fetching: fan-out ขนานด้วย session เดียว (connection pool) + backoff เมื่อโดน 429
+ISOCHRONE_FETCH_CONFIG: Dict[str, Any] = {
+    "max_workers": 6,           # จำนวน request พร้อมกันสูงสุด (free tier ของ Geoapify จำกัด ~5 req/s)
+    "pool_size": 8,
+    "max_retries_429": 4,
+    "backoff_base_seconds": 1.0,
+    "backoff_max_seconds": 16.0,
+}
 BUNDLE_VERSION: str = "1.0"
-CACHE_FORMAT_VERSION: str = "1.0"
+CACHE_FORMAT_VERSION: str = "2.0"  # 1.1: + isochrones/iso_*.json | 2.0: columnar osm_graph_<key>/
 CONFIG_SCHEMA_VERSION: int = 2
 MAX_CACHE_ENTRY_BYTES: int = 150 * 1024 * 1024
 
@@ -182,13 +256,48 @@ TRAVEL_MODE_TO_NETWORK_TYPE: Dict[str, str] = {
     "transit": "drive",  # OSMnx has no transit; fallback to drive
 }
 
+# Isochrone source: Geoapify API หรือคำนวณเองจาก OSM graph ที่ cache ไว้ (ไม่ต้องใช้ API key / เน็ต)
+ISOCHRONE_SOURCES: Dict[str, str] = {
+    "api": "🌐 Geoapify API",
+    "offline": "🗺️ Offline (OSM graph ใน Cache)",
+}
+
+# Offline isochrone engine (multi-source Dijkstra บน travel-time + buffered edges)
+OFFLINE_ISOCHRONE_CONFIG: Dict[str, Any] = {
+    "speed_kmh": {"walk": 4.8, "bike": 15.0},   # ความเร็วคงที่ของโหมดที่ไม่ใช่รถยนต์
+    "drive_default_kmh": 30.0,                  # ถนนที่ไม่รู้ประเภท / ไม่มี maxspeed
+    "drive_speeds_kmh": {                       # ตาม highway=* ของ OSM (ใช้เมื่อไม่มี maxspeed)
+        "motorway": 90, "trunk": 70, "primary": 55, "secondary": 45, "tertiary": 35,
+        "unclassified": 30, "residential": 25, "living_street": 10, "service": 15,
+        "motorway_link": 50, "trunk_link": 40, "primary_link": 35,
+        "secondary_link": 30, "tertiary_link": 25,
+    },
+    "buffer_m": {"drive": 40.0, "walk": 25.0, "bike": 30.0},   # ความกว้างของถนนที่ไปถึง
+    "fill_holes_m2": 40_000.0,      # อุดรูภายใน polygon ที่เล็กกว่านี้ (บล็อกระหว่างถนน)
+    "max_snap_m": 500.0,            # หมุดห่างโหนดที่ใกล้ที่สุดเกินนี้ = อยู่นอกกราฟ
+    "edge_margin_m": 200.0,         # โหนดที่ห่างขอบพื้นที่ดาวน์โหลดน้อยกว่านี้ = ขอบกราฟ (ถนนถูกตัด)
+    "max_graphs_tried": 3,          # จำนวนกราฟใน Cache ที่ลอง (เล็ก → ใหญ่) จนกว่าจะไม่ชนขอบ
+}
+
+# ขั้นตอนของงาน Network Analysis: stage → (ช่วง progress เริ่ม, จบ, ข้อความ)
+NETWORK_ANALYSIS_STAGES: Dict[str, Tuple[float, float, str]] = {
+    "download": (0.00, 0.35, "🛰️ โหลดโครงข่ายถนน (OSM / Cache)"),
+    "lcc": (0.35, 0.40, "🧩 สร้างโมเดลกราฟ + Largest Connected Component"),
+    "closeness": (0.40, 0.60, "🧭 Closeness centrality"),
+    "betweenness": (0.60, 0.90, "🛣️ Edge betweenness"),
+    "ranking": (0.90, 0.94, "💎 จัดอันดับทำเลที่ดินทอง"),
+    "serialization": (0.94, 1.00, "🗺️ สร้าง GeoJSON"),
+}
+
 # Keys to persist in config file
 SESSION_KEYS_TO_SAVE: List[str] = [
     "api_key", "map_style_name", "travel_mode", "time_intervals",
     "show_dol", "show_cityplan", "cityplan_opacity", "show_population",
     "show_traffic", "colors", "show_betweenness", "show_closeness",
     "show_railway", "show_golden_spots",
+    "golden_w_closeness", "golden_w_degree", "golden_w_low_traffic",
     "rent_samples", "rent_unit_label", "show_rent_rings", "show_rent_nodes",
+    "isochrone_source",
 ]
 
 # Keys to persist as precomputed outputs (avoid recalculation after import)
@@ -244,6 +353,18 @@ class StateManager:
     K_SHOW_RENT_RINGS: str = "show_rent_rings"
     K_SHOW_RENT_NODES: str = "show_rent_nodes"
     K_RENT_UNIT: str = "rent_unit_label"
+    K_ISOCHRONE_FETCH: str = "isochrone_fetch_stats"
+    K_ISOCHRONE_SOURCE: str = "isochrone_source"
+    K_OFFLINE_GRAPH_KEY: str = "offline_graph_key"
+    K_ISO_GEOMS: str = "_isochrone_geometries"
+    K_NETWORK_JOB: str = "network_job"
+    K_SESSION_ID: str = "_session_id"
+    # slider key ต่อ component ของคะแนนทำเลที่ดินทอง
+    K_GOLDEN_WEIGHTS: Dict[str, str] = {
+        "closeness": "golden_w_closeness",
+        "degree": "golden_w_degree",
+        "low_traffic_bonus": "golden_w_low_traffic",
+    }
 
     # ---- Default values ----
     _DEFAULTS: Dict[str, Any] = {
@@ -277,6 +398,12 @@ class StateManager:
         K_SHOW_RENT_RINGS: True,
         K_SHOW_RENT_NODES: False,
         K_RENT_UNIT: "บาท/ตร.ว./เดือน",
+        K_ISOCHRONE_FETCH: None,
+        K_ISOCHRONE_SOURCE: "api",
+        K_OFFLINE_GRAPH_KEY: None,
+        K_ISO_GEOMS: None,
+        K_NETWORK_JOB: None,
+        **{key: NETWORK_CONFIG["golden_land_weights"][name] for name, key in K_GOLDEN_WEIGHTS.items()},
     }
 
     _DEFAULT_MARKER: Dict[str, Any] = {
@@ -307,6 +434,8 @@ class StateManager:
         # Apply defaults using setdefault (idempotent)
         for key, value in defaults.items():
             st.session_state.setdefault(key, value)
+        # id ของ session นี้ (subscriber ของงาน Network Analysis ที่ใช้ร่วมกันหลาย session)
+        st.session_state.setdefault(cls.K_SESSION_ID, uuid.uuid4().hex)
 
         # Ensure every marker dict has an 'active' key
         for m in st.session_state[cls.K_MARKERS]:
@@ -409,6 +538,82 @@ class StateManager:
     def set_network_data(cls, data: Optional[Dict[str, Any]]) -> None:
         st.session_state[cls.K_NETWORK] = data
 
+    @classmethod
+    def get_isochrone_geometries(cls) -> Optional[Dict[str, Any]]:
+        """
+        Parsed shapely geometries of the current isochrone data — built once
+        and reused until ``isochrone_data`` is replaced (identity check).
+        """
+        iso_data = st.session_state.get(cls.K_ISOCHRONE)
+        if not iso_data:
+            return None
+        memo = st.session_state.get(cls.K_ISO_GEOMS)
+        if memo is None or memo["source"] is not iso_data:
+            memo = {"source": iso_data,
+                    "geoms": build_isochrone_geometries(iso_data.get("features") or [])}
+            st.session_state[cls.K_ISO_GEOMS] = memo
+        return memo["geoms"]
+
+    @classmethod
+    def get_network_job(cls) -> Optional[Dict[str, Any]]:
+        """งาน Network Analysis ที่ session นี้รออยู่: ``{"key", "notice"}``"""
+        return st.session_state.get(cls.K_NETWORK_JOB)
+
+    @classmethod
+    def set_network_job(cls, job: Optional[Dict[str, Any]]) -> None:
+        st.session_state[cls.K_NETWORK_JOB] = job
+
+    @classmethod
+    def get_session_id(cls) -> str:
+        return st.session_state[cls.K_SESSION_ID]
+
+    @classmethod
+    def get_golden_weights(cls) -> Dict[str, float]:
+        return {name: float(st.session_state[key]) for name, key in cls.K_GOLDEN_WEIGHTS.items()}
+
+    @classmethod
+    def rerank_golden_spots(cls) -> None:
+        """
+        Re-rank golden spots of the current network result with the weights
+        from the sidebar — uses the stored per-node components, so centrality
+        is not recomputed.  No-op when the weights are unchanged.
+        """
+        net_data = st.session_state[cls.K_NETWORK]
+        if not net_data or not net_data.get("golden_components"):
+            return
+        weights = cls.get_golden_weights()
+        if net_data.get("golden_weights") == weights:
+            return
+        golden_spots = compute_golden_land_opportunities(
+            net_data["golden_components"], weights, NETWORK_CONFIG["golden_land_top_n"]
+        )
+        st.session_state[cls.K_NETWORK] = {
+            **net_data,
+            "golden_spots": golden_spots,
+            "golden_spots_geojson": build_golden_spots_geojson(golden_spots),
+            "golden_weights": weights,
+        }
+
+    @classmethod
+    def get_isochrone_source(cls) -> str:
+        return st.session_state.get(cls.K_ISOCHRONE_SOURCE, "api")
+
+    @classmethod
+    def get_offline_graph_key(cls) -> Optional[str]:
+        return st.session_state.get(cls.K_OFFLINE_GRAPH_KEY)
+
+    @classmethod
+    def set_offline_graph_key(cls, cache_key: Optional[str]) -> None:
+        st.session_state[cls.K_OFFLINE_GRAPH_KEY] = cache_key
+
+    @classmethod
+    def get_isochrone_fetch_stats(cls) -> Optional[Dict[str, Any]]:
+        return st.session_state.get(cls.K_ISOCHRONE_FETCH)
+
+    @classmethod
+    def set_isochrone_fetch_stats(cls, stats: Optional[Dict[str, Any]]) -> None:
+        st.session_state[cls.K_ISOCHRONE_FETCH] = stats
+
     @classmethod
     def add_marker(cls, lat: float, lng: float) -> None:
         st.session_state[cls.K_MARKERS].append(
@@ -583,43 +788,133 @@ def should_add_marker(
     return True
 
 
+def build_isochrone_geometries(
+    features: List[Dict[str, Any]],
+    simplify_tolerance_m: Optional[float] = None,
+) -> Dict[str, Any]:
+    """
+    Geometry stage: parse every isochrone feature into shapely **once** and
+    share the result with every consumer (CBD intersection, anchor, d_max,
+    network-analysis scope).
+
+    Returns:
+        ``{"per_marker": {active_index: geom}`` — ``unary_union`` of that
+        marker's bands, topology-preserving simplified at
+        ``simplify_tolerance_m``; ``"bounds"``: per-feature bounds;
+        ``"union"``: exact union of everything (lazy, see :func:`isochrone_union`)``}``
+    """
+    tol_m = GEOMETRY_CONFIG["simplify_tolerance_m"] if simplify_tolerance_m is None else simplify_tolerance_m
+    groups: Dict[int, List[Any]] = {}
+    bounds: List[Tuple[float, float, float, float]] = []
+    for feat in features:
+        try:
+            geom = shape(feat["geometry"])
+        except Exception:
+            continue
+        bounds.append(geom.bounds)
+        groups.setdefault(feat["properties"].get("active_index", 0), []).append(geom)
+
+    raw_per_marker = {idx: unary_union(geoms) for idx, geoms in groups.items()}
+    per_marker: Dict[int, Any] = {}
+    for idx, geom in raw_per_marker.items():
+        if tol_m > 0:
+            geom = geom.simplify(tol_m / 111_320.0, preserve_topology=True)
+        if not geom.is_valid:
+            geom = geom.buffer(0)
+        per_marker[idx] = geom
+    return {"per_marker": per_marker, "raw_per_marker": raw_per_marker,
+            "bounds": bounds, "union": None}
+
+
+def isochrone_union(geoms: Dict[str, Any]) -> Optional[Any]:
+    """Exact (unsimplified) union of all travel areas — computed once, memoized in ``geoms``."""
+    if geoms["union"] is None and geoms["raw_per_marker"]:
+        geoms["union"] = unary_union(list(geoms["raw_per_marker"].values()))
+    return geoms["union"]
+
+
 def calculate_intersection(
-    features: List[Dict[str, Any]], num_active_markers: int
+    features: List[Dict[str, Any]],
+    num_active_markers: int,
+    geoms: Optional[Dict[str, Any]] = None,
 ) -> Optional[Dict[str, Any]]:
-    """Calculate the geometric intersection (CBD) of isochrones."""
+    """
+    Calculate the geometric intersection (CBD) of isochrones.
+
+    Markers are intersected smallest-area first (the running result can only
+    shrink), each step pre-checked with a bounding-box test and a plain
+    ``intersects`` so disjoint inputs exit before any overlay work (every
+    geometry is tested once, so preparing it would cost more than it saves).
+    """
     if num_active_markers < 2:
         return None
 
-    polys_per_active_idx: Dict[int, Any] = {}
-    for feat in features:
-        active_idx: int = feat["properties"]["active_index"]
-        geom = shape(feat["geometry"])
-        if active_idx in polys_per_active_idx:
-            polys_per_active_idx[active_idx] = polys_per_active_idx[active_idx].union(geom)
-        else:
-            polys_per_active_idx[active_idx] = geom
-
-    if len(polys_per_active_idx) < num_active_markers:
+    if geoms is None:
+        geoms = build_isochrone_geometries(features)
+    per_marker = geoms["per_marker"]
+    if len(per_marker) < num_active_markers:
         return None
 
-    active_indices = sorted(polys_per_active_idx.keys())
     try:
-        intersection_poly = polys_per_active_idx[active_indices[0]]
-        for idx in active_indices[1:]:
-            intersection_poly = intersection_poly.intersection(polys_per_active_idx[idx])
+        ordered = sorted(per_marker.values(), key=lambda g: g.area)
+        intersection_poly = ordered[0]
+        for geom in ordered[1:]:
+            ax0, ay0, ax1, ay1 = intersection_poly.bounds
+            bx0, by0, bx1, by1 = geom.bounds
+            if ax0 > bx1 or bx0 > ax1 or ay0 > by1 or by0 > ay1:
+                return None
+            if not intersection_poly.intersects(geom):
+                return None
+            intersection_poly = intersection_poly.intersection(geom)
             if intersection_poly.is_empty:
                 return None
-        if intersection_poly.is_empty:
-            return None
         return mapping(intersection_poly)
     except Exception:
         return None
 
 
+def golden_land_components(
+    model: Dict[str, Any],
+    closeness: np.ndarray,
+    pair_betweenness: np.ndarray,
+) -> Dict[str, List[Any]]:
+    """
+    Per-node inputs of the golden-land score, stored with the analysis result
+    so the weights can be changed live without recomputing centrality.
+
+    - closeness_norm    : closeness / max
+    - degree_norm       : number of neighbouring nodes (CSR row length) / max
+    - low_traffic_bonus : 1 − mean normalized betweenness of the incident road pairs
+
+    Lists (JSON-safe — the result is exported with the config), indexed like
+    ``model["node_ids"]``.
+    """
+    csr = model["csr"]
+    n = csr["n"]
+    degree = np.diff(csr["indptr"])
+    max_degree = max(int(degree.max()), 1) if n else 1
+    max_close = float(closeness.max()) if n else 0.0
+    max_bet = float(pair_betweenness.max()) if len(pair_betweenness) else 0.0
+
+    # Mean incident betweenness: one bincount over the CSR entries (each neighbour once)
+    rows = np.repeat(np.arange(n), degree)
+    bet_sum = np.bincount(rows, pair_betweenness[csr["entry_pair"]] / (max_bet or 1.0), minlength=n)
+    mean_bet = np.divide(bet_sum, degree, out=np.zeros(n), where=degree > 0)
+
+    node_ids = model["node_ids"]
+    return {
+        "node_id": [int(node) if isinstance(node, int) else str(node) for node in node_ids],
+        "lat": model["y"].tolist(),
+        "lon": model["x"].tolist(),
+        "closeness_norm": (closeness / (max_close or 1.0)).tolist(),
+        "degree_norm": (degree / max_degree).tolist(),
+        "low_traffic_bonus": (1.0 - mean_bet).tolist(),
+    }
+
+
 def compute_golden_land_opportunities(
-    graph: nx.MultiDiGraph,
-    closeness_cent: Dict[Any, float],
-    edge_betweenness_cent: Dict[Tuple[Any, Any], float],
+    components: Dict[str, List[Any]],
+    weights: Optional[Dict[str, float]] = None,
     top_n: int = 10,
 ) -> List[Dict[str, Any]]:
     """
@@ -627,67 +922,66 @@ def compute_golden_land_opportunities(
 
     Principle / Equation:
     score = 0.50*closeness_norm + 0.30*degree_norm + 0.20*(1-edge_betweenness_norm)
+
+    ``components`` comes from :func:`golden_land_components`; ``weights``
+    defaults to ``NETWORK_CONFIG["golden_land_weights"]``.  Only the top-N is
+    sorted (argpartition) — ties keep node order, same as a full stable sort.
     """
-    if not closeness_cent:
+    if not components or not components["node_id"] or top_n <= 0:
         return []
+    weights = weights or NETWORK_CONFIG["golden_land_weights"]
+
+    close_norm = np.asarray(components["closeness_norm"])
+    degree_norm = np.asarray(components["degree_norm"])
+    low_traffic_bonus = np.asarray(components["low_traffic_bonus"])
+    score = (
+        weights["closeness"] * close_norm
+        + weights["degree"] * degree_norm
+        + weights["low_traffic_bonus"] * low_traffic_bonus
+    )
 
-    weights = NETWORK_CONFIG["golden_land_weights"]
-    max_close = max(closeness_cent.values()) or 1.0
-
-    degree_dict = dict(graph.degree())
-    max_degree = max(degree_dict.values()) if degree_dict else 1
-    if max_degree <= 0:
-        max_degree = 1
-
-    max_bet = max(edge_betweenness_cent.values()) if edge_betweenness_cent else 1.0
-    if max_bet <= 0:
-        max_bet = 1.0
-
-    # Precompute mean adjacent edge-betweenness per node once.
-    # This avoids repeated ``graph.edges(node)`` scans for every node.
-    node_edge_score_sum: Dict[Any, float] = {}
-    node_edge_count: Dict[Any, int] = {}
-    for u, v in graph.edges():
-        bet_norm = edge_betweenness_cent.get(tuple(sorted((u, v))), 0.0) / max_bet
-
-        node_edge_score_sum[u] = node_edge_score_sum.get(u, 0.0) + bet_norm
-        node_edge_count[u] = node_edge_count.get(u, 0) + 1
-
-        if u != v:
-            node_edge_score_sum[v] = node_edge_score_sum.get(v, 0.0) + bet_norm
-            node_edge_count[v] = node_edge_count.get(v, 0) + 1
-
-    ranked: List[Dict[str, Any]] = []
-    for node, data in graph.nodes(data=True):
-        close_norm = closeness_cent.get(node, 0.0) / max_close
-        degree_norm = degree_dict.get(node, 0) / max_degree
+    n = len(score)
+    if top_n < n:
+        cutoff = score[np.argpartition(-score, top_n - 1)[:top_n]].min()
+        candidates = np.flatnonzero(score >= cutoff)  # รวมค่าที่เสมอกันที่ขอบ
+    else:
+        candidates = np.arange(n)
+    best = candidates[np.lexsort((candidates, -score[candidates]))][:top_n]
+
+    return [
+        {
+            "node_id": components["node_id"][i],
+            "lat": components["lat"][i],
+            "lon": components["lon"][i],
+            "score": float(score[i]),
+            "closeness_norm": float(close_norm[i]),
+            "degree_norm": float(degree_norm[i]),
+            "low_traffic_bonus": float(low_traffic_bonus[i]),
+        }
+        for i in best.tolist()
+    ]
 
-        edge_count = node_edge_count.get(node, 0)
-        if edge_count > 0:
-            edge_bet_norm = node_edge_score_sum[node] / edge_count
-        else:
-            edge_bet_norm = 0.0
 
-        low_traffic_bonus = 1.0 - edge_bet_norm
-        score = (
-            weights["closeness"] * close_norm
-            + weights["degree"] * degree_norm
-            + weights["low_traffic_bonus"] * low_traffic_bonus
-        )
-        ranked.append(
+def build_golden_spots_geojson(golden_spots: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """Golden spots → FeatureCollection ของหมุดอันดับบนแผนที่."""
+    return {
+        "type": "FeatureCollection",
+        "features": [
             {
-                "node_id": int(node) if isinstance(node, int) else str(node),
-                "lat": data["y"],
-                "lon": data["x"],
-                "score": score,
-                "closeness_norm": close_norm,
-                "degree_norm": degree_norm,
-                "low_traffic_bonus": low_traffic_bonus,
+                "type": "Feature",
+                "geometry": {
+                    "type": "Point",
+                    "coordinates": [spot["lon"], spot["lat"]],
+                },
+                "properties": {
+                    "type": "golden_spot",
+                    "rank": idx,
+                    "score": round(spot["score"], 4),
+                },
             }
-        )
-
-    ranked.sort(key=lambda x: x["score"], reverse=True)
-    return ranked[:top_n]
+            for idx, spot in enumerate(golden_spots, start=1)
+        ],
+    }
 
 
 def approx_geom_area_km2(geojson_geom: Dict[str, Any]) -> Optional[float]:
@@ -711,6 +1005,42 @@ def haversine_km(lat1: float, lon1: float, lat2: float, lon2: float) -> float:
     return calculate_distance_meters(lat1, lon1, lat2, lon2) / 1000.0
 
 
+def haversine_km_array(lat0: float, lon0: float, lats: Any, lons: Any) -> np.ndarray:
+    """Haversine distance (km) จากจุดยึดเดียวไปยังหลายจุดในการเรียกครั้งเดียว.
+
+    สูตร ค่าคงที่ และลำดับการคำนวณเดียวกับ :func:`calculate_distance_meters`
+    → ผลตรงกับ :func:`haversine_km` ทีละจุด. ``lats``/``lons`` เป็น array-like
+    ขนาดเท่ากัน คืน ``np.ndarray`` float64
+    """
+    R = 6371000.0
+    lat0_rad, lon0_rad = radians(lat0), radians(lon0)
+    lat_rad = np.radians(np.asarray(lats, dtype=float))
+    lon_rad = np.radians(np.asarray(lons, dtype=float))
+    dlat = lat_rad - lat0_rad
+    dlon = lon_rad - lon0_rad
+    a = np.sin(dlat / 2) ** 2 + cos(lat0_rad) * np.cos(lat_rad) * np.sin(dlon / 2) ** 2
+    c = 2 * np.arctan2(np.sqrt(a), np.sqrt(1 - a))
+    return R * c / 1000.0
+
+
+def _point_feature_coords(
+    features: List[Dict[str, Any]],
+) -> Tuple[List[Dict[str, Any]], np.ndarray, np.ndarray]:
+    """แยกพิกัด Point features เป็น ``(features ที่ใช้ได้, lons, lats)`` — ข้าม feature ที่พิกัดผิดรูป."""
+    kept: List[Dict[str, Any]] = []
+    lons: List[float] = []
+    lats: List[float] = []
+    for f in features:
+        try:
+            lon, lat = f["geometry"]["coordinates"]
+        except (KeyError, ValueError, TypeError):
+            continue
+        kept.append(f)
+        lons.append(lon)
+        lats.append(lat)
+    return kept, np.asarray(lons, dtype=float), np.asarray(lats, dtype=float)
+
+
 def predict_rent(distance_km: float, r0: float, lam: float) -> float:
     """Bid-rent prediction: R(d) = R₀ · e^(−λ·d)."""
     return r0 * exp(-lam * distance_km)
@@ -723,6 +1053,12 @@ def rent_color_for_norm(norm: float) -> str:
     return RENT_RAMP[idx]
 
 
+def rent_colors_for_norms(norms: np.ndarray) -> List[str]:
+    """ฉบับ array ของ :func:`rent_color_for_norm` (ปัดเศษ half-to-even แบบเดียวกับ ``round``)."""
+    idx = np.rint(np.clip(norms, 0.0, 1.0) * (len(RENT_RAMP) - 1)).astype(np.intp)
+    return [RENT_RAMP[i] for i in idx.tolist()]
+
+
 def fit_rent_gradient_from_samples(
     samples: List[Dict[str, Any]],
     anchor_lat: float,
@@ -736,7 +1072,9 @@ def fit_rent_gradient_from_samples(
     Returns ``{r0, lam, r2, n_samples, points}`` หรือ ``None``
     เมื่อข้อมูลไม่พอ (ต้องมี ≥ 2 จุดที่ระยะต่างกัน และราคา > 0).
     """
-    pts: List[Tuple[float, float]] = []  # (distance_km, ln_rent)
+    lats: List[float] = []
+    lons: List[float] = []
+    rents: List[float] = []
     for s in samples:
         try:
             lat = float(s["lat"])
@@ -746,12 +1084,17 @@ def fit_rent_gradient_from_samples(
             continue
         if rent <= 0:
             continue
-        d = haversine_km(anchor_lat, anchor_lon, lat, lon)
-        pts.append((d, log(rent)))
+        lats.append(lat)
+        lons.append(lon)
+        rents.append(rent)
 
-    if len(pts) < 2:
+    if len(rents) < 2:
         return None
 
+    # ระยะทั้งหมดใน call เดียว; OLS บนตัวอย่าง (จำนวนน้อย) คงเป็นผลรวมตามลำดับแบบเดิม
+    xs = haversine_km_array(anchor_lat, anchor_lon, lats, lons).tolist()
+    pts: List[Tuple[float, float]] = [(d, log(rent)) for d, rent in zip(xs, rents)]  # (distance_km, ln_rent)
+
     n = len(pts)
     mean_x = sum(p[0] for p in pts) / n
     mean_y = sum(p[1] for p in pts) / n
@@ -783,6 +1126,7 @@ def resolve_cbd_anchor(
     network_data: Optional[Dict[str, Any]],
     isochrone_data: Optional[Dict[str, Any]],
     markers: List[Dict[str, Any]],
+    iso_geoms: Optional[Dict[str, Any]] = None,
 ) -> Optional[Dict[str, Any]]:
     """
     หาจุดยึด CBD สำหรับ Rent Gradient ตามลำดับความน่าเชื่อถือ:
@@ -813,7 +1157,7 @@ def resolve_cbd_anchor(
     try:
         feats = (isochrone_data or {}).get("features") or []
         if feats:
-            combined = unary_union([shape(f["geometry"]) for f in feats])
+            combined = isochrone_union(iso_geoms or build_isochrone_geometries(feats))
             c = combined.centroid
             return {"lat": c.y, "lon": c.x, "source": "จุดกึ่งกลาง Travel Areas"}
     except Exception:
@@ -833,18 +1177,21 @@ def isochrone_max_distance_km(
     anchor_lat: float,
     anchor_lon: float,
     isochrone_data: Optional[Dict[str, Any]],
+    iso_geoms: Optional[Dict[str, Any]] = None,
 ) -> float:
     """ระยะไกลสุดจากจุดยึดถึงขอบ Travel Areas (ใช้มุม bounding box ของแต่ละ feature)."""
     d_max = 0.0
-    feats = (isochrone_data or {}).get("features") or []
-    for f in feats:
-        try:
-            minx, miny, maxx, maxy = shape(f["geometry"]).bounds
-        except Exception:
-            continue
-        for lon, lat in ((minx, miny), (minx, maxy), (maxx, miny), (maxx, maxy)):
-            d = haversine_km(anchor_lat, anchor_lon, lat, lon)
-            d_max = max(d_max, d)
+    if iso_geoms is None:
+        iso_geoms = build_isochrone_geometries((isochrone_data or {}).get("features") or [])
+    bounds = np.asarray(iso_geoms["bounds"], dtype=float).reshape(-1, 4)
+    if len(bounds):
+        # มุมทั้ง 4 ของทุก bbox: (minx,miny) (minx,maxy) (maxx,miny) (maxx,maxy)
+        corner_lons = bounds[:, [0, 0, 2, 2]].ravel()
+        corner_lats = bounds[:, [1, 3, 1, 3]].ravel()
+        d = haversine_km_array(anchor_lat, anchor_lon, corner_lats, corner_lons)
+        d = d[np.isfinite(d)]  # bbox ของ geometry ว่างเป็น NaN
+        if d.size:
+            d_max = max(d_max, float(d.max()))
     if d_max <= 0:
         d_max = RENT_CONFIG["default_d_max_km"]
     return max(d_max, RENT_CONFIG["min_d_max_km"])
@@ -933,41 +1280,40 @@ def build_rent_nodes_geojson(
     r_lo, r_hi = min(r_at_0, r_at_max), max(r_at_0, r_at_max)
     r_span = (r_hi - r_lo) or 1.0
 
-    out_features: List[Dict[str, Any]] = []
-    for f in feats:
-        try:
-            lon, lat = f["geometry"]["coordinates"]
-        except (KeyError, ValueError, TypeError):
-            continue
-        rent = predict_rent(haversine_km(anchor_lat, anchor_lon, lat, lon), r0, lam)
-        norm = (rent - r_lo) / r_span
-        out_features.append(
-            {
-                "type": "Feature",
-                "geometry": {"type": "Point", "coordinates": [lon, lat]},
-                "properties": {
-                    "type": "rent_node",
-                    "rent": round(rent, 2),
-                    "color": rent_color_for_norm(norm),
-                },
-            }
-        )
+    _kept, lons, lats = _point_feature_coords(feats)
+    rents = r0 * np.exp(-lam * haversine_km_array(anchor_lat, anchor_lon, lats, lons))
+    node_colors = rent_colors_for_norms((rents - r_lo) / r_span)
+
+    out_features: List[Dict[str, Any]] = [
+        {
+            "type": "Feature",
+            "geometry": {"type": "Point", "coordinates": [lon, lat]},
+            "properties": {
+                "type": "rent_node",
+                "rent": round(rent, 2),
+                "color": color,
+            },
+        }
+        for lon, lat, rent, color in zip(lons.tolist(), lats.tolist(), rents.tolist(), node_colors)
+    ]
     return {"type": "FeatureCollection", "features": out_features}
 
 
 # ------------------------------------------------- Ring Report (สรุปรายวงแหวน)
 
-def _ring_index_for_distance(
-    d_km: float, step_km: float, n_rings: int
-) -> Optional[int]:
-    """คืน index วงแหวน (0-based) ของระยะ d_km — ``None`` เมื่ออยู่นอกวงนอกสุด."""
-    if step_km <= 0 or d_km < 0:
-        return None
-    idx = int(d_km / step_km)
-    if idx >= n_rings:
-        # จุดที่อยู่บนขอบนอกสุดพอดีนับเป็นวงสุดท้าย
-        return n_rings - 1 if d_km <= step_km * n_rings + 1e-9 else None
-    return idx
+def _ring_indices_for_distances(
+    d_km: np.ndarray, step_km: float, n_rings: int
+) -> np.ndarray:
+    """คืน index วงแหวน (0-based) ของทุกระยะใน d_km — ``-1`` เมื่ออยู่นอกวงนอกสุด."""
+    d_km = np.asarray(d_km, dtype=float)
+    if step_km <= 0:
+        return np.full(d_km.shape, -1, dtype=np.intp)
+    q = d_km / step_km
+    # จุดที่อยู่บนขอบนอกสุดพอดีนับเป็นวงสุดท้าย
+    on_edge = d_km <= step_km * n_rings + 1e-9
+    idx = np.where(q < n_rings, np.floor(q), np.where(on_edge, n_rings - 1, -1))
+    idx[~(d_km >= 0)] = -1
+    return idx.astype(np.intp)
 
 
 def count_nodes_per_ring(
@@ -987,15 +1333,12 @@ def count_nodes_per_ring(
     counts: List[int] = [0] * n_rings
     closeness_per_ring: List[List[float]] = [[] for _ in range(n_rings)]
     outside = 0
-    for f in ((nodes_geojson or {}).get("features") or []):
-        try:
-            lon, lat = f["geometry"]["coordinates"]
-        except (KeyError, ValueError, TypeError):
-            continue
-        idx = _ring_index_for_distance(
-            haversine_km(anchor_lat, anchor_lon, lat, lon), step_km, n_rings
-        )
-        if idx is None:
+    kept, lons, lats = _point_feature_coords((nodes_geojson or {}).get("features") or [])
+    ring_idx = _ring_indices_for_distances(
+        haversine_km_array(anchor_lat, anchor_lon, lats, lons), step_km, n_rings
+    )
+    for f, idx in zip(kept, ring_idx.tolist()):
+        if idx < 0:
             outside += 1
             continue
         counts[idx] += 1
@@ -1042,26 +1385,37 @@ def build_ring_report(
 
     golden_per_ring: List[List[int]] = [[] for _ in range(n_rings)]
     golden_spots = (network_data or {}).get("golden_spots") or []
-    for rank, spot in enumerate(golden_spots, start=1):
-        idx = _ring_index_for_distance(
-            haversine_km(anchor["lat"], anchor["lon"], spot["lat"], spot["lon"]),
-            step,
-            n_rings,
-        )
-        if idx is not None:
+    golden_idx = _ring_indices_for_distances(
+        haversine_km_array(
+            anchor["lat"],
+            anchor["lon"],
+            [spot["lat"] for spot in golden_spots],
+            [spot["lon"] for spot in golden_spots],
+        ),
+        step,
+        n_rings,
+    )
+    for rank, idx in enumerate(golden_idx.tolist(), start=1):
+        if idx >= 0:
             golden_per_ring[idx].append(rank)
 
-    samples_per_ring: List[int] = [0] * n_rings
+    sample_lats: List[float] = []
+    sample_lons: List[float] = []
     for s in samples or []:
         try:
-            d = haversine_km(
-                anchor["lat"], anchor["lon"], float(s["lat"]), float(s["lon"])
-            )
+            lat, lon = float(s["lat"]), float(s["lon"])
         except (KeyError, TypeError, ValueError):
             continue
-        idx = _ring_index_for_distance(d, step, n_rings)
-        if idx is not None:
-            samples_per_ring[idx] += 1
+        sample_lats.append(lat)
+        sample_lons.append(lon)
+    sample_idx = _ring_indices_for_distances(
+        haversine_km_array(anchor["lat"], anchor["lon"], sample_lats, sample_lons),
+        step,
+        n_rings,
+    )
+    samples_per_ring: List[int] = np.bincount(
+        sample_idx[sample_idx >= 0], minlength=n_rings
+    ).tolist()
 
     rows: List[Dict[str, Any]] = []
     for i, feat in enumerate(ring_feats):
@@ -1129,16 +1483,20 @@ def compute_rent_gradient_data(
     markers: List[Dict[str, Any]],
     samples: List[Dict[str, Any]],
     unit_label: str,
+    iso_geoms: Optional[Dict[str, Any]] = None,
 ) -> Dict[str, Any]:
     """
     คำนวณ Rent Gradient ทั้งชุด (pure, JSON-serializable):
     anchor → fit/default model → rings + curve + rent heat.
+    ``iso_geoms``: ผลของ :func:`build_isochrone_geometries` (ไม่ต้อง parse ซ้ำ)
     """
-    anchor = resolve_cbd_anchor(intersection_data, network_data, isochrone_data, markers)
+    if iso_geoms is None:
+        iso_geoms = build_isochrone_geometries((isochrone_data or {}).get("features") or [])
+    anchor = resolve_cbd_anchor(intersection_data, network_data, isochrone_data, markers, iso_geoms)
     if anchor is None:
         return {"error": "ไม่พบจุดยึด CBD — กรุณาปักหมุดและคำนวณ Isochrone ก่อน"}
 
-    d_max = isochrone_max_distance_km(anchor["lat"], anchor["lon"], isochrone_data)
+    d_max = isochrone_max_distance_km(anchor["lat"], anchor["lon"], isochrone_data, iso_geoms)
 
     fit = fit_rent_gradient_from_samples(samples, anchor["lat"], anchor["lon"])
     if fit is not None:
@@ -1215,16 +1573,30 @@ def format_rent_value(value: float, model: Dict[str, Any]) -> str:
 
 
 # ------------------------------------------------------------------ API calls
+def _retry_after_seconds(response: requests.Response, attempt: int) -> float:
+    """Backoff for a 429: honour a numeric ``Retry-After``, else exponential."""
+    retry_after = response.headers.get("Retry-After", "")
+    if retry_after.strip().isdigit():
+        delay = float(retry_after)
+    else:
+        delay = ISOCHRONE_FETCH_CONFIG["backoff_base_seconds"] * (2 ** attempt)
+    return min(delay, ISOCHRONE_FETCH_CONFIG["backoff_max_seconds"])
+
+
 def safe_fetch_isochrone(
     api_key: str,
     travel_mode: str,
     ranges_str: str,
     marker_lat: float,
     marker_lon: float,
+    session: Optional[requests.Session] = None,
 ) -> Tuple[Optional[List[Dict[str, Any]]], Optional[str]]:
     """
     Fetch isochrone data from Geoapify with full error handling.
 
+    ``429 Too Many Requests`` is retried with backoff (``Retry-After`` or
+    exponential) up to ``ISOCHRONE_FETCH_CONFIG["max_retries_429"]`` times.
+
     Returns:
         ``(features_list, None)`` on success,
         ``(None, error_message)`` on failure.
@@ -1238,9 +1610,15 @@ def safe_fetch_isochrone(
         "range": ranges_str,
         "apiKey": api_key,
     }
+    http = session or requests
 
     try:
-        response = requests.get(url, params=params, timeout=TIMEOUT_API)
+        for attempt in range(ISOCHRONE_FETCH_CONFIG["max_retries_429"] + 1):
+            response = http.get(url, params=params, timeout=TIMEOUT_API)
+            if response.status_code != 429:
+                break
+            if attempt < ISOCHRONE_FETCH_CONFIG["max_retries_429"]:
+                time.sleep(_retry_after_seconds(response, attempt))
 
         if response.status_code == 200:
             data = response.json()
@@ -1269,6 +1647,35 @@ def safe_fetch_isochrone(
         return None, f"Unexpected Error: {str(e)}"
 
 
+def fetch_isochrones_parallel(
+    api_key: str,
+    travel_mode: str,
+    ranges_str: str,
+    points: List[Tuple[float, float]],
+    session: Optional[requests.Session] = None,
+    max_workers: int = ISOCHRONE_FETCH_CONFIG["max_workers"],
+) -> List[Dict[str, Any]]:
+    """
+    Fetch isochrones for many ``(lat, lon)`` points on a bounded thread pool.
+
+    Results come back in the **same order as** ``points`` (so callers can
+    keep ``active_index`` semantics) as dicts:
+    ``{"features", "error", "latency_s"}``.
+    """
+    def _fetch_one(point: Tuple[float, float]) -> Dict[str, Any]:
+        t0 = time.perf_counter()
+        features, error = safe_fetch_isochrone(
+            api_key, travel_mode, ranges_str, point[0], point[1], session=session
+        )
+        return {"features": features, "error": error,
+                "latency_s": time.perf_counter() - t0}
+
+    if not points:
+        return []
+    with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(points)))) as pool:
+        return list(pool.map(_fetch_one, points))
+
+
 # -------------------------------------------------------------- Disk caching
 def get_cache_key(polygon_wkt_str: str, network_type: str) -> str:
     """Generate a stable cache key from polygon bounds + network type."""
@@ -1279,41 +1686,730 @@ def get_cache_key(polygon_wkt_str: str, network_type: str) -> str:
     return hashlib.md5(key_str.encode()).hexdigest()
 
 
-def load_graph_from_cache(cache_key: str) -> Optional[nx.MultiDiGraph]:
-    """Load a cached OSM graph from disk."""
-    cache_file = CACHE_DIR / f"osm_graph_{cache_key}.pkl"
-    if cache_file.exists():
+def _graph_entry_dir(cache_key: str) -> Path:
+    return CACHE_DIR / f"osm_graph_{cache_key}"
+
+
+def is_graph_cached(cache_key: str) -> bool:
+    """ตอบ "มีใน cache ไหม" ด้วย stat ของ manifest (ไม่โหลดกราฟ) — ``.pkl`` รุ่นเก่านับด้วย."""
+    return (_graph_entry_dir(cache_key) / "meta.json").exists() or (
+        CACHE_DIR / f"osm_graph_{cache_key}.pkl"
+    ).exists()
+
+
+def _dir_size(path: Path) -> int:
+    return sum(f.stat().st_size for f in path.iterdir() if f.is_file())
+
+
+def _index_row(meta: Dict[str, Any], size_bytes: int, last_access: float) -> Dict[str, Any]:
+    return {
+        "bytes": size_bytes,
+        "last_access": last_access,
+        "network_type": meta.get("network_type"),
+        "bounds": meta.get("bounds"),
+        "nodes": meta.get("nodes"),
+        "edges": meta.get("edges"),
+        "build_seconds": meta.get("build_seconds"),
+        "created_at": meta.get("created_at"),
+        "coverage_bounds": meta.get("coverage_bounds"),
+        "kind": meta.get("kind", "graph"),
+    }
+
+
+def _save_graph_index(entries: Dict[str, Dict[str, Any]]) -> None:
+    tmp_file = GRAPH_INDEX_FILE.with_suffix(f".{os.getpid()}.{threading.get_ident()}.tmp")
+    try:
+        tmp_file.write_text(json.dumps({"entries": entries}), encoding="utf-8")
+        os.replace(tmp_file, GRAPH_INDEX_FILE)
+    except OSError:
+        pass  # Caching is best-effort
+
+
+@contextmanager
+def _graph_index_lock(stale_s: float = 30.0):
+    """
+    ล็อกรอบ read-modify-write ของ index — กันทั้ง thread ของ Streamlit และ worker process
+    (Network Analysis) เขียนทับกันจน last access / การลบของอีกฝ่ายหาย. ไม่ re-entrant.
+    ไม่มี fcntl → สร้างไฟล์ lock ด้วย O_EXCL (ค้างเกิน ``stale_s`` ถือว่าเจ้าของ crash แล้ว)
+    """
+    if fcntl is not None:
+        with open(GRAPH_INDEX_LOCK_FILE, "a") as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+        return
+    while True:
         try:
-            with open(cache_file, "rb") as f:
-                return pickle.load(f)
-        except Exception:
+            os.close(os.open(GRAPH_INDEX_LOCK_FILE, os.O_CREAT | os.O_EXCL | os.O_WRONLY))
+            break
+        except FileExistsError:
+            try:
+                if time.time() - GRAPH_INDEX_LOCK_FILE.stat().st_mtime > stale_s:
+                    GRAPH_INDEX_LOCK_FILE.unlink()
+            except OSError:
+                pass
+            time.sleep(0.01)
+    try:
+        yield
+    finally:
+        try:
+            GRAPH_INDEX_LOCK_FILE.unlink()
+        except OSError:
+            pass
+
+
+def _read_graph_index() -> Optional[Dict[str, Dict[str, Any]]]:
+    try:
+        entries = json.loads(GRAPH_INDEX_FILE.read_text(encoding="utf-8"))["entries"]
+        return entries if isinstance(entries, dict) else None
+    except (OSError, ValueError, KeyError, TypeError):
+        return None
+
+
+def rebuild_graph_index() -> Dict[str, Dict[str, Any]]:
+    """
+    สร้าง index ใหม่จาก manifest บนดิสก์ — last access เดิมใน index ถูกเก็บไว้,
+    entry ที่ไม่เคยอยู่ใน index ใช้ mtime ของ ``meta.json``.
+    """
+    with _graph_index_lock():
+        return _rebuild_graph_index_locked()
+
+
+def _rebuild_graph_index_locked() -> Dict[str, Dict[str, Any]]:
+    """:func:`rebuild_graph_index` สำหรับผู้ที่ถือ :func:`_graph_index_lock` อยู่แล้ว."""
+    previous = _read_graph_index() or {}
+    entries: Dict[str, Dict[str, Any]] = {}
+    for meta_file in CACHE_DIR.glob("osm_graph_*/meta.json"):
+        cache_key = meta_file.parent.name[len("osm_graph_"):]
+        try:
+            meta = json.loads(meta_file.read_text(encoding="utf-8"))
+            last_access = previous.get(cache_key, {}).get("last_access") or meta_file.stat().st_mtime
+            entries[cache_key] = _index_row(meta, _dir_size(meta_file.parent), last_access)
+        except (OSError, ValueError):
+            continue
+    _save_graph_index(entries)
+    return entries
+
+
+def load_graph_index() -> Dict[str, Dict[str, Any]]:
+    """
+    ``{cache_key: {bytes, last_access, network_type, bounds, nodes, edges, build_seconds}}``
+    — ยังไม่มี index (ครั้งแรกหลังอัปเกรด) → migrate ``.pkl`` รุ่นเก่าแล้วสร้างจากดิสก์.
+    """
+    entries = _read_graph_index()
+    if entries is not None:
+        return entries
+    migrate_legacy_graph_cache()
+    return rebuild_graph_index()
+
+
+def _record_graph_entry(cache_key: str) -> None:
+    """อัปเดตแถวของ entry ที่เพิ่งเขียน/นำเข้าใน index (last access = ตอนนี้)."""
+    entry = _graph_entry_dir(cache_key)
+    with _graph_index_lock():
+        # อ่าน manifest ใต้ lock — entry ที่ถูก evict ไประหว่างนี้จะไม่กลับเข้า index
+        try:
+            meta = json.loads((entry / "meta.json").read_text(encoding="utf-8"))
+            row = _index_row(meta, _dir_size(entry), time.time())
+        except (OSError, ValueError):
+            return
+        entries = _read_graph_index()
+        if entries is None:
+            _rebuild_graph_index_locked()  # entry นี้อยู่บนดิสก์แล้ว จึงถูกรวมเข้าไปด้วย
+            return
+        entries[cache_key] = row
+        _save_graph_index(entries)
+
+
+def touch_graph_entry(cache_key: str) -> None:
+    """บันทึกเวลาใช้ล่าสุด (LRU) — เขียน index ไม่เกินหนึ่งครั้งต่อ ``touch_interval_s``."""
+    row = load_graph_index().get(cache_key)
+    now = time.time()
+    if row is None:
+        _record_graph_entry(cache_key)
+        return
+    if now - row.get("last_access", 0) < GRAPH_CACHE_CONFIG["touch_interval_s"]:
+        return
+    with _graph_index_lock():
+        entries = _read_graph_index()
+        row = None if entries is None else entries.get(cache_key)
+        if row is None:
+            return  # index หาย / entry ถูก evict ไปแล้ว — ไม่ชุบแถวที่ลบไปแล้วกลับมา
+        row["last_access"] = max(now, row.get("last_access", 0))
+        _save_graph_index(entries)
+
+
+def _remove_graph_entry(cache_key: str) -> bool:
+    """ย้าย entry ออกจากชื่อจริงก่อน (ผู้อ่านจะเห็นเป็น miss ทันที) แล้วค่อยลบไฟล์."""
+    entry = _graph_entry_dir(cache_key)
+    trash = CACHE_DIR / f".osm_graph_{cache_key}.{os.getpid()}.{threading.get_ident()}.stale"
+    try:
+        os.replace(entry, trash)
+    except OSError:
+        return not entry.exists()
+    shutil.rmtree(trash, ignore_errors=True)
+    return True
+
+
+def evict_graph_cache(
+    max_bytes: Optional[int] = None, keep: Tuple[str, ...] = ()
+) -> int:
+    """ลบกราฟที่ใช้ล่าสุดนานที่สุดก่อนจนขนาดรวมไม่เกิน ``max_bytes`` (ค่า default ตาม config)."""
+    budget = GRAPH_CACHE_CONFIG["max_bytes"] if max_bytes is None else max_bytes
+    for leftover in CACHE_DIR.glob(".osm_graph_*"):  # โฟลเดอร์ชั่วคราวของการเขียนที่ crash ไป
+        try:
+            if time.time() - leftover.stat().st_mtime > 3600:
+                shutil.rmtree(leftover, ignore_errors=True)
+        except OSError:
+            pass
+    with _graph_index_lock():
+        # index ถูกอัปเดตทุกครั้งที่เขียน / นำเข้า entry — สแกนดิสก์ใหม่เฉพาะเมื่อ index หายหรือเสีย
+        entries = _read_graph_index()
+        if entries is None:
+            entries = _rebuild_graph_index_locked()
+        total = sum(row["bytes"] for row in entries.values())
+        removed = 0
+        for cache_key, row in sorted(entries.items(), key=lambda kv: kv[1]["last_access"]):
+            if total <= budget:
+                break
+            if cache_key in keep or not _remove_graph_entry(cache_key):
+                continue
+            total -= row["bytes"]
+            del entries[cache_key]
+            removed += 1
+        if removed:
+            _save_graph_index(entries)
+    return removed
+
+
+def _infer_network_type(highways: Any) -> str:
+    """เดา network type ของกราฟเก่าที่ไม่มี sidecar จากค่า highway=* ของ edge."""
+    found = set()
+    for hw in highways:
+        found.update(hw if isinstance(hw, list) else [hw])
+    if found & {"footway", "steps", "pedestrian"}:
+        return "walk"
+    if found & {"cycleway", "path"}:
+        return "bike"
+    return "drive"
+
+
+def _encode_attribute(values: Dict[int, Any], size: int) -> Tuple[np.ndarray, List[str]]:
+    """Attribute ของ node/edge → (codes int32, vocabulary เป็น JSON) — ไม่มีค่า = -1."""
+    codes = np.full(size, -1, dtype=np.int32)
+    vocab: Dict[str, int] = {}
+    for i, value in values.items():
+        text = json.dumps(value, default=str, sort_keys=True)
+        codes[i] = vocab.setdefault(text, len(vocab))
+    return codes, list(vocab)
+
+
+def graph_to_columns(
+    graph: nx.MultiDiGraph, cache_key: str, network_type: Optional[str] = None
+) -> Dict[str, Any]:
+    """
+    Convert an OSMnx graph to the columnar cache layout.
+
+    Node ``id/x/y`` arrays, CSR edges (``indptr`` by source node, ``v``,
+    ``key``, ``length``), WKB edge geometries concatenated in ``geom`` with
+    ``geom_offsets``, and every other attribute as dictionary-encoded codes.
+    """
+    n = graph.number_of_nodes()
+    node_id = np.fromiter(graph.nodes, dtype=np.int64, count=n)
+    index = {node: i for i, node in enumerate(node_id.tolist())}
+    x = np.full(n, np.nan)
+    y = np.full(n, np.nan)
+    node_values: Dict[str, Dict[int, Any]] = {}
+    for i, (_node, data) in enumerate(graph.nodes(data=True)):
+        for name, value in data.items():
+            if name == "x":
+                x[i] = value
+            elif name == "y":
+                y[i] = value
+            else:
+                node_values.setdefault(name, {})[i] = value
+
+    m = graph.number_of_edges()
+    u = np.empty(m, dtype=np.int64)
+    v = np.empty(m, dtype=np.int64)
+    key = np.empty(m, dtype=np.int64)
+    length = np.full(m, np.nan)
+    geoms = np.full(m, None, dtype=object)
+    edge_values: Dict[str, Dict[int, Any]] = {}
+    for e, (a, b, k, data) in enumerate(graph.edges(keys=True, data=True)):
+        u[e], v[e], key[e] = index[a], index[b], k
+        for name, value in data.items():
+            if name == "length":
+                length[e] = value
+            elif name == "geometry":
+                geoms[e] = value
+            else:
+                edge_values.setdefault(name, {})[e] = value
+
+    # CSR: เรียง edge ตามโหนดต้นทาง (stable → ลำดับ adjacency เดิม)
+    order = np.argsort(u, kind="stable")
+    wkb = shapely.to_wkb(geoms[order])
+    sizes = np.fromiter((len(b) if b is not None else 0 for b in wkb), dtype=np.int64, count=m)
+    edge_attrs: Dict[str, np.ndarray] = {}
+    edge_vocab: Dict[str, List[str]] = {}
+    for name, values in edge_values.items():
+        codes, edge_vocab[name] = _encode_attribute(values, m)
+        edge_attrs[name] = codes[order]
+    node_attrs: Dict[str, np.ndarray] = {}
+    node_vocab: Dict[str, List[str]] = {}
+    for name, values in node_values.items():
+        node_attrs[name], node_vocab[name] = _encode_attribute(values, n)
+
+    highways = [json.loads(s) for s in edge_vocab.get("highway", [])]
+    valid = ~(np.isnan(x) | np.isnan(y))
+    return {
+        "node_id": node_id,
+        "x": x,
+        "y": y,
+        "indptr": np.r_[0, np.cumsum(np.bincount(u, minlength=n))].astype(np.int64),
+        "v": v[order],
+        "key": key[order],
+        "length": length[order],
+        "geom_offsets": np.r_[0, np.cumsum(sizes)].astype(np.int64),
+        "geom": np.frombuffer(b"".join(b for b in wkb if b is not None), dtype=np.uint8),
+        "node_attrs": node_attrs,
+        "edge_attrs": edge_attrs,
+        "vocab": {"node": node_vocab, "edge": edge_vocab},
+        "graph_attrs": json.loads(json.dumps(graph.graph, default=str)),
+        "meta": {
+            "format": GRAPH_CACHE_FORMAT,
+            "cache_key": cache_key,
+            "network_type": network_type or _infer_network_type(highways),
+            "network_type_inferred": network_type is None,
+            "bounds": (
+                [float(x[valid].min()), float(y[valid].min()),
+                 float(x[valid].max()), float(y[valid].max())]
+                if valid.any() else None
+            ),
+            "nodes": n,
+            "edges": m,
+        },
+    }
+
+
+def _write_graph_entry(cols: Dict[str, Any]) -> None:
+    """
+    เขียน entry ลงโฟลเดอร์ชั่วคราวแล้ว rename ทั้งโฟลเดอร์ — ``meta.json`` (manifest)
+    เขียนเป็นไฟล์สุดท้าย จึงไม่มีทางเห็น entry ที่เขียนค้างครึ่งๆ กลางๆ.
+    """
+    cache_key = cols["meta"]["cache_key"]
+    final = _graph_entry_dir(cache_key)
+    tmp = CACHE_DIR / f".osm_graph_{cache_key}.{os.getpid()}.{threading.get_ident()}.tmp"
+    shutil.rmtree(tmp, ignore_errors=True)
+    tmp.mkdir(parents=True)
+    try:
+        for name in GRAPH_CACHE_ARRAYS:
+            np.save(tmp / f"{name}.npy", np.ascontiguousarray(cols[name]))
+        (tmp / "geom.wkb").write_bytes(np.asarray(cols["geom"], dtype=np.uint8).tobytes())
+        attrs: Dict[str, Any] = {"graph": cols["graph_attrs"], "node": [], "edge": []}
+        for kind in ("node", "edge"):
+            for i, (name, codes) in enumerate(cols[f"{kind}_attrs"].items()):
+                np.save(tmp / f"{kind}_{i}.npy", np.ascontiguousarray(codes))
+                attrs[kind].append([name, f"{kind}_{i}.npy", cols["vocab"][kind][name]])
+        (tmp / "attrs.json").write_text(json.dumps(attrs, ensure_ascii=False), encoding="utf-8")
+        meta = {**cols["meta"], "created_at": time.time()}
+        (tmp / "meta.json").write_text(json.dumps(meta), encoding="utf-8")
+
+        if final.exists():  # entry เดิมเสีย/ถูกเขียนทับ → ย้ายออกก่อน แล้วค่อยลบ
+            _remove_graph_entry(cache_key)
+        os.replace(tmp, final)
+    finally:
+        shutil.rmtree(tmp, ignore_errors=True)
+    _record_graph_entry(cache_key)
+
+
+def _read_graph_entry(entry: Path) -> Optional[Dict[str, Any]]:
+    """Memory-map a columnar entry (no array data is read until it is used)."""
+    try:
+        meta = json.loads((entry / "meta.json").read_text(encoding="utf-8"))
+        attrs = json.loads((entry / "attrs.json").read_text(encoding="utf-8"))
+        if meta.get("format") != GRAPH_CACHE_FORMAT:
             return None
-    return None
+        cols: Dict[str, Any] = {
+            name: np.load(entry / f"{name}.npy", mmap_mode="r") for name in GRAPH_CACHE_ARRAYS
+        }
+        geom_file = entry / "geom.wkb"
+        cols["geom"] = (
+            np.memmap(geom_file, dtype=np.uint8, mode="r")
+            if geom_file.stat().st_size else np.zeros(0, dtype=np.uint8)
+        )
+        cols["vocab"] = {"node": {}, "edge": {}}
+        for kind in ("node", "edge"):
+            cols[f"{kind}_attrs"] = {}
+            for name, file_name, vocab in attrs[kind]:
+                cols[f"{kind}_attrs"][name] = np.load(entry / file_name, mmap_mode="r")
+                cols["vocab"][kind][name] = vocab
+        cols["graph_attrs"] = attrs["graph"]
+        cols["meta"] = meta
+        n, m = meta["nodes"], meta["edges"]
+        if (len(cols["node_id"]) != n or len(cols["indptr"]) != n + 1
+                or len(cols["v"]) != m or len(cols["geom_offsets"]) != m + 1
+                or int(cols["geom_offsets"][-1]) != len(cols["geom"])):
+            return None
+        return cols
+    except (OSError, ValueError, KeyError, TypeError):
+        return None
+
+
+def load_graph_columns(cache_key: str) -> Optional[Dict[str, Any]]:
+    """Columnar view of a cached graph (memory-mapped; migrates a legacy ``.pkl`` first)."""
+    entry = _graph_entry_dir(cache_key)
+    if not (entry / "meta.json").exists() and not migrate_legacy_graph(cache_key):
+        return None
+    cols = _read_graph_entry(entry)
+    if cols is not None:
+        touch_graph_entry(cache_key)
+    return cols
+
+
+def edge_geometries(cols: Dict[str, Any], edge_mask: Optional[np.ndarray] = None) -> np.ndarray:
+    """
+    Shapely geometry ของทุก edge (ตามลำดับ CSR) — edge ที่ไม่มี geometry หรืออยู่นอก
+    ``edge_mask`` = ``None`` (ถอด WKB เฉพาะ edge ที่ต้องใช้).
+    """
+    offsets = np.asarray(cols["geom_offsets"])
+    has = np.diff(offsets) > 0
+    if edge_mask is not None:
+        has &= edge_mask
+    out = np.full(len(has), None, dtype=object)
+    if has.any():
+        blob = cols["geom"]
+        chunks = [blob[offsets[e]:offsets[e + 1]].tobytes() for e in np.nonzero(has)[0]]
+        out[has] = shapely.from_wkb(chunks)
+    return out
+
+
+def truncate_columns_to_polygon(cols: Dict[str, Any], polygon: Any) -> np.ndarray:
+    """
+    Node mask equivalent to ``ox.truncate.truncate_graph_polygon(...,
+    truncate_by_edge=True)``: nodes intersecting ``polygon`` plus outside
+    nodes with at least one neighbour inside — computed on the arrays.
+    """
+    polygon = wkt.loads(polygon.wkt)  # สำเนา (shapely.prepare แก้ geometry ในที่)
+    shapely.prepare(polygon)
+    inside = shapely.intersects_xy(polygon, np.asarray(cols["x"]), np.asarray(cols["y"]))
+    if not inside.any():
+        raise ValueError("Found no graph nodes within the requested polygon.")
+    u = np.repeat(np.arange(len(inside)), np.diff(np.asarray(cols["indptr"])))
+    v = np.asarray(cols["v"])
+    keep = inside.copy()
+    keep[u[inside[v]]] = True
+    keep[v[inside[u]]] = True
+    return keep
+
+
+def _decoded_attributes(cols: Dict[str, Any], kind: str) -> List[Tuple[str, List[int], List[Any]]]:
+    return [
+        (name, np.asarray(codes).tolist(), [json.loads(s) for s in cols["vocab"][kind][name]])
+        for name, codes in cols[f"{kind}_attrs"].items()
+    ]
+
+
+def graph_from_columns(
+    cols: Dict[str, Any], node_mask: Optional[np.ndarray] = None
+) -> nx.MultiDiGraph:
+    """
+    Rebuild the OSMnx ``MultiDiGraph`` (same node/edge order and attributes),
+    optionally only the subgraph induced by ``node_mask``.
+    """
+    def _attrs(decoded: List[Tuple[str, List[int], List[Any]]], i: int) -> Dict[str, Any]:
+        out: Dict[str, Any] = {}
+        for name, codes, values in decoded:
+            if codes[i] >= 0:
+                value = values[codes[i]]
+                out[name] = list(value) if isinstance(value, list) else value
+        return out
+
+    G = nx.MultiDiGraph(**cols["graph_attrs"])
+    ids = np.asarray(cols["node_id"]).tolist()
+    xs, ys = np.asarray(cols["x"]).tolist(), np.asarray(cols["y"]).tolist()
+    if node_mask is None:
+        node_mask = np.ones(len(ids), dtype=bool)
+    node_decoded = _decoded_attributes(cols, "node")
+    G.add_nodes_from(
+        (ids[i], {"y": ys[i], "x": xs[i], **_attrs(node_decoded, i)})
+        for i in np.nonzero(node_mask)[0].tolist()
+    )
+
+    u_arr = np.repeat(np.arange(len(ids)), np.diff(np.asarray(cols["indptr"])))
+    v_arr = np.asarray(cols["v"])
+    edge_mask = node_mask[u_arr] & node_mask[v_arr]
+    u, v = u_arr.tolist(), v_arr.tolist()
+    keys = np.asarray(cols["key"]).tolist()
+    length = np.asarray(cols["length"])
+    has_length = ~np.isnan(length)
+    geoms = edge_geometries(cols, edge_mask)
+    edge_decoded = _decoded_attributes(cols, "edge")
+
+    def _edge(e: int) -> Tuple[Any, Any, int, Dict[str, Any]]:
+        data = _attrs(edge_decoded, e)
+        if has_length[e]:
+            data["length"] = float(length[e])
+        if geoms[e] is not None:
+            data["geometry"] = geoms[e]
+        return ids[u[e]], ids[v[e]], keys[e], data
+
+    G.add_edges_from(_edge(e) for e in np.nonzero(edge_mask)[0].tolist())
+    return G
+
+
+def load_graph_from_cache(
+    cache_key: str, polygon: Optional[Any] = None
+) -> Optional[nx.MultiDiGraph]:
+    """Load a cached OSM graph from disk (truncated to ``polygon`` when given)."""
+    cols = load_graph_columns(cache_key)
+    if cols is None:
+        return None
+    try:
+        mask = truncate_columns_to_polygon(cols, polygon) if polygon is not None else None
+        return graph_from_columns(cols, mask)
+    except Exception:
+        return None
+
+
+def save_graph_to_cache(
+    cache_key: str,
+    graph: nx.MultiDiGraph,
+    network_type: Optional[str] = None,
+    build_seconds: Optional[float] = None,
+    coverage: Optional[Any] = None,
+    kind: str = "graph",
+    evict: bool = True,
+) -> None:
+    """
+    Persist an OSM graph in the columnar format, then evict down to the byte budget.
+
+    ``coverage``: polygon the graph was downloaded for — lets later requests
+    inside it be served by truncating this graph (:func:`find_containing_cached_graph`).
+    ``kind``: ``"graph"`` (simplified, ready to analyse) or ``"tile"`` (raw grid
+    tile, only used by :func:`fetch_graph_tiled`).
+    """
+    try:
+        cols = graph_to_columns(graph, cache_key, network_type)
+        cols["meta"]["build_seconds"] = build_seconds
+        cols["meta"]["kind"] = kind
+        if coverage is not None:
+            cols["meta"]["coverage_wkt"] = coverage.wkt
+            cols["meta"]["coverage_bounds"] = list(coverage.bounds)
+        _write_graph_entry(cols)
+        if evict:
+            evict_graph_cache(keep=(cache_key,))
+    except Exception:
+        pass  # Caching is best-effort
+
+
+def migrate_legacy_graph(cache_key: str) -> bool:
+    """แปลง ``osm_graph_<key>.pkl`` (+ sidecar ``.json``) เป็นรูปแบบ columnar แล้วลบไฟล์เดิม."""
+    pkl_file = CACHE_DIR / f"osm_graph_{cache_key}.pkl"
+    sidecar = CACHE_DIR / f"osm_graph_{cache_key}.json"
+    if not pkl_file.exists():
+        return False
+    network_type = None
+    try:
+        old_meta = json.loads(sidecar.read_text(encoding="utf-8"))
+        if not old_meta.get("network_type_inferred"):
+            network_type = old_meta.get("network_type")
+    except (OSError, ValueError):
+        pass
+    try:
+        with open(pkl_file, "rb") as f:
+            graph = pickle.load(f)
+        _write_graph_entry(graph_to_columns(graph, cache_key, network_type))
+    except Exception:
+        return False
+    for old_file in (pkl_file, sidecar):
+        try:
+            old_file.unlink()
+        except OSError:
+            pass
+    return True
+
+
+def migrate_legacy_graph_cache() -> int:
+    """Migrate every legacy pickled graph in ``CACHE_DIR``; returns how many succeeded."""
+    return sum(
+        migrate_legacy_graph(f.stem[len("osm_graph_"):])
+        for f in CACHE_DIR.glob("osm_graph_*.pkl")
+    )
+
+
+def load_graph_meta(cache_key: str) -> Optional[Dict[str, Any]]:
+    """Manifest ของกราฟใน cache (bounds / network type / จำนวน node, edge)."""
+    meta_file = _graph_entry_dir(cache_key) / "meta.json"
+    if not meta_file.exists():
+        migrate_legacy_graph(cache_key)
+    try:
+        return json.loads(meta_file.read_text(encoding="utf-8"))
+    except (OSError, ValueError):
+        return None
+
+
+def _graph_bounds_tree(
+    network_type: str, field: str
+) -> Tuple[List[str], Optional[Any]]:
+    """STRtree ของกรอบ ``field`` (``bounds`` / ``coverage_bounds``) ของกราฟ ``network_type`` (ไม่รวม tile)."""
+    keys, boxes = [], []
+    for cache_key, row in load_graph_index().items():
+        if (row.get("network_type") == network_type and row.get(field)
+                and row.get("kind", "graph") == "graph"):
+            keys.append(cache_key)
+            boxes.append(shapely.box(*row[field]))
+    return keys, (shapely.STRtree(boxes) if boxes else None)
+
+
+def find_cached_graphs_for_points(
+    points: List[Tuple[float, float]], network_type: str
+) -> List[str]:
+    """
+    Cache key ของกราฟ ``network_type`` ที่พื้นที่ดาวน์โหลด (coverage) ครอบทุกจุด
+    ``(lat, lon)`` เรียงจากเล็กไปใหญ่ — กราฟที่ไม่มี coverage (migrate มาจาก ``.pkl``)
+    ใช้กรอบของโหนดแทน.  การครอบหมุดไม่ได้แปลว่าครอบ isochrone —
+    :func:`compute_offline_isochrones` ตรวจการชนขอบอีกชั้น.
+    """
+    keys, tree = _graph_bounds_tree(network_type, "bounds")
+    if tree is None or not points:
+        return []
+    query = shapely.multipoints([(lon, lat) for lat, lon in points])
+    found: List[Tuple[float, str]] = []
+    for i in tree.query(query, predicate="within").tolist():
+        area = tree.geometries[i]
+        coverage_wkt = (load_graph_meta(keys[i]) or {}).get("coverage_wkt")
+        if coverage_wkt:
+            area = wkt.loads(coverage_wkt)
+            if not area.contains(query):
+                continue
+        found.append((area.area, keys[i]))
+    return [key for _, key in sorted(found)]
+
+
+def find_containing_cached_graph(polygon: Any, network_type: str) -> Optional[str]:
+    """
+    Cache key ของกราฟ ``network_type`` ที่พื้นที่ดาวน์โหลด (coverage) ครอบ ``polygon``
+    ทั้งหมด (เล็กที่สุด) — กรองด้วย STRtree ของกรอบใน index ก่อน แล้วจึงตรวจ
+    coverage จริงจาก manifest.  กราฟที่ไม่มี coverage (migrate มาจาก ``.pkl``) ไม่ถูกใช้.
+    """
+    keys, tree = _graph_bounds_tree(network_type, "coverage_bounds")
+    if tree is None:
+        return None
+    best: Optional[Tuple[float, str]] = None
+    for i in tree.query(polygon, predicate="within").tolist():
+        meta = load_graph_meta(keys[i])
+        if not meta or not meta.get("coverage_wkt"):
+            continue
+        coverage = wkt.loads(meta["coverage_wkt"])
+        if coverage.contains(polygon) and (best is None or coverage.area < best[0]):
+            best = (coverage.area, keys[i])
+    return best[1] if best else None
+
+
+def isochrone_cache_key(
+    travel_mode: str,
+    ranges_str: str,
+    lat: float,
+    lon: float,
+    precision: Optional[int] = None,
+) -> str:
+    """Stable key from (mode, ranges, lat/lon rounded to ``precision`` decimals)."""
+    p = ISOCHRONE_CACHE_CONFIG["coord_precision"] if precision is None else precision
+    key_str = f"{travel_mode}|{ranges_str}|{lat:.{p}f}|{lon:.{p}f}"
+    return hashlib.sha1(key_str.encode()).hexdigest()
+
+
+def load_isochrone_from_cache(cache_key: str) -> Optional[List[Dict[str, Any]]]:
+    """Load cached isochrone features; expired/corrupt entries count as a miss."""
+    cache_file = ISOCHRONE_CACHE_DIR / f"iso_{cache_key}.json"
+    try:
+        entry = json.loads(cache_file.read_text(encoding="utf-8"))
+    except (OSError, ValueError):
+        return None
+    max_age = ISOCHRONE_CACHE_CONFIG["max_age_days"] * 86400
+    if time.time() - entry.get("fetched_at", 0) > max_age:
+        return None
+    try:
+        os.utime(cache_file)  # mtime = last use (LRU eviction)
+    except OSError:
+        pass
+    return entry.get("features")
 
 
-def save_graph_to_cache(cache_key: str, graph: nx.MultiDiGraph) -> None:
-    """Persist an OSM graph to disk."""
-    cache_file = CACHE_DIR / f"osm_graph_{cache_key}.pkl"
+def save_isochrone_to_cache(
+    cache_key: str, meta: Dict[str, Any], features: List[Dict[str, Any]]
+) -> None:
+    """Persist isochrone features atomically (temp file + rename)."""
+    cache_file = ISOCHRONE_CACHE_DIR / f"iso_{cache_key}.json"
+    tmp_file = cache_file.with_suffix(f".{os.getpid()}.{threading.get_ident()}.tmp")
     try:
-        with open(cache_file, "wb") as f:
-            pickle.dump(graph, f, protocol=pickle.HIGHEST_PROTOCOL)
+        ISOCHRONE_CACHE_DIR.mkdir(parents=True, exist_ok=True)
+        entry = {**meta, "fetched_at": time.time(), "features": features}
+        tmp_file.write_text(json.dumps(entry, ensure_ascii=False), encoding="utf-8")
+        os.replace(tmp_file, cache_file)
     except Exception:
         pass  # Caching is best-effort
 
 
+def evict_isochrone_cache() -> int:
+    """Drop expired entries, then least-recently-used beyond ``max_entries``."""
+    if not ISOCHRONE_CACHE_DIR.exists():
+        return 0
+    entries = []
+    for f in ISOCHRONE_CACHE_DIR.glob("iso_*.json"):
+        try:
+            entries.append((f.stat().st_mtime, f))
+        except OSError:
+            continue
+    entries.sort(reverse=True)  # newest first
+    cutoff = time.time() - ISOCHRONE_CACHE_CONFIG["max_age_days"] * 86400
+    removed = 0
+    for rank, (mtime, f) in enumerate(entries):
+        if rank >= ISOCHRONE_CACHE_CONFIG["max_entries"] or mtime < cutoff:
+            try:
+                f.unlink()
+                removed += 1
+            except OSError:
+                pass
+    return removed
+
+
+def _graph_entries() -> List[Path]:
+    """โฟลเดอร์ entry ที่สมบูรณ์ (มี manifest) ของกราฟใน cache."""
+    return [f.parent for f in CACHE_DIR.glob("osm_graph_*/meta.json")]
+
+
 def get_cache_stats() -> Dict[str, Any]:
-    """Return ``{count, size_mb}`` for the disk cache."""
+    """Return ``{count, size_mb, budget_mb}`` for the OSM graph cache (from its index) + isochrones."""
+    budget_mb = GRAPH_CACHE_CONFIG["max_bytes"] / (1024 * 1024)
     if not CACHE_DIR.exists():
-        return {"count": 0, "size_mb": 0.0}
-    cache_files = list(CACHE_DIR.glob("osm_graph_*.pkl"))
-    total_size = sum(f.stat().st_size for f in cache_files)
-    return {"count": len(cache_files), "size_mb": total_size / (1024 * 1024)}
+        return {"count": 0, "size_mb": 0.0, "budget_mb": budget_mb,
+                "isochrone_count": 0, "isochrone_size_mb": 0.0}
+    entries = load_graph_index()
+    iso_files = list(ISOCHRONE_CACHE_DIR.glob("iso_*.json"))
+    iso_size = sum(f.stat().st_size for f in iso_files)
+    return {
+        "count": len(entries),
+        "size_mb": sum(row["bytes"] for row in entries.values()) / (1024 * 1024),
+        "budget_mb": budget_mb,
+        "isochrone_count": len(iso_files),
+        "isochrone_size_mb": iso_size / (1024 * 1024),
+    }
 
 
 def clear_disk_cache() -> None:
-    """Delete all cached OSM graphs."""
+    """Delete all cached OSM graphs and isochrones."""
     if CACHE_DIR.exists():
-        for cache_file in CACHE_DIR.glob("osm_graph_*.pkl"):
+        for entry in [*CACHE_DIR.glob("osm_graph_*"), *CACHE_DIR.glob(".osm_graph_*")]:
+            if entry.is_dir():
+                shutil.rmtree(entry, ignore_errors=True)
+        for cache_file in [*CACHE_DIR.glob("osm_graph_*.pkl"),
+                           *CACHE_DIR.glob("osm_graph_*.json"),
+                           GRAPH_INDEX_FILE,
+                           *ISOCHRONE_CACHE_DIR.glob("iso_*.json")]:
             try:
                 cache_file.unlink()
             except Exception:
@@ -1321,23 +2417,85 @@ def clear_disk_cache() -> None:
 
 
 def export_cache_as_zip() -> Optional[bytes]:
-    """Create an in-memory ZIP of all cached graphs."""
+    """Create an in-memory ZIP of all cached graphs (+ ``isochrones/`` store)."""
     if not CACHE_DIR.exists():
         return None
-    cache_files = list(CACHE_DIR.glob("osm_graph_*.pkl"))
-    if not cache_files:
+    migrate_legacy_graph_cache()
+    entries = _graph_entries()
+    iso_files = list(ISOCHRONE_CACHE_DIR.glob("iso_*.json"))
+    if not entries and not iso_files:
         return None
 
     zip_buffer = io.BytesIO()
     with zipfile.ZipFile(zip_buffer, "w", zipfile.ZIP_DEFLATED) as zf:
-        for cache_file in cache_files:
-            zf.write(cache_file, cache_file.name)
+        for entry in entries:
+            # meta.json ท้ายสุด — ตอน import จะได้ตรวจ entry ครบก่อน rename เข้า cache
+            for f in sorted(entry.iterdir(), key=lambda f: f.name == "meta.json"):
+                zf.write(f, f"{entry.name}/{f.name}")
+        for iso_file in iso_files:
+            zf.write(iso_file, f"isochrones/{iso_file.name}")
     zip_buffer.seek(0)
     return zip_buffer.getvalue()
 
 
+def _import_isochrone_entry(
+    zf: zipfile.ZipFile, name: str, result: Dict[str, Any]
+) -> None:
+    """Restore one ``isochrones/iso_<key>.json`` member (keeps its original age)."""
+    base = name[len("isochrones/"):]
+    if "/" in base or not base.startswith("iso_") or not base.endswith(".json"):
+        result["errors"].append(f"Skipped invalid file: {name}")
+        return
+    target_path = ISOCHRONE_CACHE_DIR / base
+    if target_path.exists():
+        result["skipped"] += 1
+        return
+    try:
+        data = zf.read(name)
+        entry = json.loads(data)
+        if not isinstance(entry.get("features"), list):
+            raise ValueError("missing features")
+        ISOCHRONE_CACHE_DIR.mkdir(parents=True, exist_ok=True)
+        with open(target_path, "wb") as f:
+            f.write(data)
+        result["imported"] += 1
+    except Exception as e:
+        result["errors"].append(f"Failed to import {name}: {str(e)}")
+
+
+def _import_graph_entry(
+    zf: zipfile.ZipFile, entry_name: str, members: List[str], result: Dict[str, Any]
+) -> None:
+    """Restore one ``osm_graph_<key>/`` folder — validated before it becomes visible."""
+    target = CACHE_DIR / entry_name
+    if (target / "meta.json").exists():
+        result["skipped"] += 1
+        return
+    tmp = CACHE_DIR / f".{entry_name}.{os.getpid()}.import.tmp"
+    shutil.rmtree(tmp, ignore_errors=True)
+    try:
+        tmp.mkdir(parents=True)
+        for name in members:
+            base = name[len(entry_name) + 1:]
+            if not base or "/" in base or base.startswith("."):
+                raise ValueError(f"unexpected member {name}")
+            (tmp / base).write_bytes(zf.read(name))
+        cols = _read_graph_entry(tmp)
+        if cols is None or cols["meta"].get("cache_key") != entry_name[len("osm_graph_"):]:
+            raise ValueError("invalid or incomplete graph entry")
+        del cols  # ปล่อย memory map ก่อน rename (Windows)
+        shutil.rmtree(target, ignore_errors=True)
+        os.replace(tmp, target)
+        _record_graph_entry(entry_name[len("osm_graph_"):])
+        result["imported"] += 1
+    except Exception as e:
+        result["errors"].append(f"Failed to import {entry_name}/: {str(e)}")
+    finally:
+        shutil.rmtree(tmp, ignore_errors=True)
+
+
 def import_cache_from_zip(zip_bytes: bytes) -> Dict[str, Any]:
-    """Import cache entries from a ZIP archive."""
+    """Import cache entries from a ZIP archive (columnar entries or legacy ``.pkl``)."""
     result: Dict[str, Any] = {
         "success": False,
         "imported": 0,
@@ -1349,14 +2507,31 @@ def import_cache_from_zip(zip_bytes: bytes) -> Dict[str, Any]:
         CACHE_DIR.mkdir(exist_ok=True)
         zip_buffer = io.BytesIO(zip_bytes)
         with zipfile.ZipFile(zip_buffer, "r") as zf:
+            graph_members: Dict[str, List[str]] = {}
             for file_info in zf.infolist():
                 name = file_info.filename
+                if file_info.is_dir():
+                    continue
+                if name.startswith("isochrones/"):
+                    _import_isochrone_entry(zf, name, result)
+                    continue
+                if name.startswith("osm_graph_") and "/" in name:
+                    graph_members.setdefault(name.split("/", 1)[0], []).append(name)
+                    continue
+                if name.startswith("osm_graph_") and name.endswith(".json"):
+                    # sidecar ของ .pkl รุ่นเก่า (network type) — ใช้ตอน migrate ด้านล่าง
+                    try:
+                        json.loads(zf.read(name))
+                        if not (CACHE_DIR / name).exists():
+                            (CACHE_DIR / name).write_bytes(zf.read(name))
+                    except Exception as e:
+                        result["errors"].append(f"Failed to import {name}: {str(e)}")
+                    continue
                 if not name.startswith("osm_graph_") or not name.endswith(".pkl"):
                     result["errors"].append(f"Skipped invalid file: {name}")
                     continue
 
-                target_path = CACHE_DIR / name
-                if target_path.exists():
+                if is_graph_cached(name[len("osm_graph_"):-len(".pkl")]):
                     result["skipped"] += 1
                     continue
 
@@ -1364,12 +2539,17 @@ def import_cache_from_zip(zip_bytes: bytes) -> Dict[str, Any]:
                     data = zf.read(name)
                     # Validate pickle
                     pickle.load(io.BytesIO(data))
-                    with open(target_path, "wb") as f:
+                    with open(CACHE_DIR / name, "wb") as f:
                         f.write(data)
                     result["imported"] += 1
                 except Exception as e:
                     result["errors"].append(f"Failed to import {name}: {str(e)}")
 
+            for entry_name, members in graph_members.items():
+                _import_graph_entry(zf, entry_name, members, result)
+        migrate_legacy_graph_cache()
+        evict_graph_cache()
+
         result["success"] = result["imported"] > 0 or result["skipped"] > 0
     except zipfile.BadZipFile:
         result["errors"].append("Invalid ZIP file format")
@@ -1417,7 +2597,7 @@ def export_bundle_zip() -> bytes:
         "Rent_Gradient bundle.zip\n"
         "- manifest.json: compatibility & policy\n"
         "- config/config.json: user settings + precomputed results\n"
-        "- cache/cache.zip: OSM graph cache archive\n"
+        "- cache/cache.zip: OSM graph cache + isochrones/ (Geoapify responses)\n"
     ).encode("utf-8")
 
     out = io.BytesIO()
@@ -1489,12 +2669,142 @@ def download_github_bundle() -> Tuple[Optional[bytes], Optional[str]]:
         return None, f"ดาวน์โหลด Bundle จาก GitHub ไม่สำเร็จ: {str(e)}"
 
 
+# ------------------------------------------------------ Tiled OSM acquisition
+def tile_cache_key(network_type: str, ix: int, iy: int) -> str:
+    return f"tile_{network_type}_{OSM_TILE_CONFIG['tile_deg']:g}_{ix}_{iy}"
+
+
+def _tile_box(ix: int, iy: int) -> Any:
+    d = OSM_TILE_CONFIG["tile_deg"]
+    return shapely.box(ix * d, iy * d, (ix + 1) * d, (iy + 1) * d)
+
+
+def tiles_for_polygon(polygon: Any) -> List[Tuple[int, int]]:
+    """Grid tiles ``(ix, iy)`` (``tile_deg`` องศา, ยึดกับ lon/lat 0) ที่ตัดกับ ``polygon``."""
+    d = OSM_TILE_CONFIG["tile_deg"]
+    minx, miny, maxx, maxy = polygon.bounds
+    prepared = prep(polygon)
+    return [
+        (ix, iy)
+        for ix in range(int(np.floor(minx / d)), int(np.floor(maxx / d)) + 1)
+        for iy in range(int(np.floor(miny / d)), int(np.floor(maxy / d)) + 1)
+        if prepared.intersects(_tile_box(ix, iy))
+    ]
+
+
+def _fetch_tile(network_type: str, ix: int, iy: int) -> nx.MultiDiGraph:
+    """
+    ดาวน์โหลด tile เดียวแบบ **ไม่ simplify** (โหนดที่ขอบ tile ต้องเป็นโหนด OSM จริง
+    ทั้งสองฝั่งจึงต่อกันได้) แล้วเก็บลง cache — tile ที่ไม่มีถนนเก็บเป็นกราฟว่าง.
+    """
+    tile = _tile_box(ix, iy)
+    t0 = time.perf_counter()
+    try:
+        G = ox.graph_from_polygon(
+            tile, network_type=network_type, simplify=False, retain_all=True,
+            truncate_by_edge=True,
+        )
+    except ox._errors.InsufficientResponseError:
+        G = nx.MultiDiGraph(crs=ox.settings.default_crs, simplified=False)
+    save_graph_to_cache(
+        tile_cache_key(network_type, ix, iy), G, network_type,
+        time.perf_counter() - t0, coverage=tile, kind="tile", evict=False,
+    )
+    return G
+
+
+def stitch_tiles(
+    tile_graphs: List[nx.MultiDiGraph], polygon: Any, polygon_buffered: Any
+) -> nx.MultiDiGraph:
+    """
+    รวม tile (node id ซ้ำที่ขอบ tile = โหนดเดียวกัน) แล้วทำขั้นตอนเดียวกับ
+    ``ox.graph_from_polygon``: ตัดตามพื้นที่ขยาย → LCC → simplify → ตัดตาม polygon → LCC.
+    """
+    G_buff = nx.compose_all(tile_graphs)
+    # edge ที่อยู่ในสอง tile อาจได้ key ต่างกัน → เก็บ (u, v, osmid) ละหนึ่ง edge
+    seen = set()
+    duplicates = []
+    for u, v, k, osmid in G_buff.edges(keys=True, data="osmid"):
+        signature = (u, v, json.dumps(osmid, default=str))
+        if signature in seen:
+            duplicates.append((u, v, k))
+        else:
+            seen.add(signature)
+    G_buff.remove_edges_from(duplicates)
+
+    G_buff = ox.truncate.truncate_graph_polygon(G_buff, polygon_buffered, truncate_by_edge=True)
+    G_buff = ox.truncate.largest_component(G_buff, strongly=False)
+    G_buff = ox.simplify_graph(G_buff)
+    G = ox.truncate.truncate_graph_polygon(G_buff, polygon, truncate_by_edge=True)
+    G = ox.truncate.largest_component(G, strongly=False)
+    nx.set_node_attributes(
+        G, ox.stats.count_streets_per_node(G_buff, nodes=G.nodes), name="street_count"
+    )
+    return G
+
+
+def fetch_graph_tiled(
+    polygon: Any, network_type: str, progress: Optional[Callable[..., None]] = None
+) -> Optional[Tuple[nx.MultiDiGraph, int]]:
+    """
+    Graph for ``polygon`` assembled from cached grid tiles; only tiles not
+    yet cached are downloaded (``max_workers`` at a time).  ``progress`` is
+    called as ``progress("download", fraction, message)`` per finished tile.
+
+    Returns ``(graph, tiles_downloaded)``, or ``None`` when the area needs
+    more than ``max_tiles`` tiles (caller downloads it in one request).
+    """
+    cfg = OSM_TILE_CONFIG
+    poly_proj, crs_utm = ox.projection.project_geometry(polygon)
+    polygon_buffered, _ = ox.projection.project_geometry(
+        poly_proj.buffer(cfg["buffer_m"]), crs=crs_utm, to_latlong=True
+    )
+    tiles = tiles_for_polygon(polygon_buffered)
+    if len(tiles) > cfg["max_tiles"]:
+        return None
+
+    keys = [tile_cache_key(network_type, ix, iy) for ix, iy in tiles]
+    graphs: Dict[Tuple[int, int], Optional[nx.MultiDiGraph]] = {
+        tile: load_graph_from_cache(key) for tile, key in zip(tiles, keys)
+    }
+    missing = [tile for tile, G in graphs.items() if G is None]
+    if missing:
+        pool = ThreadPoolExecutor(max_workers=max(1, min(cfg["max_workers"], len(missing))))
+        try:
+            futures = [pool.submit(_fetch_tile, network_type, *tile) for tile in missing]
+            for done, (tile, future) in enumerate(zip(missing, futures), start=1):
+                graphs[tile] = future.result()
+                if progress:
+                    progress("download", done / len(missing), f"ดาวน์โหลด tile {done}/{len(missing)}")
+        except BaseException:
+            # ยกเลิกงาน (progress raise JobCancelled) → ถอน tile ที่ยังรอคิว ไม่รอดาวน์โหลดครบทุก tile
+            pool.shutdown(wait=False, cancel_futures=True)
+            raise
+        pool.shutdown()
+        evict_graph_cache(keep=tuple(keys))
+
+    non_empty = [G for G in graphs.values() if len(G)]
+    if not non_empty:
+        raise ox._errors.InsufficientResponseError("No OSM data in any tile")
+    return stitch_tiles(non_empty, polygon, polygon_buffered), len(missing)
+
+
 def _fetch_osm_graph(
-    polygon_wkt_str: str, network_type: str
+    polygon_wkt_str: str,
+    network_type: str,
+    fallback_key: Optional[str] = None,
+    progress: Optional[Callable[..., None]] = None,
 ) -> Tuple[Optional[nx.MultiDiGraph], bool, Optional[str]]:
     """
     Fetch an OSM graph for a polygon, with disk-cache lookup.
 
+    Without an exact cache hit, a cached graph whose download area contains
+    the polygon is truncated to it locally instead of downloading —
+    ``fallback_key`` (the graph offline isochrones were built from) first,
+    otherwise :func:`find_containing_cached_graph`.  Remaining misses are
+    assembled from grid tiles (:func:`fetch_graph_tiled`), so moving a
+    marker only downloads the tiles that were not fetched before.
+
     Returns:
         ``(graph, was_cached, error_message)``
     """
@@ -1506,12 +2816,32 @@ def _fetch_osm_graph(
         if G is not None:
             return G, True, None
 
-        G = ox.graph_from_polygon(
-            polygon_geom, network_type=network_type, truncate_by_edge=True
+        # กราฟที่ใหญ่กว่าและครอบพื้นที่นี้อยู่แล้ว → ตัดเฉพาะส่วนที่ใช้ (ไม่ต้องดาวน์โหลดใหม่)
+        container_key = fallback_key or find_containing_cached_graph(polygon_geom, network_type)
+        if container_key:
+            G = load_graph_from_cache(container_key, polygon=polygon_geom)
+            if G is not None:
+                return G, True, None
+
+        t0 = time.perf_counter()
+        tiled = (
+            fetch_graph_tiled(polygon_geom, network_type, progress)
+            if OSM_TILE_CONFIG["enabled"] else None
+        )
+        if tiled is not None:
+            G, tiles_downloaded = tiled
+        else:
+            G = ox.graph_from_polygon(
+                polygon_geom, network_type=network_type, truncate_by_edge=True
+            )
+            tiles_downloaded = 1
+        save_graph_to_cache(
+            cache_key, G, network_type, time.perf_counter() - t0, coverage=polygon_geom
         )
-        save_graph_to_cache(cache_key, G)
-        return G, False, None
+        return G, tiles_downloaded == 0, None
 
+    except JobCancelled:
+        raise
     except ValueError as e:
         return None, False, f"Invalid geometry: {str(e)}"
     except ox._errors.InsufficientResponseError:
@@ -1523,9 +2853,311 @@ def _fetch_osm_graph(
         return None, False, f"Failed to fetch OSM graph: {str(e)}"
 
 
+# ------------------------------------------------- Offline isochrone engine
+def _edge_speed_kmh(data: Dict[str, Any], network_type: str) -> float:
+    """ความเร็วของ edge: walk/bike คงที่, drive จาก maxspeed → highway=* → default."""
+    cfg = OFFLINE_ISOCHRONE_CONFIG
+    if network_type != "drive":
+        return cfg["speed_kmh"].get(network_type, cfg["speed_kmh"]["walk"])
+    maxspeed = data.get("maxspeed")
+    for raw in (maxspeed if isinstance(maxspeed, list) else [maxspeed]):
+        text = str(raw).strip().lower()
+        try:
+            value = float(text.split()[0])
+        except (ValueError, IndexError):
+            continue
+        if value > 0:
+            return value * 1.609 if "mph" in text else value
+    highway = data.get("highway")
+    highway = highway[0] if isinstance(highway, list) else highway
+    return cfg["drive_speeds_kmh"].get(highway, cfg["drive_default_kmh"])
+
+
+def _edge_speeds_kmh(cols: Dict[str, Any], network_type: str) -> np.ndarray:
+    """ความเร็วของทุก edge — คำนวณครั้งเดียวต่อคู่ (highway, maxspeed) ที่ไม่ซ้ำกัน."""
+    m = len(cols["v"])
+    codes, values = [], []
+    for name in ("highway", "maxspeed"):
+        c = cols["edge_attrs"].get(name)
+        codes.append(np.asarray(c) if c is not None else np.full(m, -1, dtype=np.int32))
+        values.append([json.loads(s) for s in cols["vocab"]["edge"].get(name, [])])
+    pairs, inverse = np.unique(np.column_stack(codes), axis=0, return_inverse=True)
+    speeds = np.array([
+        _edge_speed_kmh({
+            "highway": values[0][h] if h >= 0 else None,
+            "maxspeed": values[1][s] if s >= 0 else None,
+        }, network_type)
+        for h, s in pairs.tolist()
+    ], dtype=float)
+    return speeds[inverse.ravel()] if m else np.zeros(0)
+
+
+def prepare_offline_network(cols: Dict[str, Any], network_type: str) -> Dict[str, Any]:
+    """
+    แปลงกราฟ (columnar cache, ดู :func:`graph_to_columns`) เป็น array สำหรับ offline
+    isochrone (ทำครั้งเดียวต่อกราฟ): พิกัดโหนด/edge ในระบบเมตรรอบจุดกลางกราฟ,
+    travel time (วินาที) ต่อ edge, CSR adjacency (edge ซ้ำ u→v เก็บเฉพาะที่เร็วที่สุด)
+    และ ``edge_nodes`` — โหนดใกล้ขอบพื้นที่ดาวน์โหลด (coverage; ไม่มี → กรอบของโหนด)
+    ซึ่งถนนเลยออกไปไม่ได้อยู่ในกราฟ.
+    """
+    lon = np.asarray(cols["x"], dtype=float)
+    lat = np.asarray(cols["y"], dtype=float)
+    n = len(lon)
+    lat0, lon0 = float(lat.mean()), float(lon.mean())
+    kx, ky = cos(radians(lat0)) * 111_320.0, 110_540.0
+
+    u = np.repeat(np.arange(n, dtype=np.int64), np.diff(np.asarray(cols["indptr"])))
+    v = np.asarray(cols["v"], dtype=np.int64)
+    coords: List[Optional[np.ndarray]] = [None] * len(v)
+    geoms = edge_geometries(cols)
+    has = np.array([g is not None for g in geoms], dtype=bool)
+    if has.any():
+        pts, owner = shapely.get_coordinates(geoms[has], return_index=True)
+        splits = np.cumsum(np.bincount(owner, minlength=int(has.sum())))[:-1]
+        for e, xy in zip(np.nonzero(has)[0].tolist(), np.split(pts, splits)):
+            coords[e] = xy
+    for e in np.nonzero(~has)[0].tolist():
+        coords[e] = np.array([[lon[u[e]], lat[u[e]]], [lon[v[e]], lat[v[e]]]])
+    coords_xy = [np.column_stack(((xy[:, 0] - lon0) * kx, (xy[:, 1] - lat0) * ky)) for xy in coords]
+
+    length_m = np.array(cols["length"], dtype=float)
+    missing = np.nonzero(np.isnan(length_m) | (length_m <= 0))[0]
+    for e in missing.tolist():
+        length_m[e] = float(np.hypot(*np.diff(coords_xy[e], axis=0).T).sum())
+    travel_s = np.maximum(length_m / (_edge_speeds_kmh(cols, network_type) / 3.6), 0.01)
+
+    net: Dict[str, Any] = {
+        "network_type": network_type,
+        "n": n,
+        "node_xy": np.column_stack(((lon - lon0) * kx, (lat - lat0) * ky)),
+        "origin": (lat0, lon0, kx, ky),
+        "u": u,
+        "v": v,
+        "travel_s": travel_s,
+        "coords_xy": coords_xy,
+        "edge_nodes": np.zeros(n, dtype=bool),
+    }
+    if n:
+        coverage_wkt = (cols.get("meta") or {}).get("coverage_wkt")
+        extent = (
+            wkt.loads(coverage_wkt) if coverage_wkt
+            else shapely.box(lon.min(), lat.min(), lon.max(), lat.max())
+        )
+        to_xy = lambda x, y: ((np.asarray(x) - lon0) * kx, (np.asarray(y) - lat0) * ky)  # noqa: E731
+        inner = shapely_transform(to_xy, extent).buffer(-OFFLINE_ISOCHRONE_CONFIG["edge_margin_m"])
+        net["edge_nodes"] = ~shapely.contains_xy(inner, net["node_xy"][:, 0], net["node_xy"][:, 1])
+    if HAS_SCIPY and len(v):
+        order = np.lexsort((net["travel_s"], net["v"], net["u"]))
+        uu, vv, tt = net["u"][order], net["v"][order], net["travel_s"][order]
+        first = np.r_[True, (uu[1:] != uu[:-1]) | (vv[1:] != vv[:-1])]
+        net["csr"] = csr_matrix((tt[first], (uu[first], vv[first])), shape=(net["n"], net["n"]))
+    return net
+
+
+def _batched_travel_times(
+    net: Dict[str, Any], sources: List[int], limit_s: float
+) -> np.ndarray:
+    """
+    เวลาเดินทางจากทุก source ไปทุกโหนด (แถวละ source) ใน **call เดียว**
+    (scipy ``dijkstra(indices=sources, limit=...)``) — โหนดที่เกิน limit = inf.
+    """
+    if HAS_SCIPY and "csr" in net:
+        return csgraph_dijkstra(net["csr"], directed=True, indices=sources, limit=limit_s)
+    # Fallback: networkx single-source Dijkstra พร้อม cutoff ต่อ source
+    D = nx.DiGraph()
+    D.add_nodes_from(range(net["n"]))
+    for a, b, t in zip(net["u"].tolist(), net["v"].tolist(), net["travel_s"].tolist()):
+        if not D.has_edge(a, b) or D[a][b]["w"] > t:
+            D.add_edge(a, b, w=t)
+    out = np.full((len(sources), net["n"]), np.inf)
+    for row, src in enumerate(sources):
+        lengths = nx.single_source_dijkstra_path_length(D, src, cutoff=limit_s, weight="w")
+        out[row, list(lengths.keys())] = list(lengths.values())
+    return out
+
+
+def _cut_polyline(xy: np.ndarray, frac: float) -> np.ndarray:
+    """ส่วนต้นของ polyline ยาว ``frac`` (0–1) ของความยาวทั้งหมด."""
+    seg = np.hypot(*np.diff(xy, axis=0).T)
+    cum = np.r_[0.0, np.cumsum(seg)]
+    target = cum[-1] * frac
+    k = int(np.searchsorted(cum, target, side="right"))
+    if k >= len(xy):
+        return xy
+    t = (target - cum[k - 1]) / seg[k - 1] if seg[k - 1] > 0 else 0.0
+    return np.vstack((xy[:k], xy[k - 1] + t * (xy[k] - xy[k - 1])))
+
+
+def _reachable_polygon(
+    net: Dict[str, Any],
+    times_s: np.ndarray,
+    budget_s: float,
+    start_xy: Tuple[float, float],
+) -> Optional[Any]:
+    """Polygon (ระบบเมตร) ของถนนที่ไปถึงภายใน ``budget_s`` (รวม edge ที่ไปได้บางส่วน)."""
+    cfg = OFFLINE_ISOCHRONE_CONFIG
+    buffer_m = cfg["buffer_m"].get(net["network_type"], 30.0)
+    t_u = times_s[net["u"]]
+    lines = []
+    for e in np.nonzero(t_u < budget_s)[0]:
+        frac = (budget_s - t_u[e]) / net["travel_s"][e]
+        xy = net["coords_xy"][e]
+        lines.append(xy if frac >= 1.0 else _cut_polyline(xy, frac))
+    parts = [Point(start_xy).buffer(buffer_m)]
+    if lines:
+        parts.append(MultiLineString(lines).buffer(buffer_m, quad_segs=4))
+    area = unary_union(parts)
+
+    # อุดรูเล็กๆ (บล็อกระหว่างถนน) ให้ได้รูปทรงแบบ isochrone ของ API
+    polys = list(area.geoms) if isinstance(area, MultiPolygon) else [area]
+    filled = [
+        Polygon(p.exterior, [r for r in p.interiors if Polygon(r).area >= cfg["fill_holes_m2"]])
+        for p in polys if not p.is_empty
+    ]
+    return unary_union(filled) if filled else None
+
+
+def compute_offline_isochrones(
+    net: Dict[str, Any],
+    points: List[Tuple[float, float]],
+    ranges_s: List[int],
+    travel_mode: str,
+) -> List[Tuple[Optional[List[Dict[str, Any]]], Optional[str], List[int]]]:
+    """
+    Isochrone ของทุกจุด ``(lat, lon)`` จากกราฟที่เตรียมไว้ — shortest path ของทุกจุด
+    คำนวณใน call เดียว แล้วสร้าง polygon ต่อช่วงเวลาในรูปแบบเดียวกับ Geoapify
+    (``properties.value`` = วินาที).  คืนค่า ``[(features, error, clipped), ...]`` ตามลำดับ
+    ``points`` — ``clipped`` = ช่วงเวลาที่ไปถึงขอบกราฟ (ผลจะถูกตัดที่ขอบ) ซึ่งไม่ถูกสร้าง
+    แต่แจ้งใน ``error`` แทน (ยังคืน ``features`` ของช่วงที่เหลือ).
+    """
+    cfg = OFFLINE_ISOCHRONE_CONFIG
+    lat0, lon0, kx, ky = net["origin"]
+    walk_in_kmh = (
+        cfg["drive_default_kmh"] if net["network_type"] == "drive"
+        else cfg["speed_kmh"].get(net["network_type"], cfg["speed_kmh"]["walk"])
+    )
+    results: List[Tuple[Optional[List[Dict[str, Any]]], Optional[str], List[int]]] = [(None, None, [])] * len(points)
+
+    # Snap ทุกจุดเข้าโหนดที่ใกล้ที่สุด (เวลาจากหมุดถึงโหนดหักออกจากงบเวลา)
+    sources: List[int] = []
+    snapped: List[Tuple[int, float, Tuple[float, float]]] = []
+    for i, (lat, lon) in enumerate(points):
+        xy = ((lon - lon0) * kx, (lat - lat0) * ky)
+        d = np.hypot(net["node_xy"][:, 0] - xy[0], net["node_xy"][:, 1] - xy[1])
+        node = int(np.argmin(d)) if len(d) else -1
+        if node < 0 or d[node] > cfg["max_snap_m"]:
+            results[i] = (None, f"หมุดอยู่นอกโครงข่ายถนนใน Cache (> {cfg['max_snap_m']:.0f} ม.)", [])
+            continue
+        snapped.append((i, float(d[node]) / (walk_in_kmh / 3.6), xy))
+        sources.append(node)
+
+    if not sources:
+        return results
+    times = _batched_travel_times(net, sources, float(max(ranges_s)))
+
+    to_lonlat = lambda x, y: (np.asarray(x) / kx + lon0, np.asarray(y) / ky + lat0)  # noqa: E731
+    for row, (i, offset_s, xy) in enumerate(snapped):
+        lat, lon = points[i]
+        features: List[Dict[str, Any]] = []
+        clipped: List[int] = []
+        arrival = times[row] + offset_s
+        edge_arrival = float(arrival[net["edge_nodes"]].min()) if net["edge_nodes"].any() else np.inf
+        for r in sorted(ranges_s):
+            if edge_arrival < r:
+                clipped.append(r)   # ไปถึงขอบพื้นที่ดาวน์โหลด — ถนนที่เลยไปไม่มีในกราฟ
+                continue
+            poly = _reachable_polygon(net, arrival, r, xy)
+            if poly is None or poly.is_empty:
+                continue
+            features.append({
+                "type": "Feature",
+                "properties": {
+                    "value": r, "range_type": "time", "mode": travel_mode,
+                    "lat": lat, "lon": lon, "source": "offline",
+                },
+                "geometry": mapping(shapely_transform(to_lonlat, poly)),
+            })
+        error = None
+        if clipped:
+            error = (
+                f"ช่วง {', '.join(f'{r / 60:g}' for r in clipped)} นาทีไปถึงขอบของ OSM graph ใน Cache "
+                "— Travel Area จะถูกตัด จึงไม่แสดง (รัน Network Analysis บนพื้นที่ที่กว้างขึ้นก่อน หรือใช้ Geoapify)"
+            )
+        elif not features:
+            error = "ไม่พบถนนที่ไปถึงได้จากหมุดนี้"
+        results[i] = (features or None, error, clipped)
+    return results
+
+
+def build_network_model(G: nx.MultiDiGraph) -> Dict[str, Any]:
+    """
+    Compact array model of the road graph, built once per analysis — closeness,
+    betweenness, golden-land ranking and GeoJSON all work on integer indices
+    instead of walking networkx dicts (no ``to_undirected()`` copy either).
+
+    Keys:
+        node_ids, x, y     : โหนดตามลำดับ ``G.nodes``
+        edge_u, edge_v     : index ของ directed edge ตามลำดับ ``G.edges(keys=True)``
+        edge_geoms         : LineString ต่อ edge (ไม่มี geometry → เส้นตรงระหว่างโหนด)
+        csr                : ``undirected_csr`` — ความยาวสั้นสุดต่อคู่โหนด,
+                             ``csr["edge_pair"]`` = คู่ของแต่ละ edge (−1 = self-loop)
+    """
+    node_ids = list(G.nodes)
+    index = {node: i for i, node in enumerate(node_ids)}
+    n, m = len(node_ids), G.number_of_edges()
+    x = np.fromiter((d for _, d in G.nodes(data="x")), dtype=np.float64, count=n)
+    y = np.fromiter((d for _, d in G.nodes(data="y")), dtype=np.float64, count=n)
+
+    edge_u = np.empty(m, dtype=np.int64)
+    edge_v = np.empty(m, dtype=np.int64)
+    length = np.empty(m, dtype=np.float64)
+    geoms = np.empty(m, dtype=object)
+    for e, (u, v, data) in enumerate(G.edges(data=True)):
+        edge_u[e], edge_v[e] = index[u], index[v]
+        length[e] = data.get("length", 1.0)
+        geoms[e] = data.get("geometry")
+
+    straight = np.flatnonzero(pd.isna(geoms))
+    if len(straight):
+        a, b = edge_u[straight], edge_v[straight]
+        geoms[straight] = shapely.linestrings(
+            np.stack([np.c_[x[a], y[a]], np.c_[x[b], y[b]]], axis=1)
+        )
+
+    return {
+        "node_ids": node_ids,
+        "x": x,
+        "y": y,
+        "edge_u": edge_u,
+        "edge_v": edge_v,
+        "edge_geoms": geoms,
+        "csr": undirected_csr(n, edge_u, edge_v, length),
+    }
+
+
+def _edge_values(model: Dict[str, Any], pair_values: np.ndarray) -> np.ndarray:
+    """ค่าต่อคู่โหนด → ค่าต่อ directed edge ของ model (self-loop = 0)."""
+    edge_pair = model["csr"]["edge_pair"]
+    if not len(pair_values):
+        return np.zeros(len(edge_pair))
+    return np.where(edge_pair >= 0, pair_values[np.maximum(edge_pair, 0)], 0.0)
+
+
+def _model_to_networkx(model: Dict[str, Any]) -> nx.Graph:
+    """กราฟไม่มีทิศ (โหนด = index) จาก model — ใช้เฉพาะ fallback เมื่อไม่มี scipy."""
+    csr = model["csr"]
+    graph = nx.Graph()
+    graph.add_nodes_from(range(csr["n"]))
+    graph.add_weighted_edges_from(
+        zip(csr["pair_u"].tolist(), csr["pair_v"].tolist(), csr["pair_w"].tolist()), weight="length"
+    )
+    return graph
+
+
 def compute_weighted_closeness(
-    G_undir: nx.MultiGraph,
-) -> Tuple[Dict[Any, float], str]:
+    model: Dict[str, Any],
+    progress: Optional[Callable[..., None]] = None,
+) -> Tuple[np.ndarray, str, Dict[str, Any]]:
     """
     Weighted closeness centrality สำหรับหา CBD node (Network 1-Median).
 
@@ -1537,80 +3169,93 @@ def compute_weighted_closeness(
     โหนดนอก LCC ได้ค่า 0 จึงไม่มีสิทธิ์เป็น top node — และใช้ seed คงที่
     ทำให้ผลซ้ำได้ทุกครั้ง
 
-    ความเร็ว:
-      - N ≤ closeness_exact_threshold → exact ด้วย scipy.sparse.csgraph.dijkstra
-      - N มากกว่า → Eppstein–Wang pivot sampling (k pivots, seed=42):
+    ความเร็ว / หน่วยความจำ:
+      - N ≤ closeness_exact_threshold → exact: Dijkstra ทีละ block (closeness_block_mb)
+        เก็บเฉพาะผลรวมระยะต่อโหนด — ไม่มีเมทริกซ์ N×N
+      - N มากกว่า → Eppstein–Wang pivot sampling แบบ adaptive (seed=42):
             Ĉ(v) = k / Σ_{p∈pivots} d_len(v,p)   (error ~ O(1/√k))
+        เพิ่ม pivot จนอันดับ top-k นิ่ง แล้วคำนวณตัวเต็งแบบ exact
       - ไม่มี scipy → fallback nx.closeness_centrality(distance="length")
 
     Returns:
-        ``(closeness_dict, method)`` โดย method ∈
-        {"exact-scipy", "pivot-approx", "networkx-fallback", "trivial"}
-    """
-    closeness: Dict[Any, float] = {node: 0.0 for node in G_undir.nodes}
-    if len(G_undir) < 2:
-        return closeness, "trivial"
+        ``(closeness, method, quality)`` — closeness เรียงตาม ``model["node_ids"]``,
+        method ∈ {"exact-scipy", "pivot-adaptive", "networkx-fallback", "trivial"},
+        quality = ``{"pivots", "verified", "rel_error", "top_confidence"}``
 
-    lcc_nodes = max(nx.connected_components(G_undir), key=len)
-    n = len(lcc_nodes)
-    if n < 2:
-        return closeness, "trivial"
-    G_lcc = G_undir.subgraph(lcc_nodes)
+    ``progress(stage, fraction, message)`` รายงานขั้น "lcc" และ "closeness".
+    """
+    progress = progress or (lambda *args: None)
+    csr = model["csr"]
+    n_all = csr["n"]
+    closeness = np.zeros(n_all)
+    exact_quality: Dict[str, Any] = {"pivots": n_all, "verified": n_all, "rel_error": 0.0, "top_confidence": 1.0}
+    if n_all < 2:
+        return closeness, "trivial", exact_quality
 
     if not HAS_SCIPY:
-        closeness.update(nx.closeness_centrality(G_lcc, distance="length"))
-        return closeness, "networkx-fallback"
-
-    # สร้าง sparse adjacency (เก็บ min length เมื่อมี parallel edges)
-    nodelist = list(G_lcc.nodes)
-    idx = {node: i for i, node in enumerate(nodelist)}
-    best_len: Dict[Tuple[int, int], float] = {}
-    for u, v, length in G_lcc.edges(data="length", default=1.0):
-        if u == v:
-            continue
-        a, b = idx[u], idx[v]
-        if a > b:
-            a, b = b, a
-        L = float(length)
-        if L < best_len.get((a, b), float("inf")):
-            best_len[(a, b)] = L
-
-    rows = np.fromiter((k[0] for k in best_len), dtype=np.int32, count=len(best_len))
-    cols = np.fromiter((k[1] for k in best_len), dtype=np.int32, count=len(best_len))
-    vals = np.fromiter(best_len.values(), dtype=np.float64, count=len(best_len))
-    csr = csr_matrix((vals, (rows, cols)), shape=(n, n))
-
-    if n <= NETWORK_CONFIG["closeness_exact_threshold"]:
-        dist = csgraph_dijkstra(csr, directed=False)
-        sums = dist.sum(axis=1)
-        k_eff = n - 1
-        method = "exact-scipy"
-    else:
-        k = min(NETWORK_CONFIG["closeness_k_pivots"], n)
-        rng = np.random.default_rng(42)
-        pivots = rng.choice(n, size=k, replace=False)
-        dist = csgraph_dijkstra(csr, directed=False, indices=pivots)
-        sums = dist.sum(axis=0)
-        k_eff = k
-        method = "pivot-approx"
-
-    with np.errstate(divide="ignore", invalid="ignore"):
-        scores = np.where(np.isfinite(sums) & (sums > 0), k_eff / sums, 0.0)
-    for i, node in enumerate(nodelist):
-        closeness[node] = float(scores[i])
-    return closeness, method
+        graph = _model_to_networkx(model)
+        lcc_nodes = max(nx.connected_components(graph), key=len)
+        if len(lcc_nodes) < 2:
+            return closeness, "trivial", exact_quality
+        for i, score in nx.closeness_centrality(graph.subgraph(lcc_nodes), distance="length").items():
+            closeness[i] = score
+        return closeness, "networkx-fallback", exact_quality
+
+    # CSR ของ model เก็บ min length ของ parallel edges ไว้แล้ว — ตัดเหลือ LCC
+    progress("lcc", 0.5, "หา Largest Connected Component")
+    adjacency = csr_matrix((csr["weights"], csr["indices"], csr["indptr"]), shape=(n_all, n_all))
+    _, labels = connected_components(adjacency, directed=False)
+    lcc = np.flatnonzero(labels == np.argmax(np.bincount(labels)))
+    n = len(lcc)
+    if n < 2:
+        return closeness, "trivial", exact_quality
+    adjacency = adjacency[lcc][:, lcc]
+
+    cfg = NETWORK_CONFIG
+    block_bytes = cfg["closeness_block_mb"] * 2**20
+    def on_block(done: int, total: int) -> None:
+        progress("closeness", done / total, f"Dijkstra {done:,}/{total:,}")
+
+    if n <= cfg["closeness_exact_threshold"]:
+        closeness[lcc] = exact_closeness(adjacency, block_bytes=block_bytes, progress=on_block)
+        return closeness, "exact-scipy", {**exact_quality, "pivots": n, "verified": n}
+
+    scores, quality = adaptive_closeness(
+        adjacency,
+        seed=42,
+        batch=cfg["closeness_pivot_batch"],
+        min_pivots=cfg["closeness_min_pivots"],
+        max_pivots=cfg["closeness_max_pivots"],
+        top_k=cfg["closeness_stable_top_k"],
+        tolerance=cfg["closeness_rank_tolerance"],
+        stable_rounds=cfg["closeness_stable_rounds"],
+        verify_max=cfg["closeness_verify_max"],
+        block_bytes=block_bytes,
+        progress=on_block,
+    )
+    closeness[lcc] = scores
+    return closeness, "pivot-adaptive", quality
 
 
 def _compute_centrality_impl(
-    polygon_wkt_str: str, network_type: str = "drive"
+    polygon_wkt_str: str,
+    network_type: str = "drive",
+    fallback_key: Optional[str] = None,
+    progress: Optional[Callable[..., None]] = None,
 ) -> Dict[str, Any]:
     """
-    **Pure** centrality computation — no Streamlit calls.
+    **Pure** centrality computation — no Streamlit calls (runs in the
+    analysis process pool, see :func:`get_analysis_jobs`).
+
+    ``progress(stage, fraction, message)`` is called through the stages of
+    ``NETWORK_ANALYSIS_STAGES``; it may raise ``JobCancelled`` to stop.
 
     Returns a result dict with keys:
     ``edges``, ``nodes``, ``top_node``, ``stats``  — or  ``error``.
     """
-    G, was_cached, error = _fetch_osm_graph(polygon_wkt_str, network_type)
+    progress = progress or (lambda *args: None)
+    progress("download", 0.0, "ตรวจ Cache")
+    G, was_cached, error = _fetch_osm_graph(polygon_wkt_str, network_type, fallback_key, progress)
     if error:
         return {"error": error}
 
@@ -1625,127 +3270,117 @@ def _compute_centrality_impl(
     node_count = len(G.nodes)
     is_large_graph = node_count > NETWORK_CONFIG["large_graph_threshold"]
 
-    G_undir = G.to_undirected()
+    # โมเดล array ชุดเดียวใช้ทุกขั้นตอนด้านล่าง — ไม่ต้องเก็บ networkx graph ไว้อีก
+    progress("lcc", 0.0, f"สร้างโมเดลกราฟ {node_count:,} โหนด")
+    model = build_network_model(G)
+    del G
 
     # Closeness centrality — weighted 1-median บน LCC (แม่น/เสถียร/เร็ว)
-    closeness_cent, closeness_method = compute_weighted_closeness(G_undir)
-    max_close = max(closeness_cent.values()) if closeness_cent else 1.0
+    closeness, closeness_method, closeness_quality = compute_weighted_closeness(model, progress)
+    max_close = float(closeness.max()) if len(closeness) else 1.0
 
-    # Betweenness centrality (on undirected projection)
+    # Betweenness centrality (on undirected projection) — หนึ่งค่าต่อคู่โหนดของ model["csr"]
     # กราฟใหญ่: ประมาณค่าด้วย k-source sampling (เร็วขึ้นหลายสิบเท่า,
     # อันดับความสำคัญของถนนแทบไม่เปลี่ยน) — seed คงที่เพื่อผลซ้ำได้
-    if is_large_graph:
-        k_samples = min(NETWORK_CONFIG["betweenness_k_samples"], node_count)
-        betweenness_cent: Dict[Any, float] = nx.edge_betweenness_centrality(
-            G_undir, k=k_samples, weight="length", seed=42
+    k_samples = min(NETWORK_CONFIG["betweenness_k_samples"], node_count) if is_large_graph else None
+    progress("betweenness", 0.0, f"{k_samples or node_count:,} sources")
+    if HAS_SCIPY:
+        # Brandes แบบ CSR + scipy dijkstra กระจายหลาย process (ผลเท่ากับ networkx)
+        pair_betweenness = edge_betweenness(
+            model["csr"], sample_sources(node_count, k_samples, seed=42),
+            # งานรันพร้อมกันได้ analysis_workers งาน — แบ่ง CPU กัน ไม่ให้แต่ละงานเปิด process เท่าจำนวน CPU
+            workers=NETWORK_CONFIG["betweenness_workers"]
+            or max(1, (os.cpu_count() or 1) // NETWORK_CONFIG["analysis_workers"]),
+            progress=lambda done, total: progress("betweenness", done / total, f"ก้อน {done}/{total}"),
         )
     else:
-        betweenness_cent = nx.edge_betweenness_centrality(G_undir, weight="length")
-    max_bet = max(betweenness_cent.values()) if betweenness_cent else 1.0
+        nx_scores = nx.edge_betweenness_centrality(
+            _model_to_networkx(model), k=k_samples, weight="length", seed=42
+        )
+        pair_betweenness = np.array([
+            nx_scores.get((a, b), nx_scores.get((b, a), 0.0))
+            for a, b in zip(model["csr"]["pair_u"].tolist(), model["csr"]["pair_v"].tolist())
+        ])
+    max_bet = float(pair_betweenness.max()) if len(pair_betweenness) else 1.0
+
+    # ---- Golden land opportunity ranking ----
+    progress("ranking", 0.0, "คำนวณคะแนนรายโหนด")
+    # เก็บ component ต่อโหนดไว้ในผล — ปรับน้ำหนักใน UI แล้วจัดอันดับใหม่ได้ทันที
+    golden_components = golden_land_components(model, closeness, pair_betweenness)
+    golden_weights = dict(NETWORK_CONFIG["golden_land_weights"])
+    golden_spots = compute_golden_land_opportunities(
+        golden_components,
+        golden_weights,
+        top_n=NETWORK_CONFIG["golden_land_top_n"],
+    )
 
     # Public colormap registry (Matplotlib >= 3.5).
     # matplotlib.cm.get_cmap was removed in newer Matplotlib releases.
     cmap_bet = matplotlib.colormaps["plasma"]
 
     # ---- Build edge GeoJSON features ----
-    edges_geojson: List[Dict[str, Any]] = []
-    for u, v, _k, data in G.edges(keys=True, data=True):
-        score = betweenness_cent.get(tuple(sorted((u, v))), 0.0)
-        norm_score = score / max_bet if max_bet > 0 else 0.0
-
-        if "geometry" in data:
-            geom = mapping(data["geometry"])
-        else:
-            geom = {
-                "type": "LineString",
-                "coordinates": [
-                    [G.nodes[u]["x"], G.nodes[u]["y"]],
-                    [G.nodes[v]["x"], G.nodes[v]["y"]],
-                ],
-            }
-
-        edges_geojson.append(
-            {
-                "type": "Feature",
-                "geometry": geom,
-                "properties": {
-                    "type": "road",
-                    "betweenness": norm_score,
-                    "color": colors.to_hex(cmap_bet(norm_score)),
-                    "stroke_weight": (
-                        NETWORK_CONFIG["edge_weight_base"]
-                        + norm_score * NETWORK_CONFIG["edge_weight_multiplier"]
-                    ),
-                },
-            }
+    progress("serialization", 0.0, f"{len(model['edge_u']):,} ถนน")
+    # สี / ความหนา / พิกัดคำนวณทั้งชุดในครั้งเดียว (hex ปัดแบบเดียวกับ matplotlib.colors.to_hex)
+    edge_norm = _edge_values(model, pair_betweenness)
+    edge_norm = edge_norm / max_bet if max_bet > 0 else np.zeros_like(edge_norm)
+    edge_rgb = np.round(np.asarray(cmap_bet(edge_norm))[:, :3] * 255).astype(int).tolist()
+    edge_stroke = NETWORK_CONFIG["edge_weight_base"] + edge_norm * NETWORK_CONFIG["edge_weight_multiplier"]
+    coords, coord_edge = shapely.get_coordinates(model["edge_geoms"], return_index=True)
+    edge_coords = np.split(coords, np.cumsum(np.bincount(coord_edge, minlength=len(edge_norm)))[:-1])
+
+    edges_geojson: List[Dict[str, Any]] = [
+        {
+            "type": "Feature",
+            "geometry": {"type": "LineString", "coordinates": xy.tolist()},
+            "properties": {
+                "type": "road",
+                "betweenness": norm_score,
+                "color": "#{:02x}{:02x}{:02x}".format(*rgb),
+                "stroke_weight": stroke,
+            },
+        }
+        for xy, norm_score, rgb, stroke in zip(
+            edge_coords, edge_norm.tolist(), edge_rgb, edge_stroke.tolist()
         )
+    ]
 
     # ---- Build node GeoJSON features ----
-    nodes_geojson: List[Dict[str, Any]] = []
-    top_node_data: Dict[str, Any] = {"score": -1.0, "lat": 0.0, "lon": 0.0}
-
-    for node, data in G.nodes(data=True):
-        score = closeness_cent.get(node, 0.0)
-        norm_score = score / max_close if max_close > 0 else 0.0
-
-        if score > top_node_data["score"]:
-            top_node_data = {"lat": data["y"], "lon": data["x"], "score": score}
-
-        if norm_score > NETWORK_CONFIG["min_closeness_threshold"]:
-            nodes_geojson.append(
-                {
-                    "type": "Feature",
-                    "geometry": {
-                        "type": "Point",
-                        "coordinates": [data["x"], data["y"]],
-                    },
-                    "properties": {
-                        "type": "intersection",
-                        "closeness": norm_score,
-                        "color": "#000000",
-                        "radius": 2 + norm_score * 6,
-                    },
-                }
-            )
-
-    # ---- Golden land opportunity ranking ----
-    golden_spots = compute_golden_land_opportunities(
-        G,
-        closeness_cent,
-        betweenness_cent,
-        top_n=NETWORK_CONFIG["golden_land_top_n"],
-    )
-    golden_geojson_features: List[Dict[str, Any]] = []
-    for idx, spot in enumerate(golden_spots, start=1):
-        golden_geojson_features.append(
-            {
-                "type": "Feature",
-                "geometry": {
-                    "type": "Point",
-                    "coordinates": [spot["lon"], spot["lat"]],
-                },
-                "properties": {
-                    "type": "golden_spot",
-                    "rank": idx,
-                    "score": round(spot["score"], 4),
-                },
-            }
+    close_norm = closeness / max_close if max_close > 0 else np.zeros(node_count)
+    shown = np.flatnonzero(close_norm > NETWORK_CONFIG["min_closeness_threshold"])
+    nodes_geojson: List[Dict[str, Any]] = [
+        {
+            "type": "Feature",
+            "geometry": {"type": "Point", "coordinates": [lon, lat]},
+            "properties": {
+                "type": "intersection",
+                "closeness": norm_score,
+                "color": "#000000",
+                "radius": 2 + norm_score * 6,
+            },
+        }
+        for lon, lat, norm_score in zip(
+            model["x"][shown].tolist(), model["y"][shown].tolist(), close_norm[shown].tolist()
         )
+    ]
+    top = int(np.argmax(closeness))
+    top_node_data: Dict[str, Any] = {
+        "lat": float(model["y"][top]), "lon": float(model["x"][top]), "score": float(closeness[top]),
+    }
 
     return {
         "edges": {"type": "FeatureCollection", "features": edges_geojson},
         "nodes": {"type": "FeatureCollection", "features": nodes_geojson},
         "golden_spots": golden_spots,
-        "golden_spots_geojson": {
-            "type": "FeatureCollection",
-            "features": golden_geojson_features,
-        },
-        "top_node": top_node_data if top_node_data["score"] != -1.0 else None,
+        "golden_spots_geojson": build_golden_spots_geojson(golden_spots),
+        "golden_components": golden_components,
+        "golden_weights": golden_weights,
+        "top_node": top_node_data,
         "stats": {
-            "nodes_count": len(G.nodes),
-            "edges_count": len(G.edges),
+            "nodes_count": node_count,
+            "edges_count": len(model["edge_u"]),
             "used_approximation": is_large_graph,
             "closeness_method": closeness_method,
+            "closeness_quality": closeness_quality,
             "was_cached": was_cached,
         },
     }
@@ -1755,39 +3390,136 @@ def _compute_centrality_impl(
 # SECTION 4: CACHED WRAPPERS (@st.cache_data)
 # ============================================================================
 
-@st.cache_data(show_spinner=False, ttl=NETWORK_CONFIG["cache_ttl_seconds"])
+@st.cache_resource(show_spinner=False)
+def get_http_session() -> requests.Session:
+    """One pooled ``requests.Session`` shared by all reruns / sessions."""
+    session = requests.Session()
+    adapter = HTTPAdapter(
+        pool_connections=ISOCHRONE_FETCH_CONFIG["pool_size"],
+        pool_maxsize=ISOCHRONE_FETCH_CONFIG["pool_size"],
+    )
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
+
+
 def fetch_api_data_cached(
     api_key: str,
     travel_mode: str,
     ranges_str: str,
-    marker_lat: float,
-    marker_lon: float,
-) -> Tuple[Optional[List[Dict[str, Any]]], Optional[str]]:
-    """Streamlit-cached wrapper around the isochrone API call."""
-    return safe_fetch_isochrone(api_key, travel_mode, ranges_str, marker_lat, marker_lon)
+    points: List[Tuple[float, float]],
+) -> List[Dict[str, Any]]:
+    """
+    Cached, parallel isochrone fetch for many points (order preserved).
+
+    Hits come from the persistent isochrone store on disk (survives restarts,
+    shared by all sessions, shipped in bundle.zip); only the misses are fanned
+    out via :func:`fetch_isochrones_parallel`.  Worker threads never touch
+    ``st.*``.  Each result gains ``"cached": bool``.
+    """
+    keys = [isochrone_cache_key(travel_mode, ranges_str, lat, lon) for lat, lon in points]
+    results: List[Optional[Dict[str, Any]]] = [None] * len(points)
+    misses: List[int] = []
+    for i, key in enumerate(keys):
+        features = load_isochrone_from_cache(key)
+        if features is not None:
+            results[i] = {"features": features, "error": None, "latency_s": 0.0, "cached": True}
+        else:
+            misses.append(i)
+
+    fetched = fetch_isochrones_parallel(
+        api_key, travel_mode, ranges_str, [points[i] for i in misses],
+        session=get_http_session(),
+    )
+    for i, res in zip(misses, fetched):
+        if res["features"] is not None:
+            lat, lon = points[i]
+            save_isochrone_to_cache(
+                keys[i],
+                {"mode": travel_mode, "ranges": ranges_str, "lat": lat, "lon": lon},
+                res["features"],
+            )
+        results[i] = {**res, "cached": False}
+    if misses:
+        evict_isochrone_cache()
+    return results  # type: ignore[return-value]
 
 
-@st.cache_data(show_spinner=False, ttl=NETWORK_CONFIG["cache_ttl_seconds"])
-def union_all_polygons_cached(features_json_str: str) -> str:
+@st.cache_resource(show_spinner=False)
+def get_analysis_jobs() -> JobManager:
+    """
+    Process pool for network analysis — one per server, shared by every
+    session, so a finished analysis of the same area is reused (TTL =
+    ``cache_ttl_seconds``) and concurrent requests attach to one job.
     """
-    Union all polygon features → WKT string.
+    return JobManager(
+        max_workers=NETWORK_CONFIG["analysis_workers"],
+        result_ttl_s=NETWORK_CONFIG["cache_ttl_seconds"],
+        max_results=NETWORK_CONFIG["analysis_result_cache"],
+    )
+
+
+def network_job_key(
+    polygon_wkt_str: str, network_type: str, fallback_key: Optional[str] = None
+) -> str:
+    """Job / result key of one network analysis (area + network type + source graph)."""
+    return f"{get_cache_key(polygon_wkt_str, network_type)}:{fallback_key or ''}"
+
+
+@st.cache_resource(show_spinner=False, max_entries=2)
+def load_offline_network_cached(cache_key: str, network_type: str) -> Optional[Dict[str, Any]]:
+    """Cached graph (memory-mapped columns) → arrays for the offline isochrone engine."""
+    cols = load_graph_columns(cache_key)
+    if cols is None:
+        return None
+    return prepare_offline_network(cols, network_type)
 
-    Takes a JSON **string** so that the argument is hashable for caching.
+
+def fetch_offline_isochrones(
+    travel_mode: str,
+    ranges_str: str,
+    points: List[Tuple[float, float]],
+) -> Tuple[List[Dict[str, Any]], Optional[str], Optional[str]]:
     """
-    features: List[Dict[str, Any]] = json.loads(features_json_str)
-    polys = [shape(f["geometry"]) for f in features]
-    if not polys:
-        return ""
-    combined = unary_union(polys)
-    return combined.wkt
+    Offline counterpart of :func:`fetch_api_data_cached` (same result dicts).
 
+    Returns ``(results, graph_cache_key, error)`` — ``error`` is set when no
+    cached graph of the travel mode's network type covers every point.
+    Candidate graphs are tried smallest first until no isochrone reaches a
+    graph edge; otherwise the one with the fewest clipped points is used and
+    the clipped ranges are reported in each result's ``error``.
+    """
+    network_type = TRAVEL_MODE_TO_NETWORK_TYPE.get(travel_mode, "drive")
+    cache_keys = find_cached_graphs_for_points(points, network_type)
+    if not cache_keys:
+        return [], None, (
+            f"ไม่พบ OSM graph ({network_type}) ใน Cache ที่ครอบคลุมทุกหมุด — "
+            "รัน Network Analysis ด้วย Geoapify ก่อน หรือ import bundle ที่มี cache"
+        )
 
-@st.cache_data(show_spinner=False, ttl=NETWORK_CONFIG["cache_ttl_seconds"])
-def compute_centrality_cached(
-    polygon_wkt_str: str, network_type: str = "drive"
-) -> Dict[str, Any]:
-    """Streamlit-cached wrapper for the pure centrality computation."""
-    return _compute_centrality_impl(polygon_wkt_str, network_type)
+    ranges_s = [int(r) for r in ranges_str.split(",")]
+    best: Optional[Tuple[int, str, list, float]] = None
+    for cache_key in cache_keys[:OFFLINE_ISOCHRONE_CONFIG["max_graphs_tried"]]:
+        net = load_offline_network_cached(cache_key, network_type)
+        if net is None:
+            continue
+        t0 = time.perf_counter()
+        computed = compute_offline_isochrones(net, points, ranges_s, travel_mode)
+        per_point = (time.perf_counter() - t0) / max(1, len(points))
+        n_clipped = sum(1 for _, _, clipped in computed if clipped)
+        if best is None or n_clipped < best[0]:
+            best = (n_clipped, cache_key, computed, per_point)
+        if n_clipped == 0:
+            break
+    if best is None:
+        return [], None, "โหลด OSM graph จาก Cache ไม่สำเร็จ"
+
+    _, cache_key, computed, per_point = best
+    results = [
+        {"features": features, "error": error, "latency_s": per_point, "cached": False}
+        for features, error, _ in computed
+    ]
+    return results, cache_key, None
 
 
 # ------------------------------------------------------------ KML → GeoJSON
@@ -2108,10 +3840,12 @@ def _render_sidebar_network_panel(locked: bool) -> bool:
         cache_stats = get_cache_stats()
         st.markdown("##### 💾 Cache Management")
 
-        if cache_stats["count"] > 0:
+        if cache_stats["count"] > 0 or cache_stats["isochrone_count"] > 0:
             st.caption(
-                f"📊 **{cache_stats['count']} ไฟล์** "
-                f"({cache_stats['size_mb']:.1f} MB)"
+                f"📊 **{cache_stats['count']} กราฟ** "
+                f"({cache_stats['size_mb']:.1f} / {cache_stats['budget_mb']:.0f} MB) | "
+                f"Isochrone **{cache_stats['isochrone_count']}** จุด "
+                f"({cache_stats['isochrone_size_mb']:.1f} MB)"
             )
 
             if st.button(
@@ -2144,10 +3878,12 @@ def _render_sidebar_network_panel(locked: bool) -> bool:
 
 
         st.markdown("---")
+        job = StateManager.get_network_job()
+        job_running = bool(job and not job.get("notice"))
         do_network: bool = st.button(
-            "🚀 Run Network Analysis",
+            "⏳ กำลังวิเคราะห์..." if job_running else "🚀 Run Network Analysis",
             use_container_width=True,
-            disabled=(not can_analyze) or locked,
+            disabled=(not can_analyze) or locked or job_running,
         )
 
         # ---- Network results preview ----
@@ -2163,11 +3899,19 @@ def _render_sidebar_network_panel(locked: bool) -> bool:
             closeness_method_labels = {
                 "exact-scipy": "🧭 Closeness: exact (scipy, ถ่วงน้ำหนักเมตร)",
                 "pivot-approx": "🧭 Closeness: pivot sampling (Eppstein–Wang)",
+                "pivot-adaptive": "🧭 Closeness: adaptive pivot sampling (Eppstein–Wang)",
                 "networkx-fallback": "🧭 Closeness: networkx fallback (ไม่มี scipy)",
             }
             method_label = closeness_method_labels.get(stats.get("closeness_method"))
             if method_label:
                 st.caption(method_label)
+            quality = stats.get("closeness_quality")
+            if quality and stats.get("closeness_method") == "pivot-adaptive":
+                st.caption(
+                    f"📐 {quality['pivots']:,} pivots · error ±{quality['rel_error']:.1%} · "
+                    f"ความมั่นใจ top node {quality['top_confidence']:.0%} "
+                    f"(ตรวจ exact {quality['verified']} ตัวเต็ง)"
+                )
             st.code(f"{top['lat']:.5f}, {top['lon']:.5f}")
 
             if st.button(
@@ -2185,9 +3929,26 @@ def _render_sidebar_network_panel(locked: bool) -> bool:
         if golden_spots:
             st.markdown("---")
             st.markdown("**💎 ทำเลที่ดินทอง (ก่อนคนรู้)**")
+            weights = StateManager.get_golden_weights()
             st.caption(
-                "สมการคะแนน: 0.50×Closeness + 0.30×Degree + 0.20×(1-Betweenness)"
+                f"สมการคะแนน: {weights['closeness']:.2f}×Closeness + "
+                f"{weights['degree']:.2f}×Degree + "
+                f"{weights['low_traffic_bonus']:.2f}×(1-Betweenness)"
             )
+            if net_data.get("golden_components"):
+                with st.popover("⚖️ ปรับน้ำหนักคะแนน", use_container_width=True):
+                    # เปลี่ยนค่าแล้วจัดอันดับใหม่จากผลเดิม (ไม่ต้องรัน Network Analysis ซ้ำ)
+                    for name, label in (
+                        ("closeness", "Closeness"),
+                        ("degree", "Degree"),
+                        ("low_traffic_bonus", "Low traffic (1-Betweenness)"),
+                    ):
+                        st.slider(
+                            label, 0.0, 1.0, step=0.05,
+                            key=StateManager.K_GOLDEN_WEIGHTS[name],
+                            on_change=StateManager.rerank_golden_spots,
+                            disabled=locked,
+                        )
 
             preview_lines = []
             for i, spot in enumerate(golden_spots[:5], start=1):
@@ -2336,6 +4097,15 @@ def _render_sidebar_map_settings(locked: bool) -> None:
         st.checkbox("🚂 แนวรถไฟเชียงของ", key="show_railway", disabled=locked)
 
         st.markdown("##### 🚗 การเดินทาง (Isochrone)")
+        st.radio(
+            "แหล่งข้อมูล",
+            list(ISOCHRONE_SOURCES.keys()),
+            format_func=ISOCHRONE_SOURCES.get,
+            key=StateManager.K_ISOCHRONE_SOURCE,
+            horizontal=True,
+            disabled=locked,
+            help="Offline: คำนวณจาก OSM graph ที่อยู่ใน Cache (ไม่ใช้ API key / อินเทอร์เน็ต)",
+        )
         st.selectbox(
             "โหมด",
             list(TRAVEL_MODE_NAMES.keys()),
@@ -2661,6 +4431,67 @@ def render_map() -> Optional[Dict[str, Any]]:
     )
 
 
+@st.fragment(run_every=NETWORK_CONFIG["analysis_poll_seconds"])
+def render_network_job_status() -> None:
+    """
+    Poll the background network-analysis job of this session: stage progress,
+    cancel button, and — once finished — store the result and rerun the app.
+    Reruns alone every ``analysis_poll_seconds`` so the rest of the page stays usable.
+    """
+    job = StateManager.get_network_job()
+    if not job:
+        return
+
+    if job.get("notice"):
+        kind, message = job["notice"]
+        getattr(st, kind)(message)
+        if st.button("ปิดข้อความ", key="network_job_dismiss"):
+            StateManager.set_network_job(None)
+            st.rerun()
+        return
+
+    jobs = get_analysis_jobs()
+    status = jobs.poll(job["key"], subscriber=StateManager.get_session_id())
+    state = status["state"]
+
+    if state == "done":
+        StateManager.set_network_job(None)
+        notice = _apply_network_result(status["result"])
+        if notice:
+            StateManager.set_network_job({"key": job["key"], "notice": notice})
+        jobs.forget(job["key"])
+        st.rerun()
+
+    if state in ("cancelled", "failed", "missing"):
+        notice = {
+            "cancelled": ("info", "⏹ ยกเลิก Network Analysis แล้ว"),
+            "failed": ("error", f"❌ Processing Error: {status['error']}"),
+            "missing": ("warning", "⚠️ ไม่พบงาน Network Analysis (server อาจรีสตาร์ท) — กรุณารันใหม่"),
+        }[state]
+        StateManager.set_network_job({"key": job["key"], "notice": notice})
+        jobs.forget(job["key"])
+        st.rerun()
+
+    # running / queued — แปลง (stage, fraction) เป็น progress รวมของทั้งงาน
+    if state == "queued" or status["stage"] not in NETWORK_ANALYSIS_STAGES:
+        overall, text = 0.0, "⏳ รอคิว Process Pool..."
+    else:
+        lo, hi, label = NETWORK_ANALYSIS_STAGES[status["stage"]]
+        overall = lo + (hi - lo) * status["fraction"]
+        text = f"{label}" + (f" — {status['message']}" if status["message"] else "")
+    col_bar, col_cancel = st.columns([5, 1])
+    col_bar.progress(overall, text=f"{text} · {status['elapsed_s']:.0f} s")
+    if col_cancel.button("⏹ ยกเลิก", key="network_job_cancel", use_container_width=True):
+        # งานใช้ร่วมกับ session อื่นที่ขอพื้นที่เดียวกัน — ยกเลิกจริงเมื่อ session นี้เป็นคนสุดท้ายที่รออยู่
+        outcome = jobs.cancel(job["key"], subscriber=StateManager.get_session_id())
+        if outcome is not None:
+            StateManager.set_network_job({"key": job["key"], "notice": {
+                "cancelled": ("info", "⏹ ยกเลิก Network Analysis แล้ว"),
+                "detached": ("info", "⏹ หยุดรอผล Network Analysis แล้ว — งานยังรันต่อให้ session อื่นที่รอพื้นที่เดียวกัน"),
+            }[outcome]})
+            st.rerun()
+
+
 def render_header() -> None:
     """หัวเรื่อง + สรุปหลักการของหน้าแบบย่อ."""
     st.markdown("#### 💹 Rent Gradient — Bid-Rent CBD Analysis")
@@ -2702,6 +4533,23 @@ def render_metrics_row() -> None:
     c4.metric("📉 λ (Rent Gradient)", lam_txt)
     c5.metric("½ ราคา ที่ระยะ", half_txt)
 
+    fetch_stats = StateManager.get_isochrone_fetch_stats()
+    if fetch_stats and fetch_stats["requests"]:
+        reqs = fetch_stats["requests"]
+        live = [r for r in reqs if not r["cached"]]
+        parts = [f"⏱️ Isochrone {len(reqs)} จุด ใน {fetch_stats['wall_s']:.2f} s"]
+        if fetch_stats.get("source") == "offline":
+            parts.append("คำนวณ Offline จาก OSM graph ใน Cache")
+        elif live:
+            slowest = max(live, key=lambda r: r["latency_s"])
+            parts.append(
+                f"API {len(live)} ครั้ง (ช้าสุด จุดที่ {slowest['marker']}: "
+                f"{slowest['latency_s']:.2f} s, รวม {sum(r['latency_s'] for r in live):.2f} s)"
+            )
+        if len(live) < len(reqs):
+            parts.append(f"จาก cache {len(reqs) - len(live)} จุด")
+        st.caption(" | ".join(parts))
+
 
 def _build_bid_rent_figure(rent_data: Dict[str, Any]):
     """สร้างกราฟ Bid-Rent Curve (plotly) — โมเดล + จุดตัวอย่างจริง + เส้น d½."""
@@ -3148,8 +4996,9 @@ def perform_calculation(
 ) -> None:
     """Fetch isochrones for all active markers, compute CBD intersection."""
     # ---- Validation ----
+    offline = StateManager.get_isochrone_source() == "offline"
     api_key = StateManager.get_api_key()
-    if not api_key:
+    if not api_key and not offline:
         st.warning("⚠️ กรุณาใส่ API Key")
         return
     if not active_list:
@@ -3166,15 +5015,41 @@ def perform_calculation(
         all_features: List[Dict[str, Any]] = []
         ranges_str = ",".join(str(t * 60) for t in sorted(time_intervals))
         errors: List[str] = []
-
-        for act_idx, (orig_idx, marker) in enumerate(active_list):
-            features, error_msg = fetch_api_data_cached(
-                api_key, travel_mode, ranges_str, marker["lat"], marker["lng"]
+        warnings: List[str] = []
+
+        # ยิงทุกจุดพร้อมกัน (thread pool + session เดียว) — ผลลัพธ์เรียงตาม active_list เดิม
+        # Offline: shortest path ของทุกจุดใน call เดียวบน OSM graph ที่ cache ไว้
+        t0 = time.perf_counter()
+        points = [(marker["lat"], marker["lng"]) for _, marker in active_list]
+        if offline:
+            results, graph_key, offline_error = fetch_offline_isochrones(
+                travel_mode, ranges_str, points
             )
+            if offline_error:
+                st.error(f"❌ {offline_error}")
+                return
+        else:
+            results, graph_key = fetch_api_data_cached(api_key, travel_mode, ranges_str, points), None
+        StateManager.set_offline_graph_key(graph_key)
+        StateManager.set_isochrone_fetch_stats({
+            "source": "offline" if offline else "api",
+            "wall_s": time.perf_counter() - t0,
+            "requests": [
+                {"marker": orig_idx + 1, "latency_s": res["latency_s"],
+                 "cached": res["cached"], "ok": res["error"] is None}
+                for (orig_idx, _), res in zip(active_list, results)
+            ],
+        })
+
+        for act_idx, ((orig_idx, marker), res) in enumerate(zip(active_list, results)):
+            features, error_msg = res["features"], res["error"]
 
             if features is None:
                 errors.append(f"จุดที่ {orig_idx + 1}: {error_msg}")
                 continue
+            if error_msg:
+                # Offline: บางช่วงเวลาไปถึงขอบกราฟใน Cache — แสดงช่วงที่เหลือและแจ้งช่วงที่ถูกตัด
+                warnings.append(f"จุดที่ {orig_idx + 1}: {error_msg}")
 
             for f in features:
                 f["properties"].update(
@@ -3189,6 +5064,8 @@ def perform_calculation(
         # Display collected errors
         for error in errors:
             st.error(error)
+        for warning in warnings:
+            st.warning(f"⚠️ {warning}")
         if not all_features:
             return  # All requests failed
 
@@ -3198,7 +5075,9 @@ def perform_calculation(
         )
 
         # Calculate CBD intersection
-        cbd_geom = calculate_intersection(all_features, len(active_list))
+        cbd_geom = calculate_intersection(
+            all_features, len(active_list), StateManager.get_isochrone_geometries()
+        )
         if cbd_geom:
             StateManager.set_intersection_data(
                 {
@@ -3221,110 +5100,67 @@ def perform_calculation(
         perform_rent_gradient(quiet=True)
 
 
-def _run_network_analysis_with_progress(
-    polygon_wkt_str: str, network_type: str
-) -> Dict[str, Any]:
+def _apply_network_result(result: Dict[str, Any]) -> Optional[Tuple[str, str]]:
     """
-    Thin UI wrapper that shows progress while the **cached** pure function runs.
+    Store a finished analysis in the session (and refresh Rent Heat).
+    Returns a ``(st-function, message)`` notice for failures, else ``None``.
     """
-    progress_bar = st.progress(0)
-    status_container = st.empty()
-
-    try:
-        # Stage 1: Prepare
-        status_container.info("🔍 **Stage 1/3:** กำลังเตรียมข้อมูลพื้นที่...")
-        progress_bar.progress(0.05)
-
-        # Stage 2: Check cache
-        cache_key = get_cache_key(polygon_wkt_str, network_type)
-        is_cached = load_graph_from_cache(cache_key) is not None
-
-        if is_cached:
-            status_container.success("✅ **พบข้อมูลใน Cache!** กำลังโหลด...")
-        else:
-            status_container.warning(
-                "⏳ **กำลังดาวน์โหลดข้อมูลครั้งแรก...** (อาจใช้เวลา 5-10 นาที)"
-            )
-        progress_bar.progress(0.10)
-
-        # Stage 3: Compute
-        status_container.info("🛣️ **Stage 2/3:** กำลังวิเคราะห์โครงข่ายถนน...")
-        progress_bar.progress(0.30)
-
-        result = compute_centrality_cached(polygon_wkt_str, network_type)
-
-        progress_bar.progress(0.90)
-
-        # Stage 4: Report
-        if "error" in result:
-            status_container.error(f"❌ {result['error']}")
-        else:
-            stats = result.get("stats", {})
-            status_container.success(
-                f"✅ **สำเร็จ!** วิเคราะห์ {stats.get('nodes_count', 0):,} โหนด "
-                f"และ {stats.get('edges_count', 0):,} ถนน"
-            )
-        progress_bar.progress(1.0)
-
-    finally:
-        progress_bar.empty()
-        status_container.empty()
+    if "error" in result:
+        return (
+            "error",
+            f"❌ Network Analysis Failed: {result['error']}\n\n"
+            "💡 **Tips:** ลองขยายพื้นที่ · ตรวจว่ามีข้อมูลถนนใน OpenStreetMap · ตรวจการเชื่อมต่ออินเทอร์เน็ต",
+        )
+    StateManager.set_network_data(result)
+    StateManager.rerank_golden_spots()
+    score_info = (
+        f"Score: {result['top_node']['score']:.4f}"
+        if result.get("top_node")
+        else ""
+    )
+    st.toast(f"✅ Analysis Completed! {score_info}", icon="🏆")
 
-    return result
+    # มีโหนดถนนแล้ว — รีเฟรช Rent Gradient เพื่อสร้าง Rent Heat
+    if StateManager.get_rent_data() is not None:
+        perform_rent_gradient(quiet=True)
+    return None
 
 
 def perform_network_analysis() -> None:
-    """Orchestrate the full network analysis pipeline."""
+    """Submit the network analysis as a background job (progress: :func:`render_network_job_status`)."""
     iso_data = StateManager.get_isochrone_data()
     if not iso_data:
         st.error("❌ No Isochrone data found. Please calculate isochrones first.")
         return
 
-    with st.spinner(
-        "กำลังรวมพื้นที่และวิเคราะห์โครงข่ายถนน (OSMnx)... อาจใช้เวลาสักครู่"
-    ):
-        try:
-            # 1. Union all travel polygons
-            feats_json = json.dumps(iso_data.get("features", []))
-            combined_wkt = union_all_polygons_cached(feats_json)
-
-            if not combined_wkt:
-                st.error("❌ No polygons to analyze.")
-                return
-
-            # 2. Run analysis with progress UI
-            net_type = TRAVEL_MODE_TO_NETWORK_TYPE.get(
-                StateManager.get_travel_mode(), "drive"
-            )
-            result = _run_network_analysis_with_progress(combined_wkt, net_type)
-
-            if "error" in result:
-                st.error(f"❌ Network Analysis Failed: {result['error']}")
-                st.info(
-                    "💡 **Tips:**\n"
-                    "- Try a larger area\n"
-                    "- Check if the location has road data in OpenStreetMap\n"
-                    "- Verify internet connection"
-                )
-            else:
-                StateManager.set_network_data(result)
-                score_info = (
-                    f"Score: {result['top_node']['score']:.4f}"
-                    if result.get("top_node")
-                    else ""
-                )
-                st.toast(f"✅ Analysis Completed! {score_info}", icon="🏆")
+    # 1. Union all travel polygons (shared geometry stage — ไม่ parse ซ้ำ)
+    combined = isochrone_union(StateManager.get_isochrone_geometries())
+    combined_wkt = combined.wkt if combined is not None and not combined.is_empty else ""
+    if not combined_wkt:
+        st.error("❌ No polygons to analyze.")
+        return
 
-                # มีโหนดถนนแล้ว — รีเฟรช Rent Gradient เพื่อสร้าง Rent Heat
-                if StateManager.get_rent_data() is not None:
-                    perform_rent_gradient(quiet=True)
+    # 2. Submit to the process pool — ผลเดิมของพื้นที่เดียวกัน (session ใดก็ได้) ใช้ซ้ำทันที
+    net_type = TRAVEL_MODE_TO_NETWORK_TYPE.get(StateManager.get_travel_mode(), "drive")
+    # Offline isochrones → ใช้กราฟเดียวกับที่สร้าง isochrone (ไม่ต้องดาวน์โหลดใหม่)
+    fallback_key = StateManager.get_offline_graph_key()
+    key = network_job_key(combined_wkt, net_type, fallback_key)
+    jobs = get_analysis_jobs()
+    try:
+        state = jobs.submit(
+            key, str(Path(__file__).resolve()), "_compute_centrality_impl",
+            combined_wkt, net_type, fallback_key,
+            subscriber=StateManager.get_session_id(),
+        )
+    except Exception as e:
+        st.error(f"❌ Processing Error: {e}")
+        return
 
-        except Exception as e:
-            st.error(f"❌ Processing Error: {e}")
-            st.info(
-                "💡 If the error persists, try a different location "
-                "or smaller time intervals."
-            )
+    if state == "done":
+        notice = _apply_network_result(jobs.poll(key)["result"])
+        StateManager.set_network_job({"key": key, "notice": notice} if notice else None)
+    else:
+        StateManager.set_network_job({"key": key, "notice": None})
 
 
 def perform_rent_gradient(quiet: bool = False) -> None:
@@ -3342,6 +5178,7 @@ def perform_rent_gradient(quiet: bool = False) -> None:
         StateManager.get_markers(),
         StateManager.get_rent_samples(),
         StateManager.get_rent_unit(),
+        StateManager.get_isochrone_geometries(),
     )
     if "error" in data:
         StateManager.set_rent_data(None)
@@ -3394,6 +5231,7 @@ def main() -> None:
 
     # 1. Initialize State
     StateManager.initialize()
+    StateManager.rerank_golden_spots()  # น้ำหนักจาก config ที่ import มา
 
     # 2. Render Sidebar → capture user intents
     do_calc, do_net, do_rent, active_list = render_sidebar()
@@ -3410,6 +5248,7 @@ def main() -> None:
 
     # 4. Render Header + Metrics + Map + Analytics
     render_header()
+    render_network_job_status()
     render_metrics_row()
     map_output = render_map()
     render_analytics_panel()
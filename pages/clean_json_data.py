@@ -1,6 +1,13 @@
 import streamlit as st
-import json
-import io
+import os
+import shutil
+import tempfile
+import zipfile
+
+from utils.blueprint_minifier import (
+    CHUNK_SIZE, RULE_PRESETS, BlueprintSyntaxError, benchmark_minifier, compile_rules, list_zip_blueprints,
+    minify_batch, minify_blueprint_stream,
+)
 
 # ตั้งค่าหน้าเว็บ
 st.set_page_config(page_title="Make Blueprint Minifier", page_icon="✂️")
@@ -11,74 +18,170 @@ st.markdown("""
 เพื่อให้ไฟล์เล็กลงและแชร์ให้ AI หรือเพื่อนร่วมงานได้ง่ายขึ้น
 """)
 
-# ฟังก์ชันสำหรับลบ key ที่ไม่จำเป็น (Recursive)
-def clean_json_data(obj):
-    if isinstance(obj, dict):
-        # รายชื่อ key ที่ต้องการลบ
-        keys_to_remove = ['interface', 'expect', 'designer', 'restore']
-        
-        # ลบ key ออกจาก dict ปัจจุบัน
-        for key in keys_to_remove:
-            if key in obj:
-                del obj[key]
-        
-        # วนลูปเข้าไปจัดการชั้นถัดไป
-        for key, value in list(obj.items()):
-            clean_json_data(value)
-            
-    elif isinstance(obj, list):
-        # ถ้าเป็น List ให้วนลูปจัดการทุก item
-        for item in obj:
-            clean_json_data(item)
-
-# ส่วนอัปโหลดไฟล์
-uploaded_file = st.file_uploader("อัปโหลดไฟล์ Blueprint (.json)", type=["json"])
-
-if uploaded_file is not None:
-    try:
-        # 1. อ่านไฟล์ต้นฉบับ
-        # อ่าน bytes แล้ว decode เป็น string
-        original_content = uploaded_file.getvalue().decode('utf-8')
-        original_size = len(original_content)
-        
-        # แปลงเป็น Python Object
-        data = json.loads(original_content)
+# ชุดกฎการตัดข้อมูล (Prune Rules) — compile ครั้งเดียวแล้วใช้ซ้ำทุกไฟล์
+with st.expander("⚙️ กฎการตัดข้อมูล (Prune Rules)"):
+    preset = st.selectbox("ชุดกฎ", list(RULE_PRESETS))
+    rules_text = st.text_area(
+        "กฎ (1 บรรทัด = 1 กฎ)", value="\n".join(RULE_PRESETS[preset]), height=160, key=f"rules_{preset}",
+        help="`designer` = key ชื่อนี้ทุกระดับ | `flow[*].metadata.designer` = path (., [*], *, ..) | "
+             "`string>2000` = string ยาวเกิน N bytes | `array>50000` = array ใหญ่เกิน N bytes",
+    )
+rules = tuple(line.strip() for line in rules_text.splitlines() if line.strip() and not line.strip().startswith("#"))
+try:
+    engine = compile_rules(rules)
+except ValueError as e:
+    st.error(f"❌ {e}")
+    st.stop()
 
-        # 2. ทำความสะอาดข้อมูล (Clean)
-        clean_json_data(data)
 
-        # 3. แปลงกลับเป็น JSON แบบ Minified (ลบช่องว่าง)
-        minified_content = json.dumps(data, separators=(',', ':'), ensure_ascii=False)
-        minified_size = len(minified_content)
+def show_rule_stats(stats):
+    """ตาราง bytes ที่ตัดออกต่อกฎ (นับจากไฟล์ต้นฉบับ) — ใช้จูนกฎให้พอดี context ของ LLM"""
+    st.dataframe([{
+        "กฎ": rule, "จำนวนครั้ง": hits, "ตัดออก (KB)": round(n_bytes / 1024, 2),
+    } for rule, (hits, n_bytes) in sorted(stats.items(), key=lambda kv: -kv[1][1])], use_container_width=True)
 
-        # คำนวณเปอร์เซ็นต์ที่ลดลง
-        reduction = ((original_size - minified_size) / original_size) * 100
 
-        # แสดงผลลัพธ์
-        st.success("✅ ลดขนาดไฟล์สำเร็จ!")
-        
-        col1, col2, col3 = st.columns(3)
-        col1.metric("ขนาดเดิม", f"{original_size/1024:.2f} KB")
-        col2.metric("ขนาดใหม่", f"{minified_size/1024:.2f} KB")
-        col3.metric("ลดลง", f"{reduction:.2f}%")
-
-        # ตั้งชื่อไฟล์ใหม่ (เติม _minified ต่อท้าย)
-        original_filename = uploaded_file.name
-        new_filename = original_filename.replace(".json", "_minified.json")
-
-        # ปุ่มดาวน์โหลด
-        st.download_button(
-            label="⬇️ ดาวน์โหลดไฟล์ Minified",
-            data=minified_content,
-            file_name=new_filename,
-            mime="application/json"
-        )
+mode = st.radio("โหมด", ["ไฟล์เดียว", "หลายไฟล์ / ZIP (Batch)"], horizontal=True)
+
+if mode == "ไฟล์เดียว":
+    # ส่วนอัปโหลดไฟล์
+    uploaded_file = st.file_uploader("อัปโหลดไฟล์ Blueprint (.json)", type=["json"])
+
+    if uploaded_file is not None:
+        minified_path = None
+        try:
+            # 1-3. อ่านไฟล์ต้นฉบับทีละ chunk → ตัด key ที่ไม่จำเป็น → เขียน Minified ลงไฟล์ชั่วคราวบนดิสก์
+            uploaded_file.seek(0)
+            rule_stats = {}
+            with tempfile.NamedTemporaryFile(suffix=".json", delete=False) as minified_file:
+                minified_path = minified_file.name
+                original_size, minified_size = minify_blueprint_stream(uploaded_file, minified_file, engine,
+                                                                       stats=rule_stats)
+
+            # คำนวณเปอร์เซ็นต์ที่ลดลง
+            reduction = ((original_size - minified_size) / original_size) * 100
+
+            # แสดงผลลัพธ์
+            st.success("✅ ลดขนาดไฟล์สำเร็จ!")
         
-        # (Optional) แสดงตัวอย่าง JSON บางส่วน
-        with st.expander("ดูตัวอย่างเนื้อหาไฟล์ (500 ตัวอักษรแรก)"):
-            st.code(minified_content[:500] + "...", language="json")
-
-    except json.JSONDecodeError:
-        st.error("❌ ไฟล์ที่อัปโหลดไม่ใช่ JSON ที่ถูกต้อง กรุณาตรวจสอบไฟล์อีกครั้ง")
-    except Exception as e:
-        st.error(f"❌ เกิดข้อผิดพลาด: {e}")
+            col1, col2, col3 = st.columns(3)
+            col1.metric("ขนาดเดิม", f"{original_size/1024:.2f} KB")
+            col2.metric("ขนาดใหม่", f"{minified_size/1024:.2f} KB")
+            col3.metric("ลดลง", f"{reduction:.2f}%")
+            show_rule_stats(rule_stats)
+
+            # ตั้งชื่อไฟล์ใหม่ (เติม _minified ต่อท้าย)
+            original_filename = uploaded_file.name
+            new_filename = original_filename.replace(".json", "_minified.json")
+
+            # ปุ่มดาวน์โหลด (st.download_button รับ BufferedReader — SpooledTemporaryFile ใช้ไม่ได้)
+            with open(minified_path, "rb") as minified_file:
+                st.download_button(
+                    label="⬇️ ดาวน์โหลดไฟล์ Minified",
+                    data=minified_file,
+                    file_name=new_filename,
+                    mime="application/json"
+                )
+
+                # (Optional) แสดงตัวอย่าง JSON บางส่วน
+                with st.expander("ดูตัวอย่างเนื้อหาไฟล์ (500 ตัวอักษรแรก)"):
+                    minified_file.seek(0)
+                    preview = minified_file.read(2000).decode('utf-8', errors='ignore')
+                    st.code(preview[:500] + "...", language="json")
+
+        except BlueprintSyntaxError as e:
+            st.error(f"❌ ไฟล์ที่อัปโหลดไม่ใช่ JSON ที่ถูกต้อง กรุณาตรวจสอบไฟล์อีกครั้ง ({e})")
+        except Exception as e:
+            st.error(f"❌ เกิดข้อผิดพลาด: {e}")
+        finally:
+            if minified_path is not None:
+                os.remove(minified_path)
+
+else:
+    # Batch: รับหลายไฟล์ .json และ/หรือ .zip → Minify ขนานใน Process Pool → ZIP เดียว
+    uploads = st.file_uploader("อัปโหลดไฟล์ Blueprint หลายไฟล์ (.json) หรือ ZIP", type=["json", "zip"],
+                               accept_multiple_files=True)
+    n_workers = st.slider("จำนวน Worker Process", min_value=1, max_value=os.cpu_count() or 1,
+                          value=os.cpu_count() or 1)
+
+    if uploads and st.button("✂️ Minify ทั้งหมด", type="primary"):
+        workdir = tempfile.mkdtemp(prefix="blueprint_batch_")
+        try:
+            # Spool ไฟล์ที่อัปโหลดลงดิสก์ทีละ chunk (ZIP ไม่ต้องแตกไฟล์ — worker stream จาก member ตรง)
+            sources, seen = [], set()
+            for i, up in enumerate(uploads):
+                path = os.path.join(workdir, f"in_{i}_{os.path.basename(up.name)}")
+                up.seek(0)
+                with open(path, "wb") as f:
+                    shutil.copyfileobj(up, f, CHUNK_SIZE)
+                if up.name.lower().endswith(".zip"):
+                    entries = [(f"{os.path.splitext(up.name)[0]}/{m}", m) for m in list_zip_blueprints(path)]
+                else:
+                    entries = [(up.name, None)]
+                for name, member in entries:
+                    unique, k = name, 1
+                    while unique in seen:
+                        k += 1
+                        unique = f"{os.path.splitext(name)[0]} ({k}).json"
+                    seen.add(unique)
+                    sources.append((unique, path, member))
+
+            if not sources:
+                st.warning("⚠️ ไม่พบไฟล์ .json ในสิ่งที่อัปโหลด")
+            else:
+                progress = st.progress(0.0, text="กำลัง Minify...")
+
+                def on_result(done, total, row):
+                    progress.progress(done / total, text=f"{done}/{total} — {row['name']}")
+
+                out_zip_path = os.path.join(workdir, "blueprints_minified.zip")
+                rule_stats = {}
+                with open(out_zip_path, "w+b") as out_zip:
+                    rows = minify_batch(sources, out_zip, workdir, rules=rules, max_workers=n_workers,
+                                        on_result=on_result, stats=rule_stats)
+
+                ok = [r for r in rows if r["error"] is None]
+                total_in = sum(r["bytes_in"] for r in ok)
+                total_out = sum(r["bytes_out"] for r in ok)
+                col1, col2, col3, col4 = st.columns(4)
+                col1.metric("ไฟล์สำเร็จ", f"{len(ok)}/{len(rows)}")
+                col2.metric("ขนาดเดิมรวม", f"{total_in/1024:.2f} KB")
+                col3.metric("ขนาดใหม่รวม", f"{total_out/1024:.2f} KB")
+                col4.metric("ลดลง", f"{(total_in - total_out) / total_in * 100 if total_in else 0:.2f}%")
+
+                st.dataframe([{
+                    "ไฟล์": r["name"],
+                    "ขนาดเดิม (KB)": round(r["bytes_in"] / 1024, 2),
+                    "ขนาดใหม่ (KB)": round(r["bytes_out"] / 1024, 2),
+                    "ลดลง (%)": round(r["reduction_pct"], 2),
+                    "สถานะ": "✅" if r["error"] is None else f"❌ {r['error']}",
+                } for r in rows], use_container_width=True)
+                show_rule_stats(rule_stats)
+
+                # st.download_button รับ BufferedReader — SpooledTemporaryFile ใช้ไม่ได้
+                with open(out_zip_path, "rb") as out_zip:
+                    st.download_button(
+                        label="⬇️ ดาวน์โหลด ZIP (Minified ทั้งหมด)",
+                        data=out_zip,
+                        file_name="blueprints_minified.zip",
+                        mime="application/zip"
+                    )
+        except zipfile.BadZipFile:
+            st.error("❌ ไฟล์ ZIP เสียหายหรือไม่ใช่ ZIP")
+        except Exception as e:
+            st.error(f"❌ เกิดข้อผิดพลาด: {e}")
+        finally:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+# Benchmark: วัด Throughput / Peak Memory ของ Streaming Minifier กับไฟล์สังเคราะห์ขนาดใหญ่
+with st.expander("🧪 Benchmark (Synthetic Blueprint)"):
+    bench_mb = st.slider("ขนาดไฟล์สังเคราะห์ (MB)", min_value=10, max_value=500, value=100, step=10)
+    if st.button("▶️ รัน Benchmark"):
+        with st.spinner(f"กำลังสร้างและ minify ไฟล์ {bench_mb} MB..."):
+            res = benchmark_minifier(bench_mb, rules=rules)
+        b1, b2, b3, b4 = st.columns(4)
+        b1.metric("Input", f"{res['bytes_in']/1048576:.1f} MB")
+        b2.metric("Output", f"{res['bytes_out']/1048576:.1f} MB")
+        b3.metric("Throughput", f"{res['mb_per_s']:.1f} MB/s")
+        b4.metric("Peak RSS (Process)", f"{res['peak_rss_bytes']/1048576:.0f} MB" if res['peak_rss_bytes'] else "n/a")
+        st.caption(f"{res['modules']:,} modules | {res['seconds']:.2f} s | Peak RSS รวมทั้ง Streamlit server ไม่ใช่เฉพาะ Minifier")
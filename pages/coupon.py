@@ -1,10 +1,54 @@
+import uuid
+
 import streamlit as st
 import pandas as pd
-import requests
+
+from utils.coupon_db import BASE_URL, CouponDB, match_filter, parse_coupon_csv, records_to_frame_data
+from utils.coupon_mirror import CouponMirror
 
 st.set_page_config(page_title="ระบบจัดการคูปอง", page_icon="🎫", layout="wide")
 
-BASE_URL = "https://smart-washer-a830b-default-rtdb.asia-southeast1.firebasedatabase.app/coupons"
+
+# Client ตัวเดียวต่อ process (requests.Session + connection pool + retry)
+@st.cache_resource
+def get_db():
+    return CouponDB(BASE_URL)
+
+
+# Mirror ของ /coupons ใน memory (อัปเดตผ่าน streaming) — หนึ่งตัวต่อ process และใช้ร่วมกันทุก session
+# แต่ละ session ลงชื่อ (subscribe) ด้วย id ของตัวเอง; stream หยุดเมื่อไม่เหลือ session ที่เปิด toggle อยู่
+@st.cache_resource
+def get_mirror():
+    return CouponMirror(BASE_URL)
+
+
+def on_mirror_toggle():
+    # ปิด toggle → session นี้เลิกอ่านจาก mirror; stream หยุดจริงเมื่อเป็น session สุดท้ายที่ใช้อยู่
+    if not st.session_state["use_mirror"]:
+        get_mirror().unsubscribe(st.session_state["mirror_subscriber"])
+
+
+db = get_db()
+st.session_state.setdefault("mirror_subscriber", uuid.uuid4().hex)
+
+with st.sidebar:
+    use_mirror = st.toggle("⚡ Local mirror (Realtime stream)", value=False, key="use_mirror",
+                           on_change=on_mirror_toggle,
+                           help="โหลด /coupons ครั้งเดียวแล้วรับเฉพาะการเปลี่ยนแปลงผ่าน streaming — "
+                                "เช็คซ้ำ / ตาราง / ตัวกรองสถานะ ตอบจาก memory "
+                                "(ปิด = session นี้เลิกใช้ — stream หยุดเมื่อไม่มี session ไหนเปิดไว้)")
+    mirror = None
+    if use_mirror:
+        mirror = get_mirror().subscribe(st.session_state["mirror_subscriber"])
+        if not mirror.ready.is_set():
+            mirror.wait_ready(timeout=10)
+        if mirror.connected:
+            st.success(f"🟢 Mirror พร้อม — {len(mirror):,} ใบ | {mirror.stats['events']:,} events")
+        else:
+            st.warning(f"🟠 Mirror กำลังเชื่อมต่อใหม่ (ครั้งที่ {mirror.stats['reconnects']}) — ใช้ Firebase โดยตรงแทน")
+            if mirror.stats["last_error"]:
+                st.caption(mirror.stats["last_error"])
+            mirror = None   # stream หลุด / ยังไม่ได้ seed ของ connection นี้ — ข้อมูลอาจค้าง อย่าตอบจาก mirror
 
 # --- ฟังก์ชันจัดการฐานข้อมูล Firebase ---
 
@@ -25,26 +69,19 @@ def create_repdigits_only(value, status):
         generated_list.append(code)
 
     try:
-        response = requests.patch(f"{BASE_URL}.json", json=data_payload)
-        response.raise_for_status()
+        db.patch(data_payload)
         return True, generated_list
     except Exception as e:
         return False, str(e)
 
 # 2. ฟังก์ชันเพิ่มคูปองแบบ Manual (เพิ่มระบบเช็คซ้ำ)
 def add_manual_coupon(code, value, status):
-    # เช็คก่อนว่ามีรหัสนี้ในระบบหรือยัง
-    try:
-        check_response = requests.get(f"{BASE_URL}/{code}.json")
-        check_response.raise_for_status()
-        
-        # ถ้า Firebase ส่งข้อมูลกลับมา (ไม่ใช่ None) แปลว่ามีรหัสนี้อยู่แล้ว
-        if check_response.json() is not None:
-            return False, "❌ มีรหัสคูปองนี้ในระบบแล้ว (ไม่สามารถบันทึกทับได้)"
-    except Exception as e:
-        return False, f"เกิดข้อผิดพลาดในการตรวจสอบข้อมูล: {str(e)}"
+    duplicate_msg = "❌ มีรหัสคูปองนี้ในระบบแล้ว (ไม่สามารถบันทึกทับได้)"
+    # เช็คเร็วจาก mirror ก่อน (ถ้าเปิดไว้) — การเช็คจริงอยู่ที่ conditional write ด้านล่าง
+    if mirror is not None and code in mirror:
+        return False, duplicate_msg
 
-    # ถ้าไม่มีข้อมูลซ้ำ ให้ดำเนินการบันทึก
+    # บันทึกแบบ atomic: PUT เฉพาะเมื่อยังไม่มีรหัสนี้ (if-match null_etag) — ไม่มีช่องว่างระหว่างเช็คกับเขียน
     current_time = pd.Timestamp.now().strftime("%Y-%m-%d %H:%M:%S")
     data_payload = {
         "status": status,
@@ -53,8 +90,8 @@ def add_manual_coupon(code, value, status):
         "type": "manual"
     }
     try:
-        response = requests.put(f"{BASE_URL}/{code}.json", json=data_payload)
-        response.raise_for_status()
+        if not db.create(code, data_payload):
+            return False, duplicate_msg
         return True, "บันทึกข้อมูลสำเร็จ"
     except Exception as e:
         return False, str(e)
@@ -62,8 +99,7 @@ def add_manual_coupon(code, value, status):
 # 3. ฟังก์ชันลบคูปอง (ทีละรายการ)
 def delete_coupon(code):
     try:
-        response = requests.delete(f"{BASE_URL}/{code}.json")
-        response.raise_for_status()
+        db.delete(code)
         return True, "ลบข้อมูลสำเร็จ"
     except Exception as e:
         return False, str(e)
@@ -72,18 +108,40 @@ def delete_coupon(code):
 def delete_all_coupons():
     try:
         # ลบข้อมูลที่ Node /coupons ทั้งหมด
-        response = requests.delete(f"{BASE_URL}.json")
-        response.raise_for_status()
+        db.delete()
         return True, "ล้างข้อมูลคูปองทั้งหมดเรียบร้อยแล้ว"
     except Exception as e:
         return False, str(e)
 
+# 5. ฟังก์ชันเลือกคูปองตามเงื่อนไข (indexed query หรือ mirror) และลบเป็นชุดด้วย multi-path PATCH ค่า null
+def select_coupons_by_filter(**criteria):
+    try:
+        if mirror is not None:
+            return True, {c: r for c, r in mirror.select().items() if match_filter(r, **criteria)}
+        return True, db.select(**criteria)
+    except Exception as e:
+        return False, str(e)
+
+def delete_coupons_bulk(codes, workers, on_chunk=None):
+    try:
+        return True, db.delete_many(codes, workers=workers, on_chunk=on_chunk)
+    except Exception as e:
+        return False, str(e)
+
+# 6. ฟังก์ชันนำเข้าคูปองจำนวนมากจาก CSV (เช็คซ้ำด้วย shallow listing ครั้งเดียว + multi-path PATCH เป็น chunk)
+def bulk_import_coupons(rows, workers, on_chunk=None):
+    try:
+        return True, db.bulk_import(rows, workers=workers, on_chunk=on_chunk)
+    except Exception as e:
+        return False, str(e)
+
 
 # --- ส่วนหน้าจอใช้งานหลัก (UI) ---
 st.title("🎫 ระบบจัดการคูปอง (Firebase)")
 st.markdown("---")
 
-tab1, tab2, tab3 = st.tabs(["🎰 สร้างเลขตอง (Auto)", "➕ เพิ่มคูปองเอง (Manual Add)", "🗑️ ลบคูปอง (Delete)"])
+tab1, tab2, tab3, tab4 = st.tabs(["🎰 สร้างเลขตอง (Auto)", "➕ เพิ่มคูปองเอง (Manual Add)", "🗑️ ลบคูปอง (Delete)",
+                                  "📥 นำเข้า CSV (Bulk Import)"])
 
 # ----- TAB 1: สร้างเลขตอง -----
 with tab1:
@@ -173,6 +231,127 @@ with tab3:
                 else:
                     st.error("⚠️ กรุณาติ๊กถูกที่ช่อง 'ฉันเข้าใจและยืนยัน' ก่อนทำการลบทั้งหมด")
 
+    # ส่วนที่ 3: ลบตามเงื่อนไข (ดูตัวอย่างก่อนลบจริงเสมอ)
+    st.markdown("---")
+    st.subheader("🧹 ลบตามเงื่อนไข")
+    with st.form("delete_filter_form"):
+        fcol1, fcol2, fcol3, fcol4 = st.columns(4)
+        with fcol1:
+            f_status = st.selectbox("สถานะ", ["(ทั้งหมด)", "active", "vip", "used"])
+        with fcol2:
+            f_type = st.selectbox("ประเภท", ["(ทั้งหมด)", "manual", "vip_repdigit", "bulk_import"])
+        with fcol3:
+            f_use_value = st.checkbox("กรองมูลค่า (บาท)")
+            f_value = st.slider("ช่วงมูลค่า", 0, 10000, (0, 100), step=10, label_visibility="collapsed")
+        with fcol4:
+            f_use_date = st.checkbox("กรองวันที่สร้าง")
+            today = pd.Timestamp.now().date()
+            f_dates = st.date_input("ช่วงวันที่", (today - pd.Timedelta(days=30), today), label_visibility="collapsed")
+        submit_preview = st.form_submit_button("🔍 ดูตัวอย่าง (Dry run)")
+
+        if submit_preview:
+            criteria = {
+                "status": None if f_status == "(ทั้งหมด)" else f_status,
+                "coupon_type": None if f_type == "(ทั้งหมด)" else f_type,
+                "value_range": f_value if f_use_value else None,
+                "time_range": None,
+            }
+            if f_use_date and len(f_dates) == 2:
+                criteria["time_range"] = (f"{f_dates[0]:%Y-%m-%d} 00:00:00", f"{f_dates[1]:%Y-%m-%d} 23:59:59")
+            if not any(criteria.values()):
+                st.warning("⚠️ กรุณาเลือกเงื่อนไขอย่างน้อยหนึ่งข้อ (ถ้าต้องการลบทั้งหมดให้ใช้ 'ล้างข้อมูลทั้งหมด')")
+                st.session_state.delete_preview = None
+            else:
+                with st.spinner("กำลังค้นหาคูปองที่ตรงเงื่อนไข..."):
+                    success, result = select_coupons_by_filter(**criteria)
+                if success:
+                    st.session_state.delete_preview = result
+                else:
+                    st.session_state.delete_preview = None
+                    st.error(f"เกิดข้อผิดพลาด: {result}")
+
+    preview = st.session_state.get("delete_preview")
+    if preview is not None:
+        if not preview:
+            st.info("ไม่พบคูปองที่ตรงเงื่อนไข")
+        else:
+            st.warning(f"พบ **{len(preview):,}** ใบที่ตรงเงื่อนไข (แสดงสูงสุด 200 รายการ)")
+            sample = dict(list(preview.items())[:200])
+            st.dataframe(pd.DataFrame(records_to_frame_data(sample)), use_container_width=True, hide_index=True)
+            dcol1, dcol2 = st.columns([1, 2])
+            with dcol1:
+                del_workers = st.number_input("จำนวน request พร้อมกัน", value=2, min_value=1, max_value=8,
+                                              key="delete_workers")
+            with dcol2:
+                confirm_bulk = st.checkbox(f"ยืนยันลบ {len(preview):,} ใบตามรายการด้านบน (ไม่สามารถกู้คืนได้)")
+            if st.button(f"🗑️ ลบ {len(preview):,} ใบ", type="primary", disabled=not confirm_bulk):
+                progress = st.progress(0.0, text="กำลังลบ...")
+
+                def on_delete_chunk(done, total, written):
+                    progress.progress(done / total, text=f"chunk {done}/{total} — ลบแล้ว {written:,} ใบ")
+
+                success, report = delete_coupons_bulk(list(preview), int(del_workers), on_delete_chunk)
+                st.session_state.delete_preview = None
+                if success:
+                    st.success(f"✅ ลบแล้ว {report['written']:,} ใบ ใน {report['seconds']:.2f} วินาที "
+                               f"({report['chunks']} chunk)")
+                    if report["failed"]:
+                        st.error(f"❌ ลบไม่สำเร็จ {len(report['failed']):,} ใบ")
+                        st.dataframe(pd.DataFrame(report["failed"], columns=["code", "error"]), hide_index=True)
+                else:
+                    st.error(f"เกิดข้อผิดพลาด: {report}")
+
+# ----- TAB 4: นำเข้าคูปองจำนวนมากจาก CSV -----
+with tab4:
+    st.subheader("นำเข้าคูปองจำนวนมากจากไฟล์ CSV")
+    st.info("CSV ต้องมีคอลัมน์ `code` (จำเป็น) และอาจมี `value`, `status`, `type` — ถ้าไม่มีจะใช้ค่าด้านล่าง "
+            "| รหัสที่มีอยู่แล้วในระบบจะถูกข้าม (ไม่บันทึกทับ)")
+    with st.form("bulk_import_form"):
+        csv_file = st.file_uploader("ไฟล์ CSV", type=["csv"])
+        col1, col2, col3 = st.columns(3)
+        with col1:
+            val_bulk = st.number_input("มูลค่าเริ่มต้น (บาท)", value=100, min_value=0, key="val_bulk")
+        with col2:
+            stat_bulk = st.selectbox("สถานะเริ่มต้น", ["active", "vip", "used"], key="stat_bulk")
+        with col3:
+            workers_bulk = st.number_input("จำนวน request พร้อมกัน", value=4, min_value=1, max_value=16, key="workers_bulk")
+        submit_bulk = st.form_submit_button("📥 นำเข้าคูปอง")
+
+        if submit_bulk:
+            if csv_file is None:
+                st.warning("⚠️ กรุณาเลือกไฟล์ CSV")
+            else:
+                try:
+                    rows, invalid = parse_coupon_csv(csv_file.getvalue(), val_bulk, stat_bulk)
+                except ValueError as e:
+                    st.error(f"❌ {e}")
+                    rows, invalid = [], []
+                if rows:
+                    progress = st.progress(0.0, text="กำลังบันทึก...")
+
+                    def on_chunk(done, total, written):
+                        progress.progress(done / total, text=f"chunk {done}/{total} — บันทึกแล้ว {written:,} ใบ")
+
+                    success, report = bulk_import_coupons(rows, int(workers_bulk), on_chunk)
+                    if success:
+                        c1, c2, c3, c4 = st.columns(4)
+                        c1.metric("บันทึกสำเร็จ", f"{report['written']:,}")
+                        c2.metric("มีอยู่แล้ว (ข้าม)", f"{len(report['existing']):,}")
+                        c3.metric("ล้มเหลว", f"{len(report['failed']):,}")
+                        c4.metric("Throughput", f"{report['rate']:,.0f} ใบ/วินาที")
+                        st.caption(f"{report['chunks']} chunk | {report['seconds']:.2f} วินาที")
+                        if report["failed"]:
+                            st.error("❌ รหัสที่บันทึกไม่สำเร็จ")
+                            st.dataframe(pd.DataFrame(report["failed"], columns=["code", "error"]), hide_index=True)
+                        if report["existing"]:
+                            with st.expander(f"รหัสที่มีอยู่แล้ว ({len(report['existing']):,})"):
+                                st.write(report["existing"])
+                    else:
+                        st.error(f"เกิดข้อผิดพลาด: {report}")
+                if invalid:
+                    st.warning(f"⚠️ ข้าม {len(invalid):,} บรรทัดที่ไม่ถูกต้อง")
+                    st.dataframe(pd.DataFrame(invalid, columns=["บรรทัด", "code", "เหตุผล"]), hide_index=True)
+
 # --- ส่วนแสดงผลข้อมูลในระบบ ---
 st.markdown("---")
 col_header1, col_header2 = st.columns([4, 1])
@@ -180,33 +359,56 @@ with col_header1:
     st.subheader("📦 ข้อมูลคูปองล่าสุดในระบบ")
 with col_header2:
     if st.button("🔄 รีเฟรชข้อมูล", use_container_width=True):
+        db.invalidate()
         st.rerun()
 
-# ดึงข้อมูลมาแสดง
+# ดึงข้อมูลมาแสดงทีละหน้า (orderBy="$key" + limitToFirst/startAt) — ผลลัพธ์ถูก cache ไว้สั้นๆ และล้างเมื่อมีการเขียน
+if "coupon_page_cursors" not in st.session_state:
+    st.session_state.coupon_page_cursors = [None]   # cursor ของแต่ละหน้า (None = หน้าแรก)
+
+def reset_coupon_pages():
+    st.session_state.coupon_page_cursors = [None]
+
+
 try:
-    r = requests.get(f"{BASE_URL}.json")
-    data = r.json()
-    
-    if data:
-        items = []
-        if isinstance(data, dict):
-            for k, v in data.items():
-                if isinstance(v, dict):
-                    v['code'] = k
-                    items.append(v)
-        
-        if items:
-            df = pd.DataFrame(items)
-            # ย้าย code มาคอลัมน์แรก
-            cols = df.columns.tolist()
-            if 'code' in cols:
-                cols.insert(0, cols.pop(cols.index('code')))
-                df = df[cols]
-                
-            st.dataframe(df, use_container_width=True, hide_index=True)
+    if mirror is not None:
+        # ตอบจาก mirror ใน memory — กรองตามสถานะได้โดยไม่ต้องยิง query ใหม่
+        statuses = st.multiselect("กรองตามสถานะ", ["active", "vip", "used"], key="coupon_status_filter",
+                                  on_change=reset_coupon_pages) or None
+
+        def fetch_page(size, cursor):
+            return mirror.list_page(size, cursor, statuses)
+        total = mirror.count(statuses)
+    else:
+        fetch_page = db.list_page
+        total = db.count()
+    if total:
+        page_size = st.selectbox("จำนวนต่อหน้า", [25, 50, 100, 250], index=1, key="coupon_page_size",
+                                 on_change=reset_coupon_pages)
+        cursors = st.session_state.coupon_page_cursors
+        page, next_cursor = fetch_page(page_size, cursors[-1])
+        if not page and len(cursors) > 1:
+            # หน้าปัจจุบันว่าง (เช่น ถูกลบไปแล้ว) — กลับไปหน้าแรก
+            cursors[:] = [None]
+            page, next_cursor = fetch_page(page_size, None)
+
+        if page:
+            st.dataframe(pd.DataFrame(records_to_frame_data(page)), use_container_width=True, hide_index=True)
         else:
             st.warning("รูปแบบข้อมูลไม่ถูกต้อง")
+
+        nav1, nav2, nav3 = st.columns([1, 2, 1])
+        with nav1:
+            if st.button("◀️ ก่อนหน้า", disabled=len(cursors) == 1, use_container_width=True):
+                cursors.pop()
+                st.rerun()
+        with nav2:
+            st.caption(f"หน้า {len(cursors):,} / {max(1, -(-total // page_size)):,} — ทั้งหมด {total:,} ใบ")
+        with nav3:
+            if st.button("ถัดไป ▶️", disabled=next_cursor is None, use_container_width=True):
+                cursors.append(next_cursor)
+                st.rerun()
     else:
         st.info("ยังไม่มีข้อมูลในระบบ")
-except:
+except Exception:
     st.error("เชื่อมต่อฐานข้อมูลไม่ได้ โปรดตรวจสอบอินเทอร์เน็ตหรือ URL ของ Firebase")
@@ -1,9 +1,10 @@
 import streamlit as st
-import mpy_cross
-import subprocess
 import os
-import tempfile
-import shutil
+
+from utils.mpy_build import (
+    EMIT_CHOICES, MARCH_CHOICES, OPT_LEVELS, build_variants, collect_project_sources, compile_batch,
+    compile_matrix, compile_source, mpy_cross_version,
+)
 
 st.set_page_config(page_title="MPY Converter", page_icon="⚡")
 
@@ -17,66 +18,160 @@ with st.sidebar:
     1. **เช็คเวอร์ชัน:** ตรวจสอบว่าบอร์ด MicroPython ของคุณรองรับ `.mpy` เวอร์ชันไหน
        (แอพนี้ใช้ `mpy-cross` เวอร์ชันล่าสุดที่ติดตั้งใน requirements.txt)
     2. **การใช้งาน:** อัปโหลดไฟล์ `.py` แล้วกดแปลง ระบบจะให้ดาวน์โหลดไฟล์ `.mpy` ทันที
-    3. **ความปลอดภัย:** ไฟล์จะถูกลบทันทีหลังการประมวลผล
+    3. **Batch:** อัปโหลดหลายไฟล์ `.py` หรือ ZIP ของทั้งโปรเจกต์ จะได้ ZIP ของ `.mpy` กลับมา
+    4. **Build Matrix:** เลือกหลาย target (`-march`, `-O`, emit) เพื่อ compile ทุก variant พร้อมกันในครั้งเดียว
+    5. **Cache:** ไฟล์ที่เคยแปลงแล้ว (เนื้อหา + เวอร์ชัน + flags เดิม) จะใช้ผลลัพธ์เดิมทันที
     """)
     
-    # แสดงเวอร์ชัน mpy-cross ที่กำลังรันอยู่
+    # แสดงเวอร์ชัน mpy-cross ที่กำลังรันอยู่ (เรียกครั้งเดียวต่อ process)
     try:
-        version_check = subprocess.run([mpy_cross.mpy_cross, "--version"], capture_output=True, text=True)
-        st.info(f"Current mpy-cross version:\n{version_check.stdout}")
+        st.info(f"Current mpy-cross version:\n{mpy_cross_version()}")
     except Exception as e:
         st.error(f"Error checking version: {e}")
 
 # --- Main App ---
 
-uploaded_file = st.file_uploader("อัปโหลดไฟล์ Python (.py)", type=["py"])
-
-if uploaded_file is not None:
-    # สร้างปุ่มกดเพื่อเริ่มแปลง
-    if st.button("แปลงเป็น .mpy", type="primary"):
-        
-        # สร้าง Temporary Directory เพื่อความสะอาดและปลอดภัย
-        with tempfile.TemporaryDirectory() as tmpdirname:
-            
-            # 1. บันทึกไฟล์ที่อัปโหลดลง Temp
-            input_path = os.path.join(tmpdirname, uploaded_file.name)
-            with open(input_path, "wb") as f:
-                f.write(uploaded_file.getbuffer())
-            
-            # 2. เตรียมคำสั่ง mpy-cross
-            # โดยปกติ output จะชื่อเดียวกับ input แต่เปลี่ยนนามสกุล
+mode = st.radio("โหมด", ["ไฟล์เดียว", "ทั้งโปรเจกต์ / ZIP (Batch)", "Build Matrix (หลาย Target)"], horizontal=True)
+
+if mode == "ไฟล์เดียว":
+    uploaded_file = st.file_uploader("อัปโหลดไฟล์ Python (.py)", type=["py"])
+
+    if uploaded_file is not None:
+        # สร้างปุ่มกดเพื่อเริ่มแปลง
+        if st.button("แปลงเป็น .mpy", type="primary"):
             output_filename = os.path.splitext(uploaded_file.name)[0] + ".mpy"
-            output_path = os.path.join(tmpdirname, output_filename)
-            
-            # 3. รันคำสั่งแปลงไฟล์
-            # เรียกใช้ binary ของ mpy-cross ผ่าน package mpy_cross โดยตรง
-            cmd = [mpy_cross.mpy_cross, input_path]
-            
             try:
-                result = subprocess.run(cmd, capture_output=True, text=True)
-                
-                if result.returncode == 0:
-                    st.success(f"✅ แปลงไฟล์สำเร็จ: {output_filename}")
-                    
-                    # 4. อ่านไฟล์ผลลัพธ์เพื่อเตรียมให้ดาวน์โหลด
-                    with open(output_path, "rb") as f:
-                        mpy_data = f.read()
-                        
+                result = compile_source(uploaded_file.getvalue(), uploaded_file.name)
+
+                if result["error"] is None:
+                    st.success(f"✅ แปลงไฟล์สำเร็จ: {output_filename}"
+                               + (" (จาก cache)" if result["cached"] else ""))
+
                     st.download_button(
                         label="⬇️ ดาวน์โหลดไฟล์ .mpy",
-                        data=mpy_data,
+                        data=result["mpy"],
                         file_name=output_filename,
                         mime="application/octet-stream"
                     )
-                    
+
                 else:
                     st.error("❌ เกิดข้อผิดพลาดในการแปลงไฟล์")
-                    st.code(result.stderr) # แสดง Error จาก mpy-cross
-                    
+                    st.code(result["error"]) # แสดง Error จาก mpy-cross
+
             except Exception as e:
                 st.error(f"An error occurred: {e}")
 
+        st.warning("⚠️ หมายเหตุ: ไฟล์ .mpy ต้องใช้กับ MicroPython เวอร์ชันที่ตรงกัน (Major/Minor version) มิฉะนั้นจะเกิด Error 'incompatible .mpy file' บนบอร์ด")
+
+    else:
+        st.info("กรุณาอัปโหลดไฟล์ .py เพื่อเริ่มต้น")
+
+elif mode == "ทั้งโปรเจกต์ / ZIP (Batch)":
+    uploads = st.file_uploader("อัปโหลดไฟล์ .py หลายไฟล์ หรือ ZIP ของโปรเจกต์", type=["py", "zip"],
+                               accept_multiple_files=True)
+    keep_entry = st.checkbox("คง boot.py / main.py เป็น .py (บอร์ดต้องรันไฟล์เหล่านี้เป็น source)", value=True)
+
+    if uploads and st.button("แปลงทั้งหมดเป็น .mpy", type="primary"):
+        try:
+            sources = collect_project_sources([(up.name, up.getvalue()) for up in uploads])
+            progress = st.progress(0.0, text="กำลังแปลง...")
+
+            def on_result(done, total, row):
+                progress.progress(done / total, text=f"{done}/{total} — {row['name']}")
+
+            zip_bytes, rows = compile_batch(sources, keep_entry_points=keep_entry, on_result=on_result)
+
+            if not rows:
+                st.warning("⚠️ ไม่พบไฟล์ .py ในสิ่งที่อัปโหลด")
+            else:
+                failed = [r for r in rows if r["error"]]
+                col1, col2, col3 = st.columns(3)
+                col1.metric("ไฟล์", len(rows))
+                col2.metric("จาก Cache", sum(1 for r in rows if r["cached"]))
+                col3.metric("ผิดพลาด", len(failed))
+
+                st.dataframe([{
+                    "ไฟล์": r["name"], "ผลลัพธ์": r["output"],
+                    ".py (bytes)": r["size_py"], ".mpy (bytes)": r["size_mpy"],
+                    "Cache": "✅" if r["cached"] else ("—" if r["cached"] is None else ""),
+                } for r in rows], use_container_width=True)
+                for r in failed:
+                    st.error(f"❌ {r['name']}")
+                    st.code(r["error"])
+
+                st.download_button(
+                    label="⬇️ ดาวน์โหลด ZIP (.mpy)",
+                    data=zip_bytes,
+                    file_name="mpy_build.zip",
+                    mime="application/zip"
+                )
+        except Exception as e:
+            st.error(f"An error occurred: {e}")
+
     st.warning("⚠️ หมายเหตุ: ไฟล์ .mpy ต้องใช้กับ MicroPython เวอร์ชันที่ตรงกัน (Major/Minor version) มิฉะนั้นจะเกิด Error 'incompatible .mpy file' บนบอร์ด")
 
 else:
-    st.info("กรุณาอัปโหลดไฟล์ .py เพื่อเริ่มต้น")
+    # Build Matrix: compile upload เดียวกันสำหรับหลาย board family พร้อมกัน
+    uploads = st.file_uploader("อัปโหลดไฟล์ .py หรือ ZIP ของโปรเจกต์", type=["py", "zip"],
+                               accept_multiple_files=True, key="matrix_uploads")
+    mc1, mc2, mc3 = st.columns(3)
+    marches = mc1.multiselect("-march", MARCH_CHOICES, default=["xtensawin", "armv7emsp"],
+                              help="ว่าง = ไม่ระบุ (bytecode ใช้ได้ทุกบอร์ด)")
+    opt_levels = mc2.multiselect("-O (optimization)", OPT_LEVELS, default=[])
+    emits = mc3.multiselect("emit", EMIT_CHOICES, default=["bytecode"],
+                            help="native / viper ต้องเลือก -march ด้วย")
+    keep_entry = st.checkbox("คง boot.py / main.py เป็น .py", value=True, key="matrix_keep_entry")
+
+    variants = build_variants(marches, opt_levels, emits)
+    st.caption(f"Variants ({len(variants)}): " + ", ".join(f"`{label}`" for label, _ in variants))
+
+    if uploads and variants and st.button("🏗️ Build ทุก Variant", type="primary"):
+        try:
+            sources = collect_project_sources([(up.name, up.getvalue()) for up in uploads])
+            progress = st.progress(0.0, text="กำลัง Build...")
+
+            def on_result(done, total, row):
+                progress.progress(done / total, text=f"{done}/{total} — {row['variant']} / {row['name']}")
+
+            zip_bytes, rows = compile_matrix(sources, variants, keep_entry_points=keep_entry, on_result=on_result)
+
+            if not rows:
+                st.warning("⚠️ ไม่พบไฟล์ .py ในสิ่งที่อัปโหลด")
+            else:
+                # สรุปต่อ variant
+                summary = []
+                for label, flags in variants:
+                    vrows = [r for r in rows if r["variant"] == label and r["cached"] is not None]
+                    summary.append({
+                        "Variant": label, "Flags": " ".join(flags) or "—",
+                        "ไฟล์": len(vrows),
+                        ".mpy รวม (bytes)": sum(r["size_mpy"] or 0 for r in vrows),
+                        "Cache hit": sum(1 for r in vrows if r["cached"]),
+                        "ผิดพลาด": sum(1 for r in vrows if r["error"]),
+                    })
+                st.dataframe(summary, use_container_width=True)
+
+                # ขนาด .mpy ต่อไฟล์ × variant
+                sizes = {}
+                for r in rows:
+                    if r["cached"] is None:
+                        continue
+                    sizes.setdefault(r["name"], {"ไฟล์": r["name"], ".py (bytes)": r["size_py"]})[r["variant"]] = r["size_mpy"]
+                with st.expander("ขนาด .mpy ต่อไฟล์"):
+                    st.dataframe(list(sizes.values()), use_container_width=True)
+
+                for r in rows:
+                    if r["error"]:
+                        st.error(f"❌ {r['variant']} / {r['name']}")
+                        st.code(r["error"])
+
+                st.download_button(
+                    label="⬇️ ดาวน์โหลด Bundle (ZIP ทุก Variant)",
+                    data=zip_bytes,
+                    file_name="mpy_build_matrix.zip",
+                    mime="application/zip"
+                )
+        except Exception as e:
+            st.error(f"An error occurred: {e}")
+    elif not variants:
+        st.warning("⚠️ emit native / viper ต้องเลือก -march อย่างน้อย 1 ตัว")
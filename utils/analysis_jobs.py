@@ -0,0 +1,229 @@
+"""
+รันงานวิเคราะห์หนัก (เช่น Network Analysis ของหน้า pages/Rent_Gradient.py) ใน Process Pool นอก thread ของ Streamlit
+- งานระบุด้วย key (เช่น hash ของพื้นที่ + ประเภทถนน): session ที่ส่ง key เดียวกันจะเกาะงานเดิม
+  และผลที่เสร็จแล้วถูกเก็บไว้ (TTL) ให้ทุก session ใช้ซ้ำ — ถือ JobManager ไว้ด้วย st.cache_resource
+- worker รายงานความคืบหน้าเป็นขั้น (stage, fraction, message) ลงไฟล์ progress.json ของงาน → หน้าเว็บ poll
+- ยกเลิกงาน = สร้างไฟล์ cancel → ครั้งถัดไปที่ worker รายงานความคืบหน้าจะ raise JobCancelled
+- งานนับ subscriber (session ที่เกาะอยู่): session ที่กดยกเลิกแค่ถอนตัว — งานหยุดจริงเมื่อไม่เหลือ subscriber
+
+ฟังก์ชันในไฟล์ page ของ Streamlit รันในฐานะ __main__ จึง pickle ส่งให้ worker ตรงๆ ไม่ได้ —
+worker import ไฟล์นั้นจาก path แทน (page ต้อง import ได้โดยไม่มี side effect: main() อยู่ใต้ __name__ guard)
+ฟังก์ชันเป้าหมายต้องรับ keyword ``progress`` (callable(stage, fraction=0.0, message=""))
+"""
+import importlib.util
+import json
+import multiprocessing
+import os
+import shutil
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from pathlib import Path
+
+PROGRESS_FILE = "progress.json"
+CANCEL_FILE = "cancel"
+PROGRESS_MIN_INTERVAL_S = 0.2       # เขียน progress ถี่สุดเท่านี้ (ยกเว้นเปลี่ยน stage)
+
+
+class JobCancelled(Exception):
+    """งานถูกยกเลิกระหว่างรัน (raise จาก progress callback ใน worker)"""
+
+
+# ── Worker ─────────────────────────────────────────
+_MODULES = {}
+
+
+def _load_module(source_file):
+    """import ไฟล์ (เช่น page ของ Streamlit) ครั้งเดียวต่อ worker process"""
+    module = _MODULES.get(source_file)
+    if module is None:
+        name = f"_analysis_job_{Path(source_file).stem}"
+        spec = importlib.util.spec_from_file_location(name, source_file)
+        module = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(module)
+        _MODULES[source_file] = module
+    return module
+
+
+class ProgressReporter:
+    """progress callback ฝั่ง worker: เขียน progress.json แบบ atomic และตรวจคำสั่งยกเลิก"""
+
+    def __init__(self, job_dir):
+        self.job_dir = Path(job_dir)
+        self._last_stage = None
+        self._last_write = 0.0
+
+    def __call__(self, stage, fraction=0.0, message=""):
+        if (self.job_dir / CANCEL_FILE).exists():
+            raise JobCancelled(stage)
+        now = time.monotonic()
+        if stage == self._last_stage and now - self._last_write < PROGRESS_MIN_INTERVAL_S:
+            return
+        self._last_stage, self._last_write = stage, now
+        tmp = self.job_dir / f".{PROGRESS_FILE}.{os.getpid()}.tmp"
+        tmp.write_text(json.dumps({
+            "stage": stage, "fraction": float(min(max(fraction, 0.0), 1.0)), "message": message, "time": time.time(),
+        }, ensure_ascii=False), encoding="utf-8")
+        os.replace(tmp, self.job_dir / PROGRESS_FILE)
+
+
+def _run_job(job_dir, source_file, func_name, args):
+    func = getattr(_load_module(source_file), func_name)
+    return func(*args, progress=ProgressReporter(job_dir))
+
+
+# ── Manager (ฝั่ง Streamlit server) ──────────────────
+class JobManager:
+    """
+    ส่งงานเข้า Process Pool, poll ความคืบหน้า, ยกเลิก และเก็บผลที่เสร็จแล้วให้ทุก session ใช้ซ้ำ
+    ใช้ start method แบบ spawn — fork จาก Streamlit server ที่มีหลาย thread เสี่ยง deadlock
+    """
+
+    def __init__(self, max_workers=2, result_ttl_s=3600, max_results=8, subscriber_ttl_s=60):
+        self.max_workers = max_workers
+        self.result_ttl_s = result_ttl_s
+        self.max_results = max_results
+        self.subscriber_ttl_s = subscriber_ttl_s    # subscriber ที่ไม่ poll นานเท่านี้ (ปิด tab ไปแล้ว) ไม่นับ
+        self._lock = threading.Lock()
+        self._pool = None
+        self._jobs = {}                         # key → {"future", "dir", "submitted", "subscribers", "cancelling"}
+        self._results = OrderedDict()           # key → (finished_at, result)
+        self._root = Path(tempfile.mkdtemp(prefix="analysis_jobs_"))
+
+    def _executor(self):
+        if self._pool is None:
+            self._pool = ProcessPoolExecutor(
+                max_workers=self.max_workers, mp_context=multiprocessing.get_context("spawn")
+            )
+        return self._pool
+
+    def _cached_result(self, key):
+        entry = self._results.get(key)
+        if entry is None:
+            return None
+        if time.time() - entry[0] > self.result_ttl_s:
+            del self._results[key]
+            return None
+        self._results.move_to_end(key)
+        return entry[1]
+
+    def submit(self, key, source_file, func_name, *args, subscriber=None):
+        """
+        ส่งงาน (ถ้ายังไม่มีผลใน cache และไม่มีงาน key เดียวกันค้างอยู่) และลงชื่อ subscriber (เช่น id ของ session)
+        คืนค่า "done" (มีผลแล้ว), "running" (เกาะงานเดิม) หรือ "submitted"
+        """
+        with self._lock:
+            if self._cached_result(key) is not None:
+                return "done"
+            job = self._jobs.get(key)
+            if job is not None and not job["future"].done() and not job["cancelling"]:
+                if subscriber is not None:
+                    job["subscribers"][subscriber] = time.monotonic()
+                return "running"
+            job_dir = Path(tempfile.mkdtemp(prefix="job_", dir=self._root))
+            try:
+                future = self._executor().submit(_run_job, str(job_dir), str(source_file), func_name, args)
+            except BrokenProcessPool:
+                # worker ตายกลางทาง (เช่นถูก kill) → สร้าง pool ใหม่
+                self._pool = None
+                future = self._executor().submit(_run_job, str(job_dir), str(source_file), func_name, args)
+            self._jobs[key] = {"future": future, "dir": job_dir, "submitted": time.time(), "cancelling": False,
+                               "subscribers": {} if subscriber is None else {subscriber: time.monotonic()}}
+        future.add_done_callback(lambda f, key=key, job_dir=job_dir: self._finish(key, f, job_dir))
+        return "submitted"
+
+    def _finish(self, key, future, job_dir):
+        with self._lock:
+            job = self._jobs.get(key)
+            if job is None or job["future"] is not future:
+                # งานที่ถูกยกเลิกแล้วมีงานใหม่ key เดียวกันมาแทน — เก็บกวาดแค่โฟลเดอร์ของตัวเอง
+                shutil.rmtree(job_dir, ignore_errors=True)
+                return
+            if not future.cancelled() and future.exception() is None:
+                result = future.result()
+                if "error" not in result:                 # error ไม่เก็บ — ให้ลองใหม่ได้
+                    self._results[key] = (time.time(), result)
+                    while len(self._results) > self.max_results:
+                        self._results.popitem(last=False)
+                    del self._jobs[key]
+            shutil.rmtree(job["dir"], ignore_errors=True)
+
+    def poll(self, key, subscriber=None):
+        """
+        สถานะของงาน: {"state", "stage", "fraction", "message", "elapsed_s", "result", "error"}
+        state ∈ done / running / queued / cancelled / failed / missing
+        subscriber ที่ poll อยู่ถือว่ายังเกาะงาน (ต่ออายุตาม subscriber_ttl_s)
+        """
+        with self._lock:
+            result = self._cached_result(key)
+            job = self._jobs.get(key)
+            if job is not None and subscriber in job["subscribers"]:
+                job["subscribers"][subscriber] = time.monotonic()
+        status = {"state": "missing", "stage": None, "fraction": 0.0, "message": "",
+                  "elapsed_s": 0.0, "result": None, "error": None}
+        if job is not None:
+            status["elapsed_s"] = time.time() - job["submitted"]
+        if result is not None:
+            return {**status, "state": "done", "result": result}
+        if job is None:
+            return status
+
+        future = job["future"]
+        if future.done():
+            error = None if future.cancelled() else future.exception()
+            if future.cancelled() or isinstance(error, JobCancelled):
+                return {**status, "state": "cancelled"}
+            if error is not None:
+                return {**status, "state": "failed", "error": f"{type(error).__name__}: {error}"}
+            return {**status, "state": "done", "result": future.result()}   # ผลที่มี "error"
+
+        try:
+            progress = json.loads((job["dir"] / PROGRESS_FILE).read_text(encoding="utf-8"))
+        except (OSError, ValueError):
+            return {**status, "state": "queued" if not future.running() else "running"}
+        return {**status, "state": "running", "stage": progress["stage"],
+                "fraction": progress["fraction"], "message": progress["message"]}
+
+    def cancel(self, key, subscriber=None):
+        """
+        ถอน subscriber ออกจากงาน — ยกเลิกงานจริงเมื่อไม่เหลือ subscriber ที่ยัง poll อยู่ (subscriber=None = ยกเลิกเลย)
+        งานที่ยังรอคิวถูกถอนทันที, งานที่กำลังรันหยุดที่ progress ครั้งถัดไป
+        คืนค่า "cancelled", "detached" (ยังมี session อื่นรออยู่ งานรันต่อ) หรือ None (ไม่มีงานที่ค้างอยู่)
+        """
+        with self._lock:
+            job = self._jobs.get(key)
+            if job is None or job["future"].done() or job["cancelling"]:
+                return None
+            subscribers = job["subscribers"]
+            if subscriber is not None:
+                subscribers.pop(subscriber, None)
+                cutoff = time.monotonic() - self.subscriber_ttl_s
+                for other, seen in list(subscribers.items()):
+                    if seen < cutoff:
+                        del subscribers[other]
+                if subscribers:
+                    return "detached"
+            job["cancelling"] = True
+            if not job["future"].cancel():
+                (job["dir"] / CANCEL_FILE).touch()
+            return "cancelled"
+
+    def forget(self, key):
+        """ลบงานที่จบแล้ว (ที่ไม่ได้เก็บผลใน cache) ออกจากรายการ"""
+        with self._lock:
+            job = self._jobs.get(key)
+            if job is not None and job["future"].done():
+                del self._jobs[key]
+
+    def shutdown(self):
+        with self._lock:
+            for job in self._jobs.values():
+                if not job["future"].done():
+                    (job["dir"] / CANCEL_FILE).touch()
+            if self._pool is not None:
+                self._pool.shutdown(wait=False, cancel_futures=True)
+                self._pool = None
+        shutil.rmtree(self._root, ignore_errors=True)
@@ -0,0 +1,453 @@
+"""
+Make (Integromat) Blueprint Minifier — Streaming core
+ใช้ร่วมกันระหว่างหน้า pages/clean_json_data.py และ worker ใน Process Pool (Batch mode)
+(แยกออกมาจากหน้า Streamlit เพื่อให้ worker process import ฟังก์ชันได้)
+"""
+import functools
+import json
+import multiprocessing
+import os
+import random
+import re
+import shutil
+import sys
+import tempfile
+import threading
+import time
+import zipfile
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+try:
+    import resource  # Linux/macOS: ใช้วัด peak RSS ใน Benchmark
+except ImportError:
+    resource = None
+
+# รายชื่อ key ที่ต้องการลบ (ทั้ง subtree) — ชุดกฎตั้งต้นของ Make.com
+KEYS_TO_REMOVE = ('interface', 'expect', 'designer', 'restore')
+CHUNK_SIZE = 1 << 20  # อ่าน/เขียนทีละ 1 MB
+
+# ชุดกฎที่ผู้ใช้เลือกได้ (1 บรรทัด = 1 กฎ — ดู compile_rules)
+RULE_PRESETS = {
+    "Make default": KEYS_TO_REMOVE,
+    "Make + metadata": KEYS_TO_REMOVE + ("flow[*].metadata", "..routes[*].flow[*].metadata"),
+    "LLM budget (aggressive)": KEYS_TO_REMOVE + ("flow[*].metadata", "..routes[*].flow[*].metadata",
+                                                  "..samples", "string>2000"),
+}
+
+# Tokenizer แบบ bytes: string | โครงสร้าง {}[]:, | literal (number/true/false/null)
+_TOKEN_RE = re.compile(rb'[ \t\r\n]*(?:("[^"\\]*(?:\\.[^"\\]*)*")|([{}\[\]:,])|([^ \t\r\n{}\[\]:,"]+))', re.S)
+_LITERAL_RE = re.compile(rb'-?(?:0|[1-9][0-9]*)(?:\.[0-9]+)?(?:[eE][+-]?[0-9]+)?|true|false|null')
+_PATH_TOKEN_RE = re.compile(r'\.\.|\.|\[\*\]|[^.\[\]]+')
+_SIZE_RULE_RE = re.compile(r'(str|string|array)\s*>\s*(\d+)$')
+
+# สถานะของ Parser
+_VALUE, _VALUE_OR_CLOSE, _KEY, _KEY_OR_CLOSE, _COLON, _NEXT, _DONE = range(7)
+
+# Token ของ Path pattern
+_DEEP, _ANY_KEY, _INDEX = 0, 1, 2
+
+
+class BlueprintSyntaxError(ValueError):
+    """JSON ไม่ถูกต้อง — pos คือตำแหน่ง byte ในไฟล์ต้นฉบับ"""
+
+    def __init__(self, msg, pos):
+        super().__init__(f"{msg} (byte {pos})")
+        self.pos = pos
+
+
+# ══════════════════════════════════════════
+# 🧮  Prune rule engine
+# ══════════════════════════════════════════
+def _parse_path(rule):
+    """'flow[*].metadata.designer' / '..samples' / '$.a.*' → list ของ token (_DEEP/_ANY_KEY/_INDEX/bytes key)"""
+    text = rule[1:] if rule.startswith('$') else rule
+    tokens, expect_name = [], True
+    for part in _PATH_TOKEN_RE.findall(text):
+        if part == '..':
+            tokens.append(_DEEP); expect_name = True
+        elif part == '.':
+            expect_name = True
+        elif part == '[*]':
+            tokens.append(_INDEX); expect_name = False
+        elif expect_name:
+            tokens.append(_ANY_KEY if part == '*' else json.dumps(part, ensure_ascii=False).encode('utf-8'))
+            expect_name = False
+        else:
+            raise ValueError(f"กฎไม่ถูกต้อง: {rule}")
+    if not tokens or tokens[-1] == _DEEP:
+        raise ValueError(f"กฎไม่ถูกต้อง: {rule}")
+    return tokens
+
+
+class PruneEngine:
+    """
+    กฎตัดข้อมูลที่ compile แล้ว (สร้างครั้งเดียว ใช้ซ้ำทุกไฟล์):
+      • key        : 'designer'                    → ตัด member ชื่อนี้ทุกระดับ (= '..designer')
+      • path       : 'flow[*].metadata.designer'   → JSONPath แบบย่อ (., [*], *, ..)
+      • string>N   : ตัด string ที่ยาวเกิน N bytes
+      • array>N    : ตัด array ที่ขนาดเกิน N bytes (ในไฟล์ต้นฉบับ)
+    Path ทั้งหมดถูก match พร้อมกันด้วย NFA — ชุด state ถูก intern เป็นเลข int และ transition ถูก cache
+    engine ตัวเดียวถูกใช้ร่วมกันทุก thread (compile_rules cache ไว้) — การ intern / เพิ่ม transition อยู่ใต้ lock
+    """
+
+    _CACHE_LIMIT = 200_000
+
+    def __init__(self, rules):
+        self.rules = list(rules)
+        self.patterns = []          # (rule_index, tokens)
+        self.string_limit = None
+        self.string_rule = -1
+        self.array_limit = None
+        self.array_rule = -1
+        for i, rule in enumerate(self.rules):
+            m = _SIZE_RULE_RE.match(rule)
+            if m:
+                if m.group(1) == 'array':
+                    self.array_limit, self.array_rule = int(m.group(2)), i
+                else:
+                    self.string_limit, self.string_rule = int(m.group(2)), i
+            elif any(c in rule for c in '.[*$'):
+                self.patterns.append((i, _parse_path(rule)))
+            else:
+                self.patterns.append((i, [_DEEP, json.dumps(rule, ensure_ascii=False).encode('utf-8')]))
+        self._sets = []
+        self._ids = {}
+        self._trans = {}
+        self._lock = threading.Lock()
+        self.start = self._intern({(k, 0) for k in range(len(self.patterns))})
+
+    def _intern(self, states):
+        # เรียกจาก __init__ หรือภายใต้ self._lock เท่านั้น (อ่าน len(_sets) แล้ว append ต้องไม่ถูกแทรก)
+        # epsilon closure: _DEEP อาจจับคู่ 0 segment
+        todo = list(states)
+        while todo:
+            k, p = todo.pop()
+            if self.patterns[k][1][p] == _DEEP and (k, p + 1) not in states:
+                states.add((k, p + 1)); todo.append((k, p + 1))
+        key = frozenset(states)
+        sid = self._ids.get(key)
+        if sid is None:
+            sid = self._ids[key] = len(self._sets)
+            self._sets.append(key)
+        return sid
+
+    def step(self, sid, seg):
+        """
+        เดิน 1 segment (seg = raw key bytes หรือ None สำหรับ array item)
+        คืนค่า (sid ใหม่, index ของกฎที่ match หรือ -1)
+        """
+        hit = self._trans.get((sid, seg))      # fast path ไม่ต้องล็อก (dict.get atomic)
+        if hit is not None:
+            return hit
+        with self._lock:
+            return self._step_locked(sid, seg)
+
+    def _step_locked(self, sid, seg):
+        hit = self._trans.get((sid, seg))
+        if hit is not None:
+            return hit
+        nxt, matched = set(), -1
+        for k, p in self._sets[sid]:
+            tokens = self.patterns[k][1]
+            tok = tokens[p]
+            if tok == _DEEP:
+                nxt.add((k, p)); continue
+            if seg is None:
+                ok = tok == _INDEX
+            else:
+                ok = tok == _ANY_KEY or tok == seg
+            if ok:
+                if p + 1 == len(tokens):
+                    rule = self.patterns[k][0]
+                    if matched < 0 or rule < matched: matched = rule
+                else:
+                    nxt.add((k, p + 1))
+        result = (self._intern(nxt), matched)
+        if len(self._trans) > self._CACHE_LIMIT:
+            self._trans.clear()
+        self._trans[(sid, seg)] = result
+        return result
+
+
+@functools.lru_cache(maxsize=32)
+def compile_rules(rules=KEYS_TO_REMOVE):
+    """Compile ชุดกฎ (tuple ของ str) → PruneEngine (cache ไว้ใช้ซ้ำ)"""
+    return PruneEngine(tuple(r.strip() for r in rules if r.strip() and not r.strip().startswith('#')))
+
+
+def minify_blueprint_stream(src, dst, engine=None, chunk_size=CHUNK_SIZE, stats=None):
+    """
+    Minify JSON แบบ Streaming: อ่าน src ทีละ chunk, ตัดข้อมูลตามกฎของ engine ระหว่างทาง
+    (ไม่สร้าง object tree) แล้วเขียนผลลัพธ์ลง dst ทีละ chunk
+    ใช้ explicit stack แทน recursion จึงไม่ติด recursion limit กับไฟล์ที่ซ้อนลึกมาก
+    Token (string/number) ถูกเขียนออกตามต้นฉบับโดยไม่ decode
+    stats (dict, optional): เติม {กฎ: [จำนวนครั้ง, bytes ต้นฉบับที่ตัดออก]}
+    คืนค่า (bytes_in, bytes_out)
+    """
+    engine = engine or compile_rules()
+    step = engine.step
+    rules = engine.rules
+    string_limit = engine.string_limit
+    array_limit = engine.array_limit
+    saved = [[0, 0] for _ in rules]
+    match_token = _TOKEN_RE.match
+    match_literal = _LITERAL_RE.fullmatch
+
+    stack = []          # แต่ละชั้น: [is_object, จำนวน member/item ที่เขียนออกแล้ว, path state]
+    state = _VALUE
+    mute = None         # ความลึกของ stack ที่เริ่มตัด subtree (None = เขียนปกติ)
+    mute_rule = -1
+    mute_from = 0       # byte offset ต้นฉบับที่เริ่มตัด
+    marks = []          # array ที่อาจโดนกฎ array>N: (ความลึก, ตำแหน่ง out, count ของ parent ก่อนเขียน, offset เริ่ม)
+    pending_key = b''
+    key_start = 0
+    out = bytearray()
+    flushed = 0
+    buf = b''
+    pos = 0
+    offset = 0          # byte offset ของ buf[0] ในไฟล์ต้นฉบับ
+    eof = False
+
+    while True:
+        m = match_token(buf, pos)
+        if m is None or (m.end() == len(buf) and m.lastindex == 3 and not eof):
+            if eof:
+                if buf[pos:].strip():
+                    raise BlueprintSyntaxError("พบข้อมูลที่ไม่ใช่ JSON", offset + pos)
+                break
+            data = src.read(chunk_size)
+            eof = not data
+            offset += pos
+            buf = buf[pos:] + data
+            pos = 0
+            continue
+
+        pos = m.end()
+        kind = m.lastindex
+        tok = m.group(kind)
+        tok_start = offset + m.start(kind)
+
+        # ── กฎ array>N: array ชั้นนอกสุดที่ยังเปิดอยู่ยาวเกิน → ย้อน output แล้วตัดส่วนที่เหลือ ──
+        if marks and offset + pos - marks[0][3] > array_limit:
+            depth, out_pos, parent_count, from_pos = marks[0]
+            del out[out_pos - flushed:]
+            stack[depth - 1][1] = parent_count
+            marks.clear()
+            mute, mute_rule, mute_from = depth, engine.array_rule, from_pos
+
+        if kind == 2 and tok == b':':
+            if state != _COLON:
+                raise BlueprintSyntaxError("ไม่คาดว่าจะพบ :", tok_start)
+            state = _VALUE
+        elif kind == 2 and tok == b',':
+            if state != _NEXT:
+                raise BlueprintSyntaxError("ไม่คาดว่าจะพบ ,", tok_start)
+            state = _KEY if stack[-1][0] else _VALUE
+        elif kind == 2 and (tok == b'}' or tok == b']'):
+            closing_object = tok == b'}'
+            if (not stack or stack[-1][0] != closing_object or
+                    state not in ((_KEY_OR_CLOSE if closing_object else _VALUE_OR_CLOSE), _NEXT)):
+                raise BlueprintSyntaxError("ไม่คาดว่าจะพบ " + tok.decode(), tok_start)
+            stack.pop()
+            if mute is None:
+                out += tok
+                if marks and marks[-1][0] == len(stack):
+                    marks.pop()
+            elif len(stack) == mute:
+                saved[mute_rule][0] += 1
+                saved[mute_rule][1] += offset + pos - mute_from
+                mute = None
+            state = _NEXT if stack else _DONE
+        elif kind == 1 and (state == _KEY or state == _KEY_OR_CLOSE):
+            pending_key = tok
+            key_start = tok_start
+            state = _COLON
+        else:
+            # ── จุดเริ่มของ value: string / literal / { / [ ──
+            if state > _VALUE_OR_CLOSE:
+                raise BlueprintSyntaxError("ไม่คาดว่าจะพบ " + tok[:20].decode('utf-8', 'replace'), tok_start)
+            if kind == 3 and match_literal(tok) is None:
+                raise BlueprintSyntaxError("literal ไม่ถูกต้อง", tok_start)
+            is_container = kind == 2
+            if kind == 2 and tok != b'{' and tok != b'[':
+                raise BlueprintSyntaxError("ไม่คาดว่าจะพบ " + tok.decode(), tok_start)
+            child = -1
+            if mute is None:
+                if stack:
+                    parent = stack[-1]
+                    if parent[0]:
+                        seg = pending_key
+                        if b'\\' in seg:
+                            seg = json.dumps(json.loads(seg), ensure_ascii=False).encode('utf-8')
+                        from_pos = key_start
+                    else:
+                        seg, from_pos = None, tok_start
+                    child, hit = step(parent[2], seg)
+                    if hit < 0 and kind == 1 and string_limit is not None and len(tok) - 2 > string_limit:
+                        hit = engine.string_rule
+                    if hit >= 0:
+                        if is_container:
+                            mute, mute_rule, mute_from = len(stack), hit, from_pos
+                        else:
+                            saved[hit][0] += 1
+                            saved[hit][1] += offset + pos - from_pos
+                    else:
+                        if is_container and tok == b'[' and array_limit is not None:
+                            marks.append((len(stack), flushed + len(out), parent[1], from_pos))
+                        if parent[1]: out += b','
+                        parent[1] += 1
+                        if parent[0]:
+                            out += pending_key
+                            out += b':'
+                        out += tok
+                else:
+                    child = engine.start
+                    out += tok
+            if is_container:
+                stack.append([tok == b'{', 0, child])
+                state = _KEY_OR_CLOSE if tok == b'{' else _VALUE_OR_CLOSE
+            else:
+                state = _NEXT if stack else _DONE
+
+        if len(out) >= chunk_size:
+            keep = marks[0][1] - flushed if marks else len(out)
+            if keep > 0:
+                dst.write(out[:keep]); del out[:keep]; flushed += keep
+
+    if state != _DONE:
+        raise BlueprintSyntaxError("JSON จบไม่สมบูรณ์", offset + pos)
+    dst.write(out)
+    if stats is not None:
+        for rule, (hits, n_bytes) in zip(rules, saved):
+            entry = stats.setdefault(rule, [0, 0])
+            entry[0] += hits; entry[1] += n_bytes
+    return offset + pos, flushed + len(out)
+
+
+def write_synthetic_blueprint(dst, target_bytes, seed=0):
+    """เขียน Blueprint สังเคราะห์ (flow ของ module ที่มี interface/expect/designer/restore) ขนาด ~target_bytes"""
+    rnd = random.Random(seed)
+    dst.write(b'{\n  "name": "Synthetic Scenario",\n  "flow": [\n')
+    written, i = 0, 0
+    while written < target_bytes:
+        module = {
+            "id": i, "module": rnd.choice(["http:ActionSendData", "json:ParseJSON", "util:SetVariable2"]),
+            "version": 3,
+            "parameters": {"handleErrors": False, "timeout": rnd.randint(1, 300)},
+            "mapper": {"url": f"https://example.com/api/{i}", "body": "{{" + str(i) + ".data}}" * rnd.randint(1, 5)},
+            "metadata": {
+                "designer": {"x": rnd.randint(-900, 900), "y": rnd.randint(-900, 900)},
+                "restore": {"expect": {"method": {"mode": "chose", "label": "POST"}}},
+                "expect": [{"name": f"field_{k}", "type": "text", "label": "ฟิลด์ " + str(k)} for k in range(rnd.randint(2, 8))],
+                "interface": [{"name": "data", "type": "any", "spec": [{"name": "nested", "type": "text"}]}],
+            },
+        }
+        piece = ("    " + ("," if i else "") + json.dumps(module, ensure_ascii=False, indent=2) + "\n").encode('utf-8')
+        dst.write(piece)
+        written += len(piece); i += 1
+    dst.write(b'  ],\n  "metadata": {"version": 1, "designer": {"orphans": []}}\n}\n')
+    return i
+
+
+def benchmark_minifier(size_mb, workdir=None, rules=KEYS_TO_REMOVE):
+    """Benchmark: สร้างไฟล์สังเคราะห์ขนาด size_mb แล้ว minify แบบ Streaming — คืนค่า dict ของผลลัพธ์"""
+    with tempfile.TemporaryDirectory(dir=workdir) as tmp:
+        src_path = os.path.join(tmp, "synthetic.json")
+        dst_path = os.path.join(tmp, "synthetic_minified.json")
+        with open(src_path, "wb") as f:
+            modules = write_synthetic_blueprint(f, int(size_mb * 1024 * 1024))
+        t0 = time.perf_counter()
+        with open(src_path, "rb") as src, open(dst_path, "wb") as dst:
+            n_in, n_out = minify_blueprint_stream(src, dst, compile_rules(tuple(rules)))
+        elapsed = time.perf_counter() - t0
+    # ru_maxrss: KB บน Linux, bytes บน macOS
+    peak = None
+    if resource is not None:
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        peak = peak if sys.platform == "darwin" else peak * 1024
+    return {
+        "modules": modules, "bytes_in": n_in, "bytes_out": n_out, "seconds": elapsed,
+        "mb_per_s": n_in / 1048576 / elapsed if elapsed > 0 else 0.0, "peak_rss_bytes": peak,
+    }
+
+
+# ══════════════════════════════════════════
+# 📦  Batch mode (หลายไฟล์ / ZIP) — Process Pool
+# ══════════════════════════════════════════
+def minified_name(name):
+    """a/b/x.json → a/b/x_minified.json"""
+    root, ext = os.path.splitext(name)
+    return f"{root}_minified{ext or '.json'}"
+
+
+def list_zip_blueprints(zip_path):
+    """รายชื่อไฟล์ .json ใน ZIP (ข้าม directory และ __MACOSX/)"""
+    with zipfile.ZipFile(zip_path) as zf:
+        return [zi.filename for zi in zf.infolist()
+                if not zi.is_dir() and zi.filename.lower().endswith(".json")
+                and not zi.filename.startswith("__MACOSX/")]
+
+
+def _minify_job(job):
+    """
+    Worker (รันใน Process Pool): job = (name, src_path, zip_member | None, dst_path, rules)
+    อ่านจากไฟล์หรือ stream ตรงจาก member ใน ZIP แล้วเขียนผลลัพธ์ลง dst_path
+    คืนค่า (name, bytes_in, bytes_out, rule_stats, error | None)
+    """
+    name, src_path, member, dst_path, rules = job
+    stats = {}
+    try:
+        engine = compile_rules(rules)
+        if member is None:
+            with open(src_path, "rb") as src, open(dst_path, "wb") as dst:
+                n_in, n_out = minify_blueprint_stream(src, dst, engine, stats=stats)
+        else:
+            with zipfile.ZipFile(src_path) as zf, zf.open(member) as src, open(dst_path, "wb") as dst:
+                n_in, n_out = minify_blueprint_stream(src, dst, engine, stats=stats)
+        return name, n_in, n_out, stats, None
+    except (BlueprintSyntaxError, OSError, zipfile.BadZipFile, UnicodeDecodeError) as e:
+        return name, 0, 0, {}, str(e)
+
+
+def minify_batch(sources, out_zip, workdir, rules=KEYS_TO_REMOVE, max_workers=None, on_result=None, stats=None):
+    """
+    Minify หลายไฟล์พร้อมกันด้วย ProcessPoolExecutor แล้วรวมผลเป็น ZIP เดียว
+      sources : list ของ (name, src_path, zip_member | None) — ไฟล์ต้องอยู่บนดิสก์แล้ว
+      out_zip : file object (seekable) สำหรับเขียน ZIP ผลลัพธ์
+      rules   : tuple ของกฎ (แต่ละ worker compile ครั้งเดียวแล้ว cache)
+      on_result(done, total, row) : callback สำหรับอัปเดต progress
+      stats   : dict (optional) รวมผล {กฎ: [จำนวนครั้ง, bytes]} ของทุกไฟล์
+    ผลลัพธ์แต่ละไฟล์ถูก stream จากไฟล์ชั่วคราวเข้า ZIP ทีละ chunk แล้วลบทิ้งทันที
+    คืนค่า list ของ dict: name, bytes_in, bytes_out, reduction_pct, error
+    """
+    rules = tuple(rules)
+    compile_rules(rules)  # ตรวจกฎก่อนส่งเข้า pool (ValueError ถ้ากฎผิด)
+    jobs = [(name, path, member, os.path.join(workdir, f"out_{i}.json"), rules)
+            for i, (name, path, member) in enumerate(sources)]
+    rows = []
+    workers = max_workers or min(len(jobs), os.cpu_count() or 1) or 1
+    # spawn (ไม่ใช่ fork ซึ่งเป็นค่า default บน Linux) — fork จาก Streamlit server ที่มีหลาย thread เสี่ยง deadlock
+    with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn")) as pool, \
+            zipfile.ZipFile(out_zip, "w", compression=zipfile.ZIP_DEFLATED) as zf:
+        futures = {pool.submit(_minify_job, job): job for job in jobs}
+        for fut in as_completed(futures):
+            name, n_in, n_out, file_stats, err = fut.result()
+            if stats is not None:
+                for rule, (hits, n_bytes) in file_stats.items():
+                    entry = stats.setdefault(rule, [0, 0])
+                    entry[0] += hits; entry[1] += n_bytes
+            dst_path = futures[fut][3]
+            if err is None:
+                with open(dst_path, "rb") as src, zf.open(minified_name(name), "w") as dst:
+                    shutil.copyfileobj(src, dst, CHUNK_SIZE)
+            if os.path.exists(dst_path):
+                os.remove(dst_path)
+            row = {
+                "name": name, "bytes_in": n_in, "bytes_out": n_out,
+                "reduction_pct": (n_in - n_out) / n_in * 100 if n_in else 0.0, "error": err,
+            }
+            rows.append(row)
+            if on_result is not None:
+                on_result(len(rows), len(jobs), row)
+    rows.sort(key=lambda r: r["name"])
+    return rows
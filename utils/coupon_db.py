@@ -0,0 +1,421 @@
+"""
+Firebase Realtime Database (REST) — Coupon data layer
+ใช้โดยหน้า pages/coupon.py — ทดสอบกับ utils/fake_rtdb.py ได้โดยตั้ง env COUPON_DB_URL
+- ใช้ requests.Session ตัวเดียว (connection pool + retry) แทนการเปิด connection ใหม่ทุก request
+- เขียนจำนวนมากด้วย multi-path PATCH แบ่งเป็น chunk ตามขนาด payload
+- อ่านแบบแบ่งหน้า (orderBy / limitToFirst / startAt) + TTL cache ที่ล้างทุกครั้งที่เขียน
+- ลบตามเงื่อนไข: เลือกรหัสด้วย indexed query แล้วลบด้วย multi-path PATCH ที่ตั้งค่าเป็น null
+  (query ตาม child ต้องมี ".indexOn": ["status", "type", "value", "timestamp"] ใน Firebase rules)
+- ใช้คูปอง (redeem) แบบ atomic ด้วย conditional write: GET พร้อม X-Firebase-ETag แล้ว PUT ด้วย if-match
+  ถ้าชน (412) ใช้ค่า + ETag ล่าสุดที่ server ส่งกลับมาลองใหม่ทันทีโดยไม่ต้อง GET ซ้ำ
+"""
+import csv
+import io
+import json
+import math
+import os
+import re
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+DEFAULT_BASE_URL = "https://smart-washer-a830b-default-rtdb.asia-southeast1.firebasedatabase.app/coupons"
+BASE_URL = os.environ.get("COUPON_DB_URL", DEFAULT_BASE_URL).rstrip("/")
+
+# Firebase key ห้ามมี . $ # [ ] / และ control characters
+INVALID_KEY_RE = re.compile(r'[.$#\[\]/\x00-\x1f\x7f]')
+MAX_CODE_LENGTH = 20
+
+# orderBy="$key": key ที่ parse เป็นจำนวนเต็ม 32-bit ได้มาก่อน (เรียงตามค่า) ตามด้วย key แบบ string (เรียงตามตัวอักษร)
+INT_KEY_RE = re.compile(r"-?0*[0-9]{1,10}")
+INT32_MIN, INT32_MAX = -2 ** 31, 2 ** 31 - 1
+
+# ขนาด chunk ของ multi-path PATCH (REST จำกัด 256 MB ต่อ request แต่ chunk เล็กได้ progress + retry ที่ถูกกว่า)
+PATCH_CHUNK_BYTES = 256 * 1024
+PATCH_CHUNK_ITEMS = 500
+
+# อายุของ cache การอ่าน (วินาที) — กันไม่ให้ทุก rerun ของ Streamlit ยิง request ซ้ำ
+READ_CACHE_TTL = 30
+LISTING_COLUMNS = ("code", "status", "value", "type", "timestamp")
+
+# Conditional write: ETag ของ node ที่ยังไม่มีข้อมูล / สถานะที่ใช้คูปองได้ / จำนวนครั้งที่ลองใหม่เมื่อชน
+NULL_ETAG = "null_etag"
+REDEEMABLE_STATUSES = ("active", "vip")
+REDEEM_MAX_ATTEMPTS = 8
+
+
+def make_session(retries=3, backoff=0.5, pool_size=8):
+    """requests.Session ที่มี connection pool และ retry (429/5xx) — รวม PATCH/PUT/DELETE ที่ idempotent"""
+    retry = Retry(
+        total=retries, backoff_factor=backoff,
+        status_forcelist=(429, 500, 502, 503, 504),
+        allowed_methods=frozenset({"GET", "PUT", "PATCH", "DELETE"}),
+        raise_on_status=False,
+    )
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=retry)
+    session = requests.Session()
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
+
+
+def validate_code(code):
+    """คืนค่าข้อความ error หรือ None ถ้ารหัสใช้เป็น Firebase key ได้"""
+    if not code:
+        return "รหัสว่าง"
+    if len(code) > MAX_CODE_LENGTH:
+        return f"ยาวเกิน {MAX_CODE_LENGTH} ตัวอักษร"
+    if INVALID_KEY_RE.search(code):
+        return "มีอักขระต้องห้าม (. $ # [ ] /)"
+    return None
+
+
+def key_order(key):
+    """
+    sort key ตามลำดับ orderBy="$key" ของ Firebase — เช่น "123" < "11111" < "0ABC" < "ABC"
+    (REST คืน JSON โดยไม่รับประกันลำดับ ต้องเรียงฝั่ง client ด้วยกติกาเดียวกับ server ให้ cursor ของ startAt ถูก)
+    """
+    if INT_KEY_RE.fullmatch(key):
+        n = int(key)
+        if INT32_MIN <= n <= INT32_MAX:
+            return (0, n, len(key))
+    return (1, key)
+
+
+def parse_coupon_csv(data, default_value, default_status, default_type="bulk_import"):
+    """
+    อ่าน CSV (bytes/str) ที่มีคอลัมน์ code (จำเป็น) และ value / status / type (ไม่บังคับ)
+    คืนค่า (rows, invalid) — rows: list ของ (code, record) ไม่ซ้ำกันในไฟล์, invalid: list ของ (บรรทัด, code, เหตุผล)
+    """
+    text = data.decode("utf-8-sig") if isinstance(data, bytes) else data
+    reader = csv.DictReader(io.StringIO(text))
+    fields = {(f or "").strip().lower(): f for f in (reader.fieldnames or [])}
+    if "code" not in fields:
+        raise ValueError("CSV ต้องมีคอลัมน์ 'code'")
+
+    def col(row, name):
+        src = fields.get(name)
+        return (row.get(src) or "").strip() if src else ""
+
+    timestamp = time.strftime("%Y-%m-%d %H:%M:%S")
+    rows, invalid, seen = [], [], set()
+    for line_no, row in enumerate(reader, start=2):
+        code = col(row, "code")
+        error = validate_code(code)
+        if error is None and code in seen:
+            error = "ซ้ำในไฟล์"
+        if error is None:
+            value = col(row, "value")
+            try:
+                value = float(value) if value else default_value
+            except ValueError:
+                error = f"value ไม่ใช่ตัวเลข: {value}"
+            else:
+                if not math.isfinite(value):
+                    # json.dumps ส่ง NaN / Infinity ซึ่ง Firebase ไม่รับ → ทั้ง chunk ของ PATCH จะล้ม
+                    error = f"value ต้องเป็นตัวเลขจำกัด: {col(row, 'value')}"
+                elif float(value).is_integer():
+                    value = int(value)
+        if error is not None:
+            invalid.append((line_no, code, error))
+            continue
+        seen.add(code)
+        rows.append((code, {
+            "status": col(row, "status") or default_status,
+            "value": value,
+            "timestamp": timestamp,
+            "type": col(row, "type") or default_type,
+        }))
+    return rows, invalid
+
+
+def records_to_frame_data(data, columns=LISTING_COLUMNS):
+    """
+    แปลง {code: record} เป็น dict ของคอลัมน์ (column-wise) เรียงตาม code (ลำดับ $key ของ Firebase) — ส่งต่อให้ pd.DataFrame ได้ทันที
+    คอลัมน์ที่ไม่อยู่ใน columns แต่มีในข้อมูลจะถูกต่อท้าย
+    """
+    codes = sorted((k for k, v in (data or {}).items() if isinstance(v, dict)), key=key_order)
+    extra = sorted({f for c in codes for f in data[c]} - set(columns))
+    frame = {"code": codes}
+    for name in (*columns, *extra):
+        if name != "code":
+            frame[name] = [data[c].get(name) for c in codes]
+    return frame
+
+
+def match_filter(record, status=None, coupon_type=None, value_range=None, time_range=None):
+    """record ตรงกับทุกเงื่อนไขที่ระบุหรือไม่ (range เป็น (ต่ำสุด, สูงสุด) แบบรวมปลาย, None = ไม่จำกัดฝั่งนั้น)"""
+    if not isinstance(record, dict):
+        return False
+    if status is not None and record.get("status") != status:
+        return False
+    if coupon_type is not None and record.get("type") != coupon_type:
+        return False
+    for field, bounds in (("value", value_range), ("timestamp", time_range)):
+        if bounds is None:
+            continue
+        v, (lo, hi) = record.get(field), bounds
+        try:
+            if v is None or (lo is not None and v < lo) or (hi is not None and v > hi):
+                return False
+        except TypeError:
+            return False    # ชนิดข้อมูลไม่ตรง (เช่น value เป็น string) ถือว่าไม่ตรงเงื่อนไข
+    return True
+
+
+def filter_query(status=None, coupon_type=None, value_range=None, time_range=None):
+    """
+    เลือก indexed query ที่แคบที่สุดจากเงื่อนไข: equalTo ของ status / type ก่อน แล้วค่อย range ของ timestamp / value
+    คืนค่า query params ของ Firebase REST (เงื่อนไขที่เหลือกรองฝั่ง client ด้วย match_filter)
+    """
+    if status is not None:
+        return {"orderBy": json.dumps("status"), "equalTo": json.dumps(status)}
+    if coupon_type is not None:
+        return {"orderBy": json.dumps("type"), "equalTo": json.dumps(coupon_type)}
+    for field, bounds in (("timestamp", time_range), ("value", value_range)):
+        if bounds is not None:
+            params = {"orderBy": json.dumps(field)}
+            if bounds[0] is not None:
+                params["startAt"] = json.dumps(bounds[0])
+            if bounds[1] is not None:
+                params["endAt"] = json.dumps(bounds[1])
+            return params
+    raise ValueError("ต้องระบุเงื่อนไขอย่างน้อยหนึ่งข้อ (ถ้าต้องการลบทั้งหมดให้ใช้ delete())")
+
+
+def chunk_payload(items, max_bytes=PATCH_CHUNK_BYTES, max_items=PATCH_CHUNK_ITEMS):
+    """แบ่ง list ของ (path, value) เป็น dict ย่อยที่ขนาด JSON ไม่เกิน max_bytes และไม่เกิน max_items"""
+    chunk, size = {}, 2
+    for path, value in items:
+        entry = len(json.dumps({path: value}, ensure_ascii=False).encode("utf-8"))
+        if chunk and (size + entry > max_bytes or len(chunk) >= max_items):
+            yield chunk
+            chunk, size = {}, 2
+        chunk[path] = value
+        size += entry
+    if chunk:
+        yield chunk
+
+
+class CouponDB:
+    """REST client ของ node /coupons (ใช้ Session ร่วมกัน — thread-safe สำหรับการเรียกพร้อมกันแบบนี้)"""
+
+    def __init__(self, base_url=BASE_URL, session=None, timeout=15, cache_ttl=READ_CACHE_TTL):
+        self.base_url = base_url.rstrip("/")
+        self.session = session or make_session()
+        self.timeout = timeout
+        self.cache_ttl = cache_ttl
+        self._cache = {}
+        self._cache_lock = threading.Lock()
+
+    def url(self, code=None):
+        if code is None:
+            return f"{self.base_url}.json"
+        return f"{self.base_url}/{requests.utils.quote(str(code), safe='')}.json"
+
+    def _request(self, method, url, **kwargs):
+        response = self.session.request(method, url, timeout=self.timeout, **kwargs)
+        response.raise_for_status()
+        return response
+
+    # ── Single-record operations ─────────────────────
+    def get(self, code=None, **params):
+        return self._request("GET", self.url(code), params=params or None).json()
+
+    def put(self, code, record):
+        self.invalidate()
+        return self._request("PUT", self.url(code), json=record).json()
+
+    def patch(self, payload):
+        self.invalidate()
+        return self._request("PATCH", self.url(), json=payload).json()
+
+    def delete(self, code=None):
+        self.invalidate()
+        self._request("DELETE", self.url(code))
+
+    def keys(self):
+        """รายชื่อรหัสทั้งหมดด้วย shallow query (ไม่ดาวน์โหลดข้อมูลของแต่ละคูปอง)"""
+        return set(self.get(shallow="true") or {})
+
+    # ── Conditional writes (ETag) ────────────────────
+    def get_with_etag(self, code):
+        """คืนค่า (record, etag) ของรหัสนี้"""
+        response = self._request("GET", self.url(code), headers={"X-Firebase-ETag": "true"})
+        return response.json(), response.headers.get("ETag")
+
+    def put_if_match(self, code, record, etag):
+        """
+        PUT เมื่อ ETag ยังตรง — คืนค่า (True, record, etag ใหม่) หรือ (False, ค่าปัจจุบัน, etag ปัจจุบัน) เมื่อโดนเขียนตัดหน้า
+        """
+        self.invalidate()
+        response = self.session.request("PUT", self.url(code), json=record, timeout=self.timeout,
+                                        headers={"if-match": etag, "X-Firebase-ETag": "true"})
+        if response.status_code == 412:
+            return False, response.json(), response.headers.get("ETag")
+        response.raise_for_status()
+        return True, response.json(), response.headers.get("ETag")
+
+    def create(self, code, record):
+        """สร้างคูปองเฉพาะเมื่อยังไม่มีรหัสนี้ (atomic, if-match null_etag) — คืนค่า True ถ้าสร้างสำเร็จ"""
+        created, _, _ = self.put_if_match(code, record, NULL_ETAG)
+        return created
+
+    def redeem(self, code, machine_id="", max_attempts=REDEEM_MAX_ATTEMPTS):
+        """
+        ใช้คูปอง: เปลี่ยน status เป็น used แบบ atomic (compare-and-set ด้วย ETag)
+        คืนค่า dict: code, result (redeemed | already_used | not_found | not_redeemable | conflict),
+                     value, attempts, writes (จำนวน conditional PUT), conflicts (PUT ที่ได้ 412)
+        redemption_id ที่ฝังใน record ทำให้การ retry หลัง network error ไม่นับซ้ำ: ถ้าเจอว่า record ถูก
+        ใช้ไปแล้วด้วย id ของเราเอง แปลว่า PUT ก่อนหน้าสำเร็จแล้ว
+        """
+        redemption_id = uuid.uuid4().hex
+        record, etag = self.get_with_etag(code)
+        writes = conflicts = 0
+        for attempt in range(1, max_attempts + 1):
+            result = {"code": code, "value": record.get("value") if isinstance(record, dict) else None,
+                      "attempts": attempt, "writes": writes, "conflicts": conflicts}
+            if not isinstance(record, dict):
+                return {**result, "result": "not_found"}
+            if record.get("redemption_id") == redemption_id:
+                return {**result, "result": "redeemed"}
+            if record.get("status") == "used":
+                return {**result, "result": "already_used"}
+            if record.get("status") not in REDEEMABLE_STATUSES:
+                return {**result, "result": "not_redeemable"}
+            updated = {**record, "status": "used", "redeemed_at": time.strftime("%Y-%m-%d %H:%M:%S"),
+                       "redeemed_by": machine_id, "redemption_id": redemption_id}
+            writes += 1
+            result["writes"] = writes
+            try:
+                ok, record, etag = self.put_if_match(code, updated, etag)
+            except requests.RequestException:
+                # ไม่รู้ว่า PUT ถึง server หรือไม่ → อ่านใหม่แล้วให้ redemption_id ตัดสิน
+                record, etag = self.get_with_etag(code)
+                continue
+            if ok:
+                return {**result, "result": "redeemed"}
+            conflicts += 1
+        return {"code": code, "value": None, "attempts": max_attempts, "writes": writes, "conflicts": conflicts,
+                "result": "conflict"}
+
+    def redeem_many(self, items, workers=8, on_result=None):
+        """
+        ใช้คูปองหลายใบพร้อมกันผ่าน worker pool — items : list ของ (code, machine_id)
+        คืนค่า (results ตามลำดับ input, report: counts ต่อ result, writes, conflicts, conflict_rate, seconds, rate)
+        """
+        t0 = time.perf_counter()
+        results = [None] * len(items)
+        with ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+            futures = {pool.submit(self.redeem, code, machine): i for i, (code, machine) in enumerate(items)}
+            for done, fut in enumerate(as_completed(futures), start=1):
+                i = futures[fut]
+                try:
+                    results[i] = fut.result()
+                except requests.RequestException as e:
+                    results[i] = {"code": items[i][0], "value": None, "attempts": 0, "writes": 0, "conflicts": 0,
+                                  "result": "error", "error": str(e)}
+                if on_result is not None:
+                    on_result(done, len(items), results[i])
+        seconds = time.perf_counter() - t0
+        counts = {}
+        for r in results:
+            counts[r["result"]] = counts.get(r["result"], 0) + 1
+        writes = sum(r["writes"] for r in results)
+        conflicts = sum(r["conflicts"] for r in results)
+        report = {"counts": counts, "writes": writes, "conflicts": conflicts,
+                  "conflict_rate": conflicts / writes if writes else 0.0, "seconds": seconds,
+                  "rate": counts.get("redeemed", 0) / seconds if seconds > 0 else 0.0}
+        return results, report
+
+    # ── Cached reads ─────────────────────────────────
+    def invalidate(self):
+        """ล้าง cache การอ่านทั้งหมด (เรียกอัตโนมัติทุกครั้งที่เขียนผ่าน client นี้)"""
+        with self._cache_lock:
+            self._cache.clear()
+
+    def cached_get(self, **params):
+        """GET node /coupons ด้วย query params ผ่าน TTL cache"""
+        key = tuple(sorted(params.items()))
+        now = time.monotonic()
+        with self._cache_lock:
+            hit = self._cache.get(key)
+            if hit is not None and now - hit[0] < self.cache_ttl:
+                return hit[1]
+        value = self.get(**params)
+        with self._cache_lock:
+            self._cache[key] = (now, value)
+        return value
+
+    def count(self):
+        """จำนวนคูปองทั้งหมด (shallow listing ผ่าน cache — ไม่ดาวน์โหลด record)"""
+        return len(self.cached_get(shallow="true") or {})
+
+    def list_page(self, page_size=50, start_after=None):
+        """
+        อ่านหนึ่งหน้าเรียงตามรหัส: orderBy="$key" + limitToFirst (+ startAt รหัสสุดท้ายของหน้าก่อน)
+        ขอเกินมา 1 รายการเพื่อรู้ว่ามีหน้าถัดไปหรือไม่ (startAt รวมตัวเริ่มด้วย จึงขอเพิ่มอีก 1 เมื่อมี cursor)
+        คืนค่า (records {code: record}, next_cursor หรือ None ถ้าเป็นหน้าสุดท้าย)
+        """
+        params = {"orderBy": json.dumps("$key"), "limitToFirst": page_size + 1 + (start_after is not None)}
+        if start_after is not None:
+            params["startAt"] = json.dumps(start_after)
+        data = self.cached_get(**params) or {}
+        codes = sorted((k for k in data if k != start_after), key=key_order)
+        page = {k: data[k] for k in codes[:page_size]}
+        next_cursor = codes[page_size - 1] if len(codes) > page_size else None
+        return page, next_cursor
+
+    def select(self, status=None, coupon_type=None, value_range=None, time_range=None):
+        """{code: record} ที่ตรงกับเงื่อนไข — ดึงด้วย indexed query ตัวเดียว (ไม่ผ่าน cache) แล้วกรองส่วนที่เหลือ"""
+        criteria = {"status": status, "coupon_type": coupon_type, "value_range": value_range, "time_range": time_range}
+        data = self.get(**filter_query(**criteria)) or {}
+        return {code: data[code] for code in sorted(data, key=key_order) if match_filter(data[code], **criteria)}
+
+    # ── Bulk write ───────────────────────────────────
+    def patch_chunked(self, items, max_bytes=PATCH_CHUNK_BYTES, max_items=PATCH_CHUNK_ITEMS,
+                      workers=4, on_chunk=None):
+        """
+        เขียน items (list ของ (path, value)) ด้วย multi-path PATCH ทีละ chunk ขนานกันไม่เกิน workers
+        on_chunk(done_chunks, total_chunks, written) : callback สำหรับ progress
+        คืนค่า dict: written, failed [(path, error)], chunks, seconds, rate (รายการ/วินาที)
+        """
+        chunks = list(chunk_payload(items, max_bytes, max_items))
+        report = {"written": 0, "failed": [], "chunks": len(chunks), "seconds": 0.0, "rate": 0.0}
+        t0 = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+            futures = {pool.submit(self.patch, chunk): chunk for chunk in chunks}
+            for done, fut in enumerate(as_completed(futures), start=1):
+                chunk = futures[fut]
+                try:
+                    fut.result()
+                    report["written"] += len(chunk)
+                except requests.RequestException as e:
+                    report["failed"].extend((path, str(e)) for path in chunk)
+                if on_chunk is not None:
+                    on_chunk(done, len(chunks), report["written"])
+        report["seconds"] = time.perf_counter() - t0
+        report["rate"] = report["written"] / report["seconds"] if report["seconds"] > 0 else 0.0
+        return report
+
+    def bulk_import(self, rows, workers=4, on_chunk=None, **chunk_kwargs):
+        """
+        นำเข้าคูปองจำนวนมาก: เช็คซ้ำกับ shallow key listing ครั้งเดียว แล้วเขียนเฉพาะรหัสใหม่ด้วย patch_chunked
+        rows : list ของ (code, record) จาก parse_coupon_csv
+        คืนค่า report ของ patch_chunked + existing (list ของรหัสที่มีอยู่แล้ว)
+        """
+        existing_keys = self.keys()
+        new_rows = [(code, record) for code, record in rows if code not in existing_keys]
+        report = self.patch_chunked(new_rows, workers=workers, on_chunk=on_chunk, **chunk_kwargs)
+        report["existing"] = [code for code, _ in rows if code in existing_keys]
+        return report
+
+    def delete_many(self, codes, workers=4, on_chunk=None, **chunk_kwargs):
+        """ลบหลายรหัสด้วย multi-path PATCH {code: null} เป็น chunk (report แบบเดียวกับ patch_chunked)"""
+        return self.patch_chunked([(code, None) for code in codes], workers=workers, on_chunk=on_chunk,
+                                  **chunk_kwargs)
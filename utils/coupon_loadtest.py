@@ -0,0 +1,75 @@
+"""
+Load test ของการใช้คูปอง (CouponDB.redeem) — ค่า default รันกับ utils/fake_rtdb.py ใน process เดียวกัน
+จำลองเครื่องซักผ้าหลายเครื่องแย่งใช้คูปองชุดเดียวกัน แล้ววัด redemptions/s และอัตราการชน (412)
+และตรวจว่าแต่ละคูปองถูกใช้ได้ครั้งเดียวเท่านั้น
+
+ใช้งาน:
+    python -m utils.coupon_loadtest --coupons 500 --contention 4 --workers 32
+    python -m utils.coupon_loadtest --url http://127.0.0.1:9000/loadtest   (เช่น fake ที่รันแยกไว้)
+ห้ามชี้ --url ไปที่ /coupons ของระบบจริง — สคริปต์จะเขียนทับ node นั้น
+"""
+import argparse
+import random
+
+from utils.coupon_db import CouponDB, make_session
+from utils.fake_rtdb import FakeRTDB
+
+
+def run_load_test(db, coupons=500, contention=4, machines=20, workers=32, seed=0):
+    """
+    สร้างคูปอง coupons ใบ แล้วยิง redeem ใบละ contention ครั้ง (สุ่มลำดับ / เครื่อง) ผ่าน redeem_many
+    คืนค่า report ของ redeem_many + double_redeemed (จำนวนคูปองที่ถูกใช้เกินหนึ่งครั้ง — ต้องเป็น 0)
+    """
+    rng = random.Random(seed)
+    codes = [f"LT{i:06d}" for i in range(coupons)]
+    db.delete()
+    db.patch({code: {"status": "active", "value": 10, "timestamp": "", "type": "loadtest"} for code in codes})
+
+    items = [(code, f"washer-{rng.randrange(machines):02d}") for code in codes for _ in range(contention)]
+    rng.shuffle(items)
+    results, report = db.redeem_many(items, workers=workers)
+
+    wins = {}
+    for r in results:
+        if r["result"] == "redeemed":
+            wins[r["code"]] = wins.get(r["code"], 0) + 1
+    report["double_redeemed"] = sum(1 for n in wins.values() if n > 1)
+    report["unredeemed"] = coupons - len(wins)
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Coupon redemption load test (ETag conditional writes)")
+    parser.add_argument("--url", help="node ที่จะใช้ทดสอบ (ค่า default: เปิด fake RTDB ใน process)")
+    parser.add_argument("--coupons", type=int, default=500)
+    parser.add_argument("--contention", type=int, default=4, help="จำนวนครั้งที่แต่ละคูปองถูกพยายามใช้")
+    parser.add_argument("--machines", type=int, default=20)
+    parser.add_argument("--workers", type=int, default=32)
+    parser.add_argument("--latency", type=float, default=0.0, help="หน่วงต่อ request ของ fake (วินาที)")
+    args = parser.parse_args()
+
+    fake = None
+    url = args.url
+    if url is None:
+        fake = FakeRTDB(latency=args.latency).start()
+        url = fake.url("loadtest")
+    try:
+        db = CouponDB(url, make_session(pool_size=args.workers))
+        report = run_load_test(db, args.coupons, args.contention, args.machines, args.workers)
+    finally:
+        if fake is not None:
+            fake.stop()
+
+    total = args.coupons * args.contention
+    print(f"attempts      : {total:,} redeem calls on {args.coupons:,} coupons ({args.workers} workers)")
+    for result, n in sorted(report["counts"].items()):
+        print(f"  {result:<14}: {n:,}")
+    print(f"redemptions/s : {report['rate']:,.1f}")
+    print(f"conflict rate : {report['conflict_rate']:.1%} "
+          f"({report['conflicts']:,} of {report['writes']:,} conditional writes)")
+    print(f"elapsed       : {report['seconds']:.2f} s")
+    print(f"double redeem : {report['double_redeemed']} | unredeemed: {report['unredeemed']}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,270 @@
+"""
+Local mirror ของ node /coupons ผ่าน Firebase REST Streaming (server-sent events)
+ใช้โดยหน้า pages/coupon.py (ไม่บังคับ) — ทดสอบกับ utils/fake_rtdb.py ได้
+- event แรกของ stream คือ put "/" พร้อมข้อมูลทั้งหมด (seed) หลังจากนั้นมีแค่ส่วนที่เปลี่ยน
+- thread พื้นหลังอ่าน stream และ reconnect เองด้วย exponential backoff + jitter
+- การอ่าน (มีรหัสนี้ไหม / กรองตามสถานะ / แบ่งหน้า) ตอบจาก memory โดยไม่ต้องยิง request
+- ใช้ร่วมหลาย session ได้ผ่าน subscribe / unsubscribe — stream หยุดเมื่อไม่เหลือ session ที่ใช้อยู่
+"""
+import bisect
+import json
+import random
+import socket
+import threading
+import time
+
+import requests
+from urllib3.exceptions import HTTPError as Urllib3Error
+
+from utils.coupon_db import BASE_URL, key_order
+
+
+class CouponMirror:
+    """
+    สำเนาของ /coupons ใน process เดียว (thread-safe)
+      backoff      : (เริ่มต้น, สูงสุด) วินาทีระหว่าง reconnect
+      read_timeout : ไม่มีข้อมูล (รวม keep-alive ที่ Firebase ส่งทุก ~30 วินาที) นานเท่านี้ = ถือว่า connection ตาย
+      idle_timeout : subscriber ที่ไม่ subscribe ซ้ำนานเท่านี้ (วินาที) ถือว่าจากไปแล้ว (เช่นปิด tab โดยไม่ปิด toggle)
+    """
+
+    def __init__(self, base_url=BASE_URL, session=None, backoff=(0.5, 30.0), read_timeout=75.0,
+                 idle_timeout=900.0):
+        self.base_url = base_url.rstrip("/")
+        self.session = session or requests.Session()
+        self.backoff = backoff
+        self.read_timeout = read_timeout
+        self.idle_timeout = idle_timeout
+        self.data = {}
+        self.lock = threading.RLock()
+        self.ready = threading.Event()      # ได้ seed ครบแล้วอย่างน้อยหนึ่งครั้ง
+        self.connected = False              # stream ต่ออยู่ และได้ seed ของ connection นี้แล้ว (ข้อมูลเป็นปัจจุบัน)
+        self.version = 0                    # เพิ่มทุกครั้งที่ข้อมูลเปลี่ยน
+        self.stats = {"events": 0, "reconnects": 0, "last_error": None, "last_event": None}
+        self._sorted = (None, [])           # (version, รหัสเรียงแล้ว) สำหรับแบ่งหน้า
+        self._stop = threading.Event()
+        self._response = None
+        self._thread = None
+        self._subscribers = {}              # subscriber → เวลาที่ subscribe ล่าสุด (monotonic)
+        self._subs_lock = threading.Lock()
+
+    # ── Lifecycle ──────────────────────────────────────
+    def start(self):
+        if self._thread is not None and self._thread.is_alive() and self._stop.is_set():
+            self._thread.join(timeout=5)    # thread เดิมกำลังจะจบ (หมดคนใช้) — รอให้จบก่อนเริ่มใหม่
+        if self._thread is None or not self._thread.is_alive():
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name="coupon-mirror", daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        response = self._response
+        if response is not None:
+            # shutdown socket ให้ thread ที่ค้างอ่าน stream อยู่เจอ EOF ทันทีแล้วปิด response เอง (with ใน _listen)
+            # — close() จาก thread นี้ต้องรอ lock ของ buffer ที่ thread นั้นถืออยู่จน keep-alive ถัดไปมาถึง
+            # (shutdown ผ่าน fd ที่ dup ก็มีผลกับ socket เดียวกัน)
+            try:
+                with socket.fromfd(response.raw.fileno(), socket.AF_INET, socket.SOCK_STREAM) as sock:
+                    sock.shutdown(socket.SHUT_RDWR)
+            except (OSError, ValueError):
+                response.close()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+
+    def wait_ready(self, timeout=None):
+        return self.ready.wait(timeout)
+
+    # ── Subscribers (หนึ่ง mirror ใช้ร่วมหลาย session) ────────
+    def subscribe(self, subscriber):
+        """ลงชื่อ / ต่ออายุ subscriber แล้วเริ่ม stream ถ้ายังไม่ทำงาน — เรียกทุก rerun ของ session ที่เปิดใช้"""
+        with self._subs_lock:
+            self._subscribers[subscriber] = time.monotonic()
+            return self.start()
+
+    def unsubscribe(self, subscriber):
+        """ถอน subscriber — หยุด stream เฉพาะเมื่อไม่เหลือใครใช้แล้ว (คืน True ถ้าหยุด)"""
+        with self._subs_lock:
+            self._subscribers.pop(subscriber, None)
+            if self._subscribers:
+                return False
+            self.stop()
+            return True
+
+    def _expire_idle(self):
+        """
+        ตัด subscriber ที่หมดอายุ — ถ้าเคยมีแต่ไม่เหลือเลย ตั้ง _stop ให้ thread อ่าน stream จบเอง (คืน True)
+        mirror ที่ start() ตรงๆ โดยไม่มี subscriber (เช่น coupon_streamtest) ไม่ถูกหยุด
+        ไม่รอ lock: ถ้า subscribe / unsubscribe ถืออยู่ (และอาจกำลัง join thread นี้) ข้ามไปตรวจรอบหน้า
+        """
+        if not self._subs_lock.acquire(blocking=False):
+            return False
+        try:
+            if not self._subscribers:
+                return False
+            cutoff = time.monotonic() - self.idle_timeout
+            for subscriber, seen in list(self._subscribers.items()):
+                if seen < cutoff:
+                    del self._subscribers[subscriber]
+            if self._subscribers:
+                return False
+            self._stop.set()
+            return True
+        finally:
+            self._subs_lock.release()
+
+    def _run(self):
+        delay = self.backoff[0]
+        while not self._stop.is_set():
+            try:
+                self._listen()
+                delay = self.backoff[0]      # stream จบแบบปกติ (server ปิด) → ต่อใหม่ทันทีด้วย delay เริ่มต้น
+            except (requests.RequestException, Urllib3Error, OSError, ValueError) as e:
+                self.stats["last_error"] = f"{type(e).__name__}: {e}"
+            finally:
+                self.connected = False
+                self._response = None
+            if self._stop.is_set() or self._expire_idle():
+                break
+            self.stats["reconnects"] += 1
+            self._stop.wait(delay * random.uniform(0.5, 1.0))
+            delay = min(delay * 2, self.backoff[1])
+
+    def _listen(self):
+        response = self.session.get(f"{self.base_url}.json", headers={"Accept": "text/event-stream"},
+                                    stream=True, timeout=(10, self.read_timeout))
+        self._response = response
+        with response:
+            response.raise_for_status()
+            event, data = None, []
+            for line in self._iter_lines(response):
+                if self._stop.is_set():
+                    return
+                if line == "":
+                    if event is not None:
+                        self._dispatch(event, "\n".join(data))
+                        if self._expire_idle():     # ตรวจทุก event รวม keep-alive (~30 วินาที)
+                            return
+                    event, data = None, []
+                elif line.startswith("event:"):
+                    event = line[6:].strip()
+                elif line.startswith("data:"):
+                    data.append(line[5:].strip())
+
+    @staticmethod
+    def _iter_lines(response, chunk_size=65536):
+        """
+        แยกบรรทัดทันทีที่ข้อมูลมาถึง — iter_lines() ของ requests รอจน chunk (512 bytes) เต็มก่อน
+        event เล็กๆ จึงค้างใน buffer จนมี traffic อื่นมาดัน ถ้า server ไม่ใช้ chunked encoding
+        read1 คืนเท่าที่มีใน socket (ไม่รอให้ครบ chunk_size) และไม่ต้องอ่านทีละ byte เหมือน readline
+        """
+        read1 = getattr(response.raw, "read1", None)
+        if read1 is None:                   # urllib3 รุ่นเก่า (ไม่มี read1) — อ่านทีละ byte แทน
+            yield from response.iter_lines(chunk_size=1, decode_unicode=True)
+            return
+        pending = []
+        while True:
+            chunk = read1(chunk_size)
+            if not chunk:
+                break
+            *lines, tail = chunk.split(b"\n")
+            if lines:
+                lines[0] = b"".join(pending) + lines[0]
+                pending = []
+                for line in lines:
+                    yield line.rstrip(b"\r").decode("utf-8")
+            if tail:
+                pending.append(tail)
+        if pending:
+            yield b"".join(pending).rstrip(b"\r").decode("utf-8")
+
+    # ── Applying events ────────────────────────────────
+    def _dispatch(self, event, raw):
+        self.stats["events"] += 1
+        self.stats["last_event"] = time.time()
+        if event in ("put", "patch"):
+            payload = json.loads(raw)
+            parts = [p for p in payload["path"].split("/") if p]
+            with self.lock:
+                if event == "put":
+                    self._put(parts, payload["data"])
+                else:
+                    for key, value in (payload["data"] or {}).items():
+                        self._put(parts + [p for p in key.split("/") if p], value)
+                self.version += 1
+                if not parts and event == "put":
+                    self.connected = True
+                    self.ready.set()
+        elif event in ("cancel", "auth_revoked"):
+            # สิทธิ์ถูกยกเลิก / rules ไม่อนุญาต → ตัด stream แล้วให้ _run reconnect ตาม backoff
+            raise ValueError(f"stream {event}: {raw}")
+
+    def _put(self, parts, value):
+        if not parts:
+            self.data = value if isinstance(value, dict) else {}
+            return
+        node = self.data
+        for p in parts[:-1]:
+            child = node.get(p)
+            if not isinstance(child, dict):
+                if value is None:
+                    return
+                child = node[p] = {}
+            node = child
+        if value is None:
+            node.pop(parts[-1], None)
+            # Firebase ไม่เก็บ record ว่าง — ลบรหัสออกจาก mirror ถ้าไม่เหลือ field
+            if len(parts) > 1 and not node:
+                self.data.pop(parts[0], None)
+        else:
+            node[parts[-1]] = value
+
+    # ── Local reads ────────────────────────────────────
+    def __contains__(self, code):
+        with self.lock:
+            return code in self.data
+
+    def __len__(self):
+        with self.lock:
+            return len(self.data)
+
+    def get(self, code):
+        with self.lock:
+            record = self.data.get(code)
+            return dict(record) if isinstance(record, dict) else record
+
+    def codes(self):
+        """รหัสทั้งหมดเรียงตามลำดับ $key ของ Firebase (เก็บไว้จนกว่าข้อมูลจะเปลี่ยน)"""
+        with self.lock:
+            version, codes = self._sorted
+            if version != self.version:
+                codes = sorted(self.data, key=key_order)
+                self._sorted = (self.version, codes)
+            return codes
+
+    def select(self, statuses=None):
+        """{code: record} ที่ status อยู่ใน statuses (None = ทั้งหมด) เรียงตามรหัส"""
+        with self.lock:
+            data = self.data
+            return {c: dict(data[c]) for c in self.codes()
+                    if isinstance(data[c], dict) and (statuses is None or data[c].get("status") in statuses)}
+
+    def count(self, statuses=None):
+        if statuses is None:
+            return len(self)
+        return len(self.select(statuses))
+
+    def list_page(self, page_size=50, start_after=None, statuses=None):
+        """แบ่งหน้าแบบเดียวกับ CouponDB.list_page แต่ตอบจาก memory (+ กรองตามสถานะได้)"""
+        with self.lock:
+            codes = self.codes()
+            start = bisect.bisect_right(codes, key_order(start_after), key=key_order) if start_after is not None else 0
+            page = {}
+            for i in range(start, len(codes)):
+                record = self.data[codes[i]]
+                if not isinstance(record, dict) or (statuses is not None and record.get("status") not in statuses):
+                    continue
+                if len(page) == page_size:
+                    return page, next(reversed(page))     # ยังมีรายการถัดไป → cursor = รหัสสุดท้ายของหน้านี้
+                page[codes[i]] = dict(record)
+            return page, None
@@ -0,0 +1,114 @@
+"""
+ทดสอบ CouponMirror กับ stream จริง — ค่า default รันกับ utils/fake_rtdb.py ใน process เดียวกัน
+fake ส่ง event stream โดยไม่มี Content-Length / chunked encoding และ keep-alive ห่างกัน (30 วินาที)
+→ ถ้า mirror รอให้ buffer เต็มก่อนแยกบรรทัด event เล็กๆ จะค้างจนหมดเวลา
+
+ตรวจว่า:
+- seed (put "/") ทำให้ mirror ready ภายใน timeout
+- put / patch / delete ของ record เดียว (event ไม่กี่สิบ bytes) ถูก apply ภายใน --max-latency วินาที
+- จำนวน record ใน mirror ตรงกับ DB
+- stop() จบเร็ว แม้ stream ยังเปิดค้างอยู่
+
+ใช้งาน:
+    python -m utils.coupon_streamtest --records 2000
+    python -m utils.coupon_streamtest --url http://127.0.0.1:9000/streamtest   (เช่น fake ที่รันแยกไว้)
+ห้ามชี้ --url ไปที่ /coupons ของระบบจริง — สคริปต์จะเขียนทับ node นั้น
+"""
+import argparse
+import sys
+import time
+
+from utils.coupon_db import CouponDB
+from utils.coupon_mirror import CouponMirror
+from utils.fake_rtdb import FakeRTDB
+
+
+def _wait_for(predicate, timeout):
+    """รอจน predicate() เป็นจริง — คืนเวลาที่ใช้ (วินาที) หรือ None ถ้าหมดเวลา"""
+    start = time.perf_counter()
+    while time.perf_counter() - start < timeout:
+        if predicate():
+            return time.perf_counter() - start
+        time.sleep(0.005)
+    return None
+
+
+def run_stream_test(db, records=2000, ready_timeout=20.0, max_latency=1.0):
+    """
+    seed records รายการ → เปิด mirror → เขียนทีละ record แล้ววัดเวลาจนเห็นใน mirror
+    คืนค่า dict: ready_s, put_s, patch_s, delete_s, mirror_count, db_count, stop_s, failures (list ของข้อความ)
+    """
+    db.delete()
+    db.patch({f"ST{i:06d}": {"status": "active", "value": 10, "timestamp": "", "type": "streamtest"}
+              for i in range(records)})
+
+    report = {"failures": []}
+    mirror = CouponMirror(db.base_url).start()
+    try:
+        start = time.perf_counter()
+        ready = mirror.wait_ready(ready_timeout)
+        report["ready_s"] = time.perf_counter() - start if ready else None
+        if not ready:
+            report["failures"].append(f"mirror ไม่ ready ภายใน {ready_timeout} s")
+            return report
+
+        db.put("ST_SINGLE", {"status": "active", "value": 1})
+        report["put_s"] = _wait_for(lambda: "ST_SINGLE" in mirror, max_latency)
+        db.patch({"ST_SINGLE/status": "used"})
+        report["patch_s"] = _wait_for(lambda: (mirror.get("ST_SINGLE") or {}).get("status") == "used", max_latency)
+        db.delete("ST_SINGLE")
+        report["delete_s"] = _wait_for(lambda: "ST_SINGLE" not in mirror, max_latency)
+        for step in ("put_s", "patch_s", "delete_s"):
+            if report[step] is None:
+                report["failures"].append(f"{step[:-2]} ของ record เดียวไม่ถึง mirror ภายใน {max_latency} s")
+
+        report["db_count"] = len(db.keys())
+        _wait_for(lambda: len(mirror) == report["db_count"], max_latency)
+        report["mirror_count"] = len(mirror)
+        if report["mirror_count"] != report["db_count"]:
+            report["failures"].append(f"mirror มี {report['mirror_count']:,} รายการ แต่ DB มี {report['db_count']:,}")
+    finally:
+        start = time.perf_counter()
+        mirror.stop()
+        report["stop_s"] = time.perf_counter() - start
+    if report["stop_s"] > max_latency:
+        report["failures"].append(f"stop() ใช้เวลา {report['stop_s']:.2f} s")
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description="CouponMirror streaming test (event latency / consistency)")
+    parser.add_argument("--url", help="node ที่จะใช้ทดสอบ (ค่า default: เปิด fake RTDB ใน process)")
+    parser.add_argument("--records", type=int, default=2000)
+    parser.add_argument("--keepalive", type=float, default=30.0, help="ช่วง keep-alive ของ fake (วินาที)")
+    parser.add_argument("--max-latency", type=float, default=1.0, help="เวลาสูงสุดที่ยอมให้ event ถึง mirror (วินาที)")
+    args = parser.parse_args()
+
+    fake = None
+    url = args.url
+    if url is None:
+        fake = FakeRTDB(keepalive=args.keepalive).start()
+        url = fake.url("streamtest")
+    try:
+        report = run_stream_test(CouponDB(url), args.records, max_latency=args.max_latency)
+    finally:
+        if fake is not None:
+            fake.stop()
+
+    def fmt(seconds):
+        return "timeout" if seconds is None else f"{seconds * 1000:.1f} ms"
+
+    print(f"ready (seed)  : {fmt(report.get('ready_s'))} for {args.records:,} records")
+    for step in ("put", "patch", "delete"):
+        if f"{step}_s" in report:
+            print(f"{step:<14}: {fmt(report[f'{step}_s'])}")
+    if "mirror_count" in report:
+        print(f"records       : mirror {report['mirror_count']:,} | db {report['db_count']:,}")
+    print(f"stop()        : {fmt(report['stop_s'])}")
+    for failure in report["failures"]:
+        print(f"FAIL: {failure}")
+    sys.exit(1 if report["failures"] else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,376 @@
+"""
+Fake Firebase Realtime Database (REST) — สำหรับทดสอบ pages/coupon.py / utils/coupon_db.py แบบ Local
+รองรับ: GET (shallow, orderBy / startAt / endAt / equalTo / limitToFirst / limitToLast), PUT, PATCH (multi-path, null = ลบ), DELETE
+      Streaming (Accept: text/event-stream → event put / patch / keep-alive)
+      Conditional write (X-Firebase-ETag: true → header ETag, PUT/DELETE + if-match → 412 ถ้าไม่ตรง)
+      และการจำลอง error / latency / การหลุดของ stream
+
+ใช้งาน:
+    python -m utils.fake_rtdb --port 9000
+    COUPON_DB_URL=http://127.0.0.1:9000/coupons streamlit run streamlit_app.py
+
+หรือในโค้ด:
+    with FakeRTDB() as fake:
+        db = CouponDB(fake.url("coupons"))
+"""
+import argparse
+import hashlib
+import json
+import queue
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, unquote, urlsplit
+
+
+def _split(path):
+    """'/coupons/ABC.json' → ['coupons', 'ABC']"""
+    path = unquote(path)
+    if path.endswith(".json"):
+        path = path[:-5]
+    return [p for p in path.split("/") if p]
+
+
+def etag_of(value):
+    """ETag ของค่า (Firebase ใช้ 'null_etag' สำหรับ node ที่ไม่มีข้อมูล)"""
+    if value is None:
+        return "null_etag"
+    raw = json.dumps(value, sort_keys=True, separators=(",", ":"), ensure_ascii=False)
+    return hashlib.sha1(raw.encode("utf-8")).hexdigest()
+
+
+def _sort_key(value):
+    """ลำดับของ Firebase: null < false < true < ตัวเลข < string < object"""
+    if value is None:
+        return (0,)
+    if isinstance(value, bool):
+        return (1, value)
+    if isinstance(value, (int, float)):
+        return (2, value)
+    if isinstance(value, str):
+        return (3, value)
+    return (4,)
+
+
+_INT_KEY_RE = re.compile(r"-?0*[0-9]{1,10}")
+
+
+def _key_order(key):
+    """ลำดับของ orderBy="$key": key ที่เป็นจำนวนเต็ม 32-bit มาก่อน (เรียงตามค่า) แล้วจึง string (เรียงตามตัวอักษร)"""
+    key = str(key)
+    if _INT_KEY_RE.fullmatch(key) and -2 ** 31 <= int(key) <= 2 ** 31 - 1:
+        return (0, int(key), len(key))
+    return (1, key)
+
+
+def _query(value, query):
+    """กรองและจำกัด children ตาม orderBy / startAt / endAt / equalTo / limitToFirst / limitToLast"""
+    if "orderBy" not in query:
+        if any(k in query for k in ("startAt", "endAt", "equalTo", "limitToFirst", "limitToLast")):
+            raise ValueError("orderBy must be defined when other query parameters are defined")
+        return value
+    if not isinstance(value, dict):
+        return value
+    order_by = json.loads(query["orderBy"])
+    bound = _sort_key
+    if order_by == "$key":
+        def item_key(kv): return _key_order(kv[0])
+        bound = _key_order
+    elif order_by == "$value":
+        def item_key(kv): return _sort_key(kv[1])
+    else:
+        child = [p for p in order_by.split("/") if p]
+
+        def item_key(kv):
+            node = kv[1]
+            for p in child:
+                node = node.get(p) if isinstance(node, dict) else None
+            return _sort_key(node)
+    items = sorted(value.items(), key=lambda kv: (item_key(kv), kv[0]))
+    if "startAt" in query:
+        lo = bound(json.loads(query["startAt"]))
+        items = [kv for kv in items if item_key(kv) >= lo]
+    if "endAt" in query:
+        hi = bound(json.loads(query["endAt"]))
+        items = [kv for kv in items if item_key(kv) <= hi]
+    if "equalTo" in query:
+        eq = bound(json.loads(query["equalTo"]))
+        items = [kv for kv in items if item_key(kv) == eq]
+    if "limitToFirst" in query:
+        items = items[:int(query["limitToFirst"])]
+    if "limitToLast" in query:
+        items = items[-int(query["limitToLast"]):] if int(query["limitToLast"]) else []
+    return dict(items)
+
+
+class FakeRTDB:
+    """In-memory JSON tree + HTTP server บน thread แยก"""
+
+    def __init__(self, host="127.0.0.1", port=0, latency=0.0, keepalive=30.0):
+        self.root = {}
+        self.keepalive = keepalive
+        self._streams = []          # list ของ (parts, queue) ของ client ที่เปิด event stream อยู่
+        self.lock = threading.RLock()
+        self.latency = latency
+        self.requests = {}          # นับจำนวน request ต่อ method
+        self._failures = []         # status code ที่จะตอบกลับใน request ถัดไป
+        handler = type("Handler", (_Handler,), {"db": self})
+        self.server = ThreadingHTTPServer((host, port), handler)
+        self.server.daemon_threads = True
+        self.thread = None
+
+    # ── Lifecycle ──────────────────────────────────────
+    def start(self):
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.drop_streams()
+        self.server.shutdown()
+        self.server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def url(self, node=""):
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}/{node}".rstrip("/")
+
+    def fail_next(self, n=1, status=503):
+        """ให้ n request ถัดไปตอบ status (ใช้ทดสอบ retry)"""
+        with self.lock:
+            self._failures.extend([status] * n)
+
+    def drop_streams(self):
+        """ตัด event stream ทุกเส้น (ใช้ทดสอบ reconnect)"""
+        with self.lock:
+            for _, q in self._streams:
+                q.put(None)
+
+    def _take_failure(self):
+        with self.lock:
+            return self._failures.pop(0) if self._failures else None
+
+    # ── Tree operations ────────────────────────────────
+    def get(self, parts):
+        with self.lock:
+            node = self.root
+            for p in parts:
+                if not isinstance(node, dict) or p not in node:
+                    return None
+                node = node[p]
+            return node
+
+    def set(self, parts, value):
+        with self.lock:
+            self._set(parts, value)
+            self._notify("put", parts, value)
+
+    def _set(self, parts, value):
+        with self.lock:
+            if not parts:
+                self.root = value if isinstance(value, dict) else {}
+                return
+            node = self.root
+            for p in parts[:-1]:
+                child = node.get(p)
+                if not isinstance(child, dict):
+                    if value is None:
+                        return
+                    child = node[p] = {}
+                node = child
+            if value is None:
+                node.pop(parts[-1], None)
+                self._prune(parts[:-1])
+            else:
+                node[parts[-1]] = value
+
+    def _prune(self, parts):
+        # Firebase ไม่เก็บ node ว่าง
+        while parts:
+            node = self.get(parts)
+            if isinstance(node, dict) and not node:
+                self._set(parts, None)
+                return
+            parts = parts[:-1]
+
+    def update(self, parts, patch):
+        with self.lock:
+            for key, value in patch.items():
+                self._set(parts + [p for p in key.split("/") if p], value)
+            self._notify("patch", parts, patch)
+
+    # ── Event stream ───────────────────────────────────
+    def subscribe(self, parts):
+        """เปิด stream ที่ parts — event แรกคือ put "/" พร้อมข้อมูลทั้งหมด (แบบเดียวกับ Firebase)"""
+        q = queue.Queue()
+        with self.lock:
+            q.put(("put", {"path": "/", "data": self.get(parts)}))
+            self._streams.append((parts, q))
+        return q
+
+    def unsubscribe(self, q):
+        with self.lock:
+            self._streams = [(p, s) for p, s in self._streams if s is not q]
+
+    def _notify(self, event, parts, data):
+        """ส่ง event ให้ stream ที่ได้รับผลกระทบ (path ใน event เป็น path สัมพัทธ์กับจุดที่ subscribe)"""
+        for sub_parts, q in self._streams:
+            n = len(sub_parts)
+            if parts[:n] == sub_parts:
+                q.put((event, {"path": "/" + "/".join(parts[n:]), "data": data}))
+            elif sub_parts[:len(parts)] == parts:
+                # เขียนทับ node ที่อยู่เหนือจุดที่ subscribe → ส่งค่าใหม่ทั้งก้อน
+                q.put(("put", {"path": "/", "data": self.get(sub_parts)}))
+
+
+class _Handler(BaseHTTPRequestHandler):
+    db = None
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, *args):
+        pass
+
+    def _send(self, status, body, headers=None):
+        data = json.dumps(body, ensure_ascii=False).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(data)))
+        for k, v in (headers or {}).items():
+            self.send_header(k, v)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _body(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        raw = self.rfile.read(length) if length else b"null"
+        return json.loads(raw or b"null")
+
+    def _handle(self, method):
+        db = self.db
+        with db.lock:
+            db.requests[method] = db.requests.get(method, 0) + 1
+        if db.latency:
+            time.sleep(db.latency)
+        failure = db._take_failure()
+        if failure is not None:
+            if method in ("PUT", "PATCH", "POST"):
+                self._body()
+            self._send(failure, {"error": "injected failure"})
+            return
+        split = urlsplit(self.path)
+        parts = _split(split.path)
+        query = {k: v[-1] for k, v in parse_qs(split.query).items()}
+        try:
+            getattr(self, f"_{method.lower()}")(parts, query)
+        except (ValueError, TypeError) as e:
+            self._send(400, {"error": str(e)})
+
+    def _stream(self, parts):
+        """Server-sent events: ค้าง connection ไว้และส่ง event ตามการเปลี่ยนแปลง จนกว่าจะถูก drop_streams"""
+        q = self.db.subscribe(parts)
+        self.close_connection = True
+        try:
+            self.send_response(200)
+            self.send_header("Content-Type", "text/event-stream")
+            self.send_header("Cache-Control", "no-cache")
+            self.send_header("Connection", "close")
+            self.end_headers()
+            while True:
+                try:
+                    item = q.get(timeout=self.db.keepalive)
+                except queue.Empty:
+                    item = ("keep-alive", None)
+                if item is None:
+                    return
+                event, data = item
+                self.wfile.write(f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n".encode("utf-8"))
+                self.wfile.flush()
+        except OSError:
+            pass  # client ปิด connection
+        finally:
+            self.db.unsubscribe(q)
+
+    def _etag_headers(self, value):
+        if (self.headers.get("X-Firebase-ETag") or "").lower() == "true":
+            return {"ETag": etag_of(value)}
+        return None
+
+    def _precondition_failed(self, parts):
+        """เช็ค if-match (ต้องเรียกภายใต้ db.lock) — ถ้าไม่ตรงตอบ 412 พร้อมค่าและ ETag ปัจจุบัน แล้วคืน True"""
+        expected = self.headers.get("if-match")
+        if expected is None:
+            return False
+        current = self.db.get(parts)
+        if etag_of(current) == expected:
+            return False
+        self._send(412, current, {"ETag": etag_of(current)})
+        return True
+
+    def _get(self, parts, query):
+        if "text/event-stream" in (self.headers.get("Accept") or ""):
+            self._stream(parts)
+            return
+        with self.db.lock:
+            value = self.db.get(parts)
+            headers = self._etag_headers(value)
+        if query.get("shallow") == "true" and "orderBy" in query:
+            raise ValueError("Mixing shallow with other query parameters is not supported")
+        value = _query(value, query)
+        if query.get("shallow") == "true" and isinstance(value, dict):
+            value = {k: (True if isinstance(v, dict) else v) for k, v in value.items()}
+        self._send(200, value, headers)
+
+    def _put(self, parts, query):
+        value = self._body()
+        with self.db.lock:
+            if self._precondition_failed(parts):
+                return
+            self.db.set(parts, value)
+        self._send(200, value, self._etag_headers(value))
+
+    def _patch(self, parts, query):
+        patch = self._body()
+        if not isinstance(patch, dict):
+            raise ValueError("PATCH body must be an object")
+        self.db.update(parts, patch)
+        self._send(200, patch)
+
+    def _delete(self, parts, query):
+        with self.db.lock:
+            if self._precondition_failed(parts):
+                return
+            self.db.set(parts, None)
+        self._send(200, None)
+
+    def do_GET(self):
+        self._handle("GET")
+
+    def do_PUT(self):
+        self._handle("PUT")
+
+    def do_PATCH(self):
+        self._handle("PATCH")
+
+    def do_DELETE(self):
+        self._handle("DELETE")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Fake Firebase Realtime Database (REST)")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=9000)
+    parser.add_argument("--latency", type=float, default=0.0, help="หน่วงทุก request (วินาที)")
+    args = parser.parse_args()
+    fake = FakeRTDB(args.host, args.port, args.latency)
+    print(f"Fake RTDB listening on {fake.url()}")
+    fake.server.serve_forever()
+
+
+if __name__ == "__main__":
+    main()
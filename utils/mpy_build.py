@@ -0,0 +1,188 @@
+"""
+MicroPython .mpy Compile Service (mpy-cross)
+ใช้โดยหน้า pages/mpycross.py
+- Content-addressed cache ของผลลัพธ์ .mpy: key = (hash ของ source, ชื่อไฟล์, เวอร์ชัน mpy-cross, flags)
+- เรียก `mpy-cross --version` ครั้งเดียวต่อ process
+- Batch compile ทั้งโปรเจกต์ / ZIP แบบขนาน แล้วรวมเป็น ZIP เดียว
+"""
+import functools
+import hashlib
+import io
+import os
+import subprocess
+import tempfile
+import zipfile
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import mpy_cross
+
+# Cache บนดิสก์ (ใช้ร่วมกันทุก session) — แยกโฟลเดอร์จาก OSM graph cache ของหน้า Rent_Gradient
+MPY_CACHE_DIR = Path("./cache/mpy")
+
+# ไฟล์ที่บอร์ดต้องรันเป็น .py เสมอ (ไม่ compile)
+ENTRY_POINTS = ("boot.py", "main.py")
+
+# ตัวเลือก Build Matrix (ตาม `mpy-cross --help`)
+MARCH_CHOICES = ("x86", "x64", "armv6", "armv6m", "armv7m", "armv7em", "armv7emsp", "armv7emdp",
+                 "xtensa", "xtensawin", "rv32imc")
+OPT_LEVELS = (0, 1, 2, 3)
+EMIT_CHOICES = ("bytecode", "native", "viper")
+
+
+@functools.lru_cache(maxsize=1)
+def mpy_cross_version():
+    """`mpy-cross --version` (memoized ตลอดอายุ process)"""
+    result = subprocess.run([mpy_cross.mpy_cross, "--version"], capture_output=True, text=True)
+    return (result.stdout or result.stderr).strip()
+
+
+def cache_key(source, source_name, version, flags=()):
+    """sha256 ของ (source, ชื่อไฟล์ที่ฝังใน .mpy, เวอร์ชัน mpy-cross, flags)"""
+    h = hashlib.sha256()
+    h.update(hashlib.sha256(source).digest())
+    for part in (source_name, version, *flags):
+        h.update(b"\0" + part.encode("utf-8"))
+    return h.hexdigest()
+
+
+def _cache_read(key):
+    try:
+        return (MPY_CACHE_DIR / f"{key}.mpy").read_bytes()
+    except OSError:
+        return None
+
+
+def _cache_write(key, data):
+    """เขียนแบบ atomic (temp + rename) — ไฟล์ที่เขียนค้างจะไม่กลายเป็น cache hit ที่เสีย"""
+    try:
+        MPY_CACHE_DIR.mkdir(parents=True, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=MPY_CACHE_DIR, suffix=".tmp")
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, MPY_CACHE_DIR / f"{key}.mpy")
+    except OSError:
+        pass  # Caching is best-effort
+
+
+def compile_source(source, source_name, flags=()):
+    """
+    Compile source (.py bytes) → .mpy ผ่าน cache
+    source_name คือชื่อที่ฝังใน .mpy สำหรับ traceback (เช่น 'lib/sensor.py')
+    คืนค่า dict: name, mpy (bytes | None), cached (bool), error (str | None)
+    """
+    flags = tuple(flags)
+    key = cache_key(source, source_name, mpy_cross_version(), flags)
+    cached = _cache_read(key)
+    if cached is not None:
+        return {"name": source_name, "mpy": cached, "cached": True, "error": None}
+
+    with tempfile.TemporaryDirectory() as tmpdirname:
+        input_path = os.path.join(tmpdirname, "input.py")
+        output_path = os.path.join(tmpdirname, "output.mpy")
+        with open(input_path, "wb") as f:
+            f.write(source)
+        cmd = [mpy_cross.mpy_cross, *flags, "-s", source_name, "-o", output_path, input_path]
+        try:
+            result = subprocess.run(cmd, capture_output=True, text=True)
+        except OSError as e:
+            return {"name": source_name, "mpy": None, "cached": False, "error": str(e)}
+        if result.returncode != 0:
+            return {"name": source_name, "mpy": None, "cached": False,
+                    "error": result.stderr.strip() or f"mpy-cross exit code {result.returncode}"}
+        with open(output_path, "rb") as f:
+            data = f.read()
+
+    _cache_write(key, data)
+    return {"name": source_name, "mpy": data, "cached": False, "error": None}
+
+
+def collect_project_sources(uploads):
+    """
+    รวมไฟล์จาก upload (ชื่อ, bytes) — ZIP จะถูกแตกเป็น member ภายใน (ข้าม __MACOSX/ และ directory)
+    คืนค่า list ของ (path ภายในโปรเจกต์, bytes)
+    """
+    sources = []
+    for name, data in uploads:
+        if name.lower().endswith(".zip"):
+            with zipfile.ZipFile(io.BytesIO(data)) as zf:
+                for zi in zf.infolist():
+                    if zi.is_dir() or zi.filename.startswith("__MACOSX/"):
+                        continue
+                    sources.append((zi.filename, zf.read(zi)))
+        else:
+            sources.append((name, data))
+    return sources
+
+
+def build_variants(marches=(), opt_levels=(), emits=()):
+    """
+    สร้าง Build Matrix: ผลคูณของ -march × -O × -X emit → list ของ (label, flags)
+    ตัวเลือกที่ว่าง = ใช้ค่า default ของ mpy-cross | emit native/viper ต้องระบุ -march (ข้ามถ้าไม่มี)
+    """
+    variants = []
+    for march in (marches or (None,)):
+        for opt in (opt_levels or (None,)):
+            for emit in (emits or (None,)):
+                if emit in ("native", "viper") and march is None:
+                    continue
+                flags, parts = [], []
+                if march is not None:
+                    flags.append(f"-march={march}"); parts.append(march)
+                if opt is not None:
+                    flags.append(f"-O{opt}"); parts.append(f"O{opt}")
+                if emit is not None:
+                    flags += ["-X", f"emit={emit}"]; parts.append(emit)
+                variants.append(("-".join(parts) or "default", tuple(flags)))
+    return variants
+
+
+def compile_matrix(sources, variants, max_workers=None, keep_entry_points=True, on_result=None):
+    """
+    Compile ไฟล์ .py ทั้งโปรเจกต์ สำหรับทุก variant พร้อมกัน (งาน = ไฟล์ × variant) แล้วรวมเป็น ZIP เดียว
+    ใช้ ThreadPoolExecutor เพราะงานจริงอยู่ใน subprocess ของ mpy-cross (thread แค่รอผล)
+    cache แยกตาม flags ของแต่ละ variant — source ที่ไม่เปลี่ยนจะไม่ถูก compile ซ้ำ
+      sources  : list ของ (path, bytes) — ไฟล์ที่ไม่ใช่ .py ถูกข้าม
+      variants : list ของ (label, flags) — label ว่าง = วางไฟล์ที่ root ของ ZIP, ไม่ว่าง = โฟลเดอร์ <label>/
+      keep_entry_points : คง boot.py / main.py เป็น .py ใน ZIP
+      on_result(done, total, row) : callback สำหรับอัปเดต progress
+    คืนค่า (zip_bytes, rows) — rows: list ของ dict variant, name, output, size_py, size_mpy, cached, error
+    """
+    py_sources = [(p, d) for p, d in sources if p.lower().endswith(".py")]
+    to_compile, passthrough = [], []
+    for path, data in py_sources:
+        is_entry = keep_entry_points and os.path.basename(path) in ENTRY_POINTS
+        (passthrough if is_entry else to_compile).append((path, data))
+    jobs = [(label, flags, path, data) for label, flags in variants for path, data in to_compile]
+
+    def arcname(label, path):
+        return f"{label}/{path}" if label else path
+
+    rows = []
+    total = len(py_sources) * len(variants)
+    zip_buffer = io.BytesIO()
+    workers = max_workers or min(len(jobs), 2 * (os.cpu_count() or 1)) or 1
+    with ThreadPoolExecutor(max_workers=workers) as pool, \
+            zipfile.ZipFile(zip_buffer, "w", zipfile.ZIP_DEFLATED) as zf:
+        for label, _ in variants:
+            for path, data in passthrough:
+                zf.writestr(arcname(label, path), data)
+                rows.append({"variant": label, "name": path, "output": arcname(label, path),
+                             "size_py": len(data), "size_mpy": None, "cached": None, "error": None})
+        results = pool.map(lambda job: compile_source(job[3], job[2], job[1]), jobs)
+        for (label, _, path, data), res in zip(jobs, results):
+            output = arcname(label, os.path.splitext(path)[0] + ".mpy")
+            if res["error"] is None:
+                zf.writestr(output, res["mpy"])
+            rows.append({"variant": label, "name": path, "output": output, "size_py": len(data),
+                         "size_mpy": len(res["mpy"]) if res["mpy"] is not None else None,
+                         "cached": res["cached"], "error": res["error"]})
+            if on_result is not None:
+                on_result(len(rows), total, rows[-1])
+    return zip_buffer.getvalue(), rows
+
+
+def compile_batch(sources, flags=(), max_workers=None, keep_entry_points=True, on_result=None):
+    """Compile ทั้งโปรเจกต์ด้วย flags ชุดเดียว (ดู compile_matrix) — ไฟล์อยู่ที่ root ของ ZIP"""
+    return compile_matrix(sources, [("", tuple(flags))], max_workers=max_workers,
+                          keep_entry_points=keep_entry_points, on_result=on_result)
@@ -0,0 +1,417 @@
+"""
+Edge betweenness แบบ array (Brandes) และ closeness แบบ streaming / adaptive สำหรับโครงข่ายถนน
+— ใช้โดยหน้า pages/Rent_Gradient.py
+(แยกออกมาจากหน้า Streamlit เพื่อให้ worker ใน Process Pool import ฟังก์ชันได้)
+- กราฟไม่มีทิศเก็บเป็น CSR สมมาตร (edge ซ้ำระหว่างคู่โหนดเดียวกันเก็บความยาวที่สั้นที่สุด)
+- ระยะทางจาก scipy dijkstra ทีละ block ของ source, นับ shortest path / สะสม dependency ด้วย kernel
+  ที่ compile ด้วย numba ถ้ามี (ไม่มี → kernel เดียวกันรันบน list ของ Python)
+- แบ่ง source เป็นก้อนกระจายให้ ProcessPoolExecutor — ผลเหมือน nx.edge_betweenness_centrality
+  (normalized, k-sampling ด้วย seed เดียวกันได้ source ชุดเดียวกัน)
+- closeness: exact เก็บแค่ผลรวมระยะต่อโหนด (Dijkstra ทีละ block → หน่วยความจำ O(n) ตามงบ),
+  กราฟใหญ่เพิ่ม pivot ทีละชุดจนอันดับ top node นิ่ง พร้อม error / confidence ของผล
+
+Benchmark:
+    python -m utils.network_centrality                  (ทุกกราฟใน ./cache/osm_graph_*/)
+    python -m utils.network_centrality --synthetic 60 --k 200 --workers 4
+"""
+import argparse
+import json
+import math
+import os
+import random
+import time
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+import numpy as np
+
+try:
+    from scipy.sparse import csr_matrix
+    from scipy.sparse.csgraph import dijkstra
+except ImportError:  # undirected_csr / sample_sources ใช้ได้ด้วย numpy อย่างเดียว
+    csr_matrix = dijkstra = None
+
+try:
+    from numba import njit
+    HAS_NUMBA = True
+except ImportError:  # numba เป็น optional accelerator
+    njit = None
+    HAS_NUMBA = False
+
+DIJKSTRA_BLOCK = 32                 # source ต่อหนึ่ง call ของ scipy dijkstra (หน่วยความจำ = block × n float64)
+PARALLEL_MIN_WORK = 2_000_000       # sources × directed edges ต่ำกว่านี้รันใน process เดียว (ไม่คุ้มค่า spawn)
+PROGRESS_CHUNKS = 20                # จำนวนก้อนของงาน process เดียว เพื่อรายงาน progress(done, total)
+
+
+# ── CSR ───────────────────────────────────────────
+def undirected_csr(n, u, v, w):
+    """
+    edge (u, v, w) → CSR สมมาตรของกราฟไม่มีทิศ (ตัด self-loop, คู่ซ้ำเก็บ w ที่น้อยที่สุด)
+    คืนค่า dict: indptr, indices, weights, entry_pair (คู่ที่แต่ละช่องของ CSR อ้างถึง),
+    pair_u, pair_v, pair_w และ edge_pair (คู่ของ edge ขาเข้าแต่ละเส้น, −1 = self-loop)
+    """
+    u = np.asarray(u, dtype=np.int64)
+    v = np.asarray(v, dtype=np.int64)
+    w = np.asarray(w, dtype=np.float64)
+    keep = np.flatnonzero(u != v)
+    a, b, w = np.minimum(u, v)[keep], np.maximum(u, v)[keep], w[keep]
+    by_pair = np.lexsort((w, b, a))
+    a, b, w = a[by_pair], b[by_pair], w[by_pair]
+    first = np.r_[True, (a[1:] != a[:-1]) | (b[1:] != b[:-1])] if len(a) else np.zeros(0, dtype=bool)
+    edge_pair = np.full(len(u), -1, dtype=np.int64)
+    edge_pair[keep[by_pair]] = np.cumsum(first) - 1
+    a, b, w = a[first], b[first], w[first]
+    pair = np.arange(len(a), dtype=np.int64)
+
+    rows = np.r_[a, b]
+    order = np.argsort(rows, kind="stable")
+    return {
+        "n": int(n),
+        "indptr": np.r_[0, np.cumsum(np.bincount(rows, minlength=n))].astype(np.int64),
+        "indices": np.r_[b, a][order],
+        "weights": np.r_[w, w][order],
+        "entry_pair": np.r_[pair, pair][order],
+        "pair_u": a,
+        "pair_v": b,
+        "pair_w": w,
+        "edge_pair": edge_pair,
+    }
+
+
+def csr_from_networkx(G_undir, weight="length"):
+    """CSR ของกราฟ networkx ไม่มีทิศ (Multi)Graph → (nodelist, csr) — edge ที่ไม่มี weight = 1 แบบเดียวกับ networkx"""
+    nodelist = list(G_undir.nodes)
+    index = {node: i for i, node in enumerate(nodelist)}
+    m = G_undir.number_of_edges()
+    u = np.empty(m, dtype=np.int64)
+    v = np.empty(m, dtype=np.int64)
+    w = np.empty(m, dtype=np.float64)
+    for e, (a, b, length) in enumerate(G_undir.edges(data=weight, default=1.0)):
+        u[e], v[e], w[e] = index[a], index[b], length
+    return nodelist, undirected_csr(len(nodelist), u, v, w)
+
+
+def sample_sources(n, k, seed=42):
+    """index ของ k source แบบเดียวกับ k-sampling ของ networkx (random.Random(seed).sample บนลำดับโหนด)"""
+    return None if k is None else random.Random(seed).sample(range(n), k)
+
+
+# ── Brandes kernel ─────────────────────────────────
+def _accumulate_source(pred_ptr, pred_node, pred_pair, order, sigma, delta, out):
+    """
+    Brandes ของ source เดียว (order[0] = source, ที่เหลือเรียงตามระยะ): นับจำนวน shortest path
+    (sigma) จาก predecessor บน DAG แล้วสะสม dependency ย้อนลำดับลง out[คู่โหนด]
+    predecessor ของโหนด v คือ pred_node[pred_ptr[v]:pred_ptr[v + 1]] — sigma / delta ต้องเป็นศูนย์ก่อนเรียก
+    """
+    sigma[order[0]] = 1.0
+    for i in range(1, len(order)):
+        v = order[i]
+        total = 0.0
+        for e in range(pred_ptr[v], pred_ptr[v + 1]):
+            total += sigma[pred_node[e]]
+        sigma[v] = total
+    for i in range(len(order) - 1, 0, -1):
+        v = order[i]
+        if sigma[v] == 0.0:
+            continue
+        coeff = (1.0 + delta[v]) / sigma[v]
+        for e in range(pred_ptr[v], pred_ptr[v + 1]):
+            t = pred_node[e]
+            c = sigma[t] * coeff
+            out[pred_pair[e]] += c
+            delta[t] += c
+
+
+_accumulate_source_jit = njit(cache=True, nogil=True)(_accumulate_source) if HAS_NUMBA else None
+
+
+def _shortest_path_dag(csr, rows, dist, s):
+    """
+    DAG ของ shortest path จาก s (vectorized): ช่อง CSR v→t เป็น predecessor เมื่อ dist[t] + w == dist[v]
+    (เทียบแบบเดียวกับ networkx จึงนับเส้นทางที่ยาวเท่ากันได้ตรงกัน)
+    คืนค่า (pred_ptr, pred_node, pred_pair, order) — order = s ตามด้วยโหนดที่ไปถึงเรียงตามระยะ
+    """
+    dv = dist[rows]
+    on = (dist[csr["indices"]] + csr["weights"] == dv) & np.isfinite(dv)
+    pred_ptr = np.r_[0, np.cumsum(np.bincount(rows[on], minlength=csr["n"]))]
+    reach = np.flatnonzero(np.isfinite(dist))
+    reach = reach[np.argsort(dist[reach], kind="stable")]
+    return pred_ptr, csr["indices"][on], csr["entry_pair"][on], np.r_[s, reach[reach != s]]
+
+
+def _betweenness_chunk(csr, sources):
+    """ผลรวม dependency (ยังไม่ normalize) ต่อคู่โหนด จาก source ชุดหนึ่ง — งานของ worker หนึ่งก้อน"""
+    n = csr["n"]
+    n_pairs = len(csr["pair_u"])
+    graph = csr_matrix((csr["weights"], csr["indices"], csr["indptr"]), shape=(n, n))
+    rows = np.repeat(np.arange(n), np.diff(csr["indptr"]))
+    out = np.zeros(n_pairs) if HAS_NUMBA else [0.0] * n_pairs
+
+    for start in range(0, len(sources), DIJKSTRA_BLOCK):
+        block = sources[start:start + DIJKSTRA_BLOCK]
+        dist = dijkstra(graph, directed=True, indices=block)
+        for row, s in zip(dist, block):
+            dag = _shortest_path_dag(csr, rows, row, s)
+            if HAS_NUMBA:
+                _accumulate_source_jit(*dag, np.zeros(n), np.zeros(n), out)
+            else:
+                _accumulate_source(*(a.tolist() for a in dag), [0.0] * n, [0.0] * n, out)
+    return np.asarray(out, dtype=np.float64)
+
+
+def edge_betweenness(csr, sources=None, workers=None, progress=None):
+    """
+    Normalized edge betweenness ต่อคู่โหนด (ลำดับเดียวกับ csr["pair_u"], csr["pair_v"])
+      sources  : index ของ source (None = ทุกโหนด = exact) — scale เหมือน networkx: 1 / (k · (n − 1))
+      workers  : จำนวน process (None = จำนวน CPU) — งานเล็กกว่า PARALLEL_MIN_WORK รันใน process เดียว
+      progress : callable(done, total) หลังแต่ละก้อนของ source (raise เพื่อยกเลิกได้)
+    """
+    n = csr["n"]
+    sources = np.arange(n, dtype=np.int64) if sources is None else np.asarray(sources, dtype=np.int64)
+    if n < 2 or not len(sources):
+        return np.zeros(len(csr["pair_u"]))
+
+    workers = workers or os.cpu_count() or 1
+    parallel = workers > 1 and len(sources) * len(csr["indices"]) >= PARALLEL_MIN_WORK
+    n_chunks = workers * 4 if parallel else (PROGRESS_CHUNKS if progress else 1)
+    chunks = [c for c in np.array_split(sources, n_chunks) if len(c)]
+    total = np.zeros(len(csr["pair_u"]))
+    if parallel:
+        pool = ProcessPoolExecutor(max_workers=workers)
+        try:
+            futures = [pool.submit(_betweenness_chunk, csr, chunk) for chunk in chunks]
+            for i, future in enumerate(futures, start=1):
+                total += future.result()
+                if progress:
+                    progress(i, len(chunks))
+        except BaseException:
+            # ยกเลิก (progress raise) / error → ถอนก้อนที่ยังรอคิวแล้วออกทันที ไม่รอทุกก้อนเหมือน with-block
+            pool.shutdown(wait=False, cancel_futures=True)
+            raise
+        pool.shutdown()
+    else:
+        for i, chunk in enumerate(chunks, start=1):
+            total += _betweenness_chunk(csr, chunk)
+            if progress:
+                progress(i, len(chunks))
+    return total / (len(sources) * (n - 1))
+
+
+def edge_betweenness_centrality(G_undir, k=None, weight="length", seed=42, workers=None):
+    """
+    แทน nx.edge_betweenness_centrality(G_undir, k, weight, seed) ได้ตรงตัว (normalized)
+    k-sampling เลือก source ด้วย random.Random(seed).sample แบบเดียวกับ networkx
+    คืนค่า {(u, v) เรียงแล้ว: score} หนึ่งค่าต่อคู่โหนด (edge ซ้ำระหว่างคู่เดียวกันรวมเป็นค่าเดียว)
+    """
+    nodelist, csr = csr_from_networkx(G_undir, weight)
+    scores = edge_betweenness(csr, sample_sources(len(nodelist), k, seed), workers)
+    return {
+        tuple(sorted((nodelist[a], nodelist[b]))): float(s)
+        for a, b, s in zip(csr["pair_u"].tolist(), csr["pair_v"].tolist(), scores.tolist())
+    }
+
+
+# ── Closeness ──────────────────────────────────────
+def _distance_blocks(adjacency, sources, block_bytes):
+    """ระยะทางจาก sources ทีละ block (แถวละ n float64) ไม่เกิน block_bytes ต่อ block"""
+    rows = max(1, int(block_bytes // (8 * adjacency.shape[0])))
+    for start in range(0, len(sources), rows):
+        block = sources[start:start + rows]
+        yield block, dijkstra(adjacency, directed=True, indices=block)
+
+
+def exact_closeness(adjacency, block_bytes=32 * 2**20, progress=None):
+    """
+    Closeness แบบ exact (n − 1) / Σ d(v, u) บนกราฟเชื่อมต่อ (adjacency สมมาตร)
+    — Dijkstra ทีละ block แล้วเก็บเฉพาะผลรวมต่อแถว: ไม่มีเมทริกซ์ n × n
+    progress: callable(done, total) หลังแต่ละ block
+    """
+    n = adjacency.shape[0]
+    sums = np.empty(n)
+    for block, dist in _distance_blocks(adjacency, np.arange(n), block_bytes):
+        sums[block] = dist.sum(axis=1)
+        if progress:
+            progress(int(block[-1]) + 1, n)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        return np.where(np.isfinite(sums) & (sums > 0), (n - 1) / sums, 0.0)
+
+
+def _normal_cdf(z):
+    return 0.5 * (1.0 + math.erf(z / math.sqrt(2.0)))
+
+
+def adaptive_closeness(
+    adjacency,
+    seed=42,
+    batch=100,
+    min_pivots=200,
+    max_pivots=3000,
+    top_k=10,
+    tolerance=0.9,
+    stable_rounds=2,
+    verify_top=10,
+    verify_max=300,
+    block_bytes=32 * 2**20,
+    progress=None,
+):
+    """
+    Closeness แบบ pivot sampling (Eppstein–Wang) ที่เพิ่ม pivot จนผลนิ่ง
+      Ĉ(v) = 1 / mean_p d(v, p)  — เก็บแค่ Σd และ Σd² ต่อโหนด (O(n))
+
+    เพิ่ม pivot ทีละ batch (ลำดับสุ่มด้วย seed, ไม่ซ้ำ) จนกว่า top node เดิมและ top_k ซ้อนทับกับรอบก่อน
+    ≥ tolerance ติดกัน stable_rounds รอบ (ไม่น้อยกว่า min_pivots, ไม่เกิน max_pivots)
+    จากนั้นคำนวณ closeness exact ของตัวเต็ง (verify_top อันดับแรก + ทุกโหนดที่ช่วง ±2 SE ทับกับตัวที่ดีที่สุด,
+    ไม่เกิน verify_max) แล้วเลือก top node จากค่าจริง
+
+    progress: callable(done, total) หลังแต่ละ batch (total = max_pivots — จบก่อนได้เมื่อผลนิ่ง)
+
+    คืนค่า (closeness, quality) — quality: pivots, rel_error (SE สัมพัทธ์มัธยฐานของ Ĉ),
+    top_confidence (โอกาสที่ไม่มีโหนดนอกตัวเต็งดีกว่า top node จาก SE ของตัวที่ดีที่สุดนอกกลุ่ม)
+    """
+    n = adjacency.shape[0]
+    order = np.random.default_rng(seed).permutation(n)
+    sum_d = np.zeros(n)
+    sum_d2 = np.zeros(n)
+    k = 0
+    stable = 0
+    prev_top = None
+    limit = min(max_pivots, n)
+    top_k = min(top_k, n)
+
+    while k < limit:
+        pivots = order[k:min(k + batch, limit)]
+        for _, dist in _distance_blocks(adjacency, pivots, block_bytes):
+            sum_d += dist.sum(axis=0)
+            sum_d2 += np.square(dist).sum(axis=0)
+        k += len(pivots)
+        if progress:
+            progress(k, limit)
+
+        mean = sum_d / k
+        top = np.argpartition(mean, top_k - 1)[:top_k]
+        top = top[np.argsort(mean[top], kind="stable")]
+        if prev_top is not None and top[0] == prev_top[0] \
+                and len(np.intersect1d(top, prev_top)) >= tolerance * top_k:
+            stable += 1
+        else:
+            stable = 0
+        prev_top = top
+        if k >= min_pivots and stable >= stable_rounds:
+            break
+
+    mean = sum_d / k
+    # SE ของค่าเฉลี่ยระยะ (สุ่มแบบไม่คืนที่ → finite population correction)
+    fpc = (n - k) / (n - 1) if n > 1 else 0.0
+    se = np.sqrt(np.maximum(sum_d2 / k - mean ** 2, 0.0) / k * fpc)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        closeness = np.where(np.isfinite(mean) & (mean > 0), 1.0 / mean, 0.0)
+        rel_error = float(np.median(np.where(mean > 0, se / mean, 0.0)))
+
+    # ตัวเต็ง: คำนวณค่าจริง (Dijkstra จากตัวเต็งเอง — กราฟสมมาตร) แล้วแทนค่าประมาณ
+    plausible = int(np.count_nonzero(mean - 2.0 * se <= np.min(mean + 2.0 * se)))
+    verify = min(max(verify_top, plausible), verify_max, n)
+    candidates = np.argpartition(mean, verify - 1)[:verify]
+    sums = np.concatenate([dist.sum(axis=1) for _, dist in _distance_blocks(adjacency, candidates, block_bytes)])
+    closeness[candidates] = np.where(sums > 0, (n - 1) / sums, 0.0)
+
+    best_mean = sums.min() / (n - 1)
+    outside = np.ones(n, dtype=bool)
+    outside[candidates] = False
+    if outside.any() and k < n:
+        challenger = np.flatnonzero(outside)[np.argmin(mean[outside])]
+        spread = se[challenger]
+        gap = mean[challenger] - best_mean
+        top_confidence = _normal_cdf(gap / spread) if spread > 0 else float(gap > 0)
+    else:
+        top_confidence = 1.0
+    return closeness, {
+        "pivots": k, "verified": verify, "rel_error": rel_error, "top_confidence": top_confidence,
+    }
+
+
+# ── Benchmark ──────────────────────────────────────
+def load_cached_network(entry_dir):
+    """
+    อ่านกราฟจาก graph cache แบบ columnar ของหน้า Rent_Gradient (osm_graph_<key>/) เป็น (n, u, v, length)
+    ผ่าน memory map — ไม่ต้องสร้าง networkx graph
+    """
+    entry_dir = Path(entry_dir)
+    meta = json.loads((entry_dir / "meta.json").read_text(encoding="utf-8"))
+    indptr = np.load(entry_dir / "indptr.npy", mmap_mode="r")
+    v = np.load(entry_dir / "v.npy", mmap_mode="r")
+    length = np.nan_to_num(np.load(entry_dir / "length.npy", mmap_mode="r"), nan=1.0)
+    u = np.repeat(np.arange(meta["nodes"]), np.diff(indptr))
+    return meta, meta["nodes"], u, np.asarray(v), length
+
+
+def synthetic_grid(side, seed=0):
+    """กริดถนน side × side (ระยะ 80–120 ม. สุ่ม) สำหรับ benchmark เมื่อไม่มีกราฟใน cache"""
+    rng = np.random.default_rng(seed)
+    idx = np.arange(side * side).reshape(side, side)
+    u = np.r_[idx[:, :-1].ravel(), idx[:-1, :].ravel()]
+    v = np.r_[idx[:, 1:].ravel(), idx[1:, :].ravel()]
+    return side * side, u, v, rng.uniform(80.0, 120.0, len(u))
+
+
+def _networkx_reference(n, u, v, w, k, seed):
+    import networkx as nx
+
+    G = nx.Graph()
+    G.add_nodes_from(range(n))
+    for a, b, length in sorted(zip(u.tolist(), v.tolist(), w.tolist()), key=lambda e: -e[2]):
+        if a != b:
+            G.add_edge(a, b, length=length)  # เรียงยาว→สั้น: edge ซ้ำจบที่ความยาวน้อยสุด
+    result = nx.edge_betweenness_centrality(G, k=k, weight="length", seed=seed)
+    return {tuple(sorted(e)): s for e, s in result.items()}
+
+
+def benchmark(n, u, v, w, k=None, workers=None, compare=True, seed=42):
+    """เวลา (วินาที) ของ engine นี้เทียบกับ networkx + ค่าต่างสูงสุด (relative ต่อค่าสูงสุด)"""
+    csr = undirected_csr(n, u, v, w)
+    sources = sample_sources(n, k, seed)
+    t0 = time.perf_counter()
+    scores = edge_betweenness(csr, sources, workers)
+    report = {"nodes": n, "pairs": len(scores), "k": k, "seconds": time.perf_counter() - t0}
+    if compare:
+        t0 = time.perf_counter()
+        ref = _networkx_reference(n, u, v, w, k, seed)
+        report["networkx_seconds"] = time.perf_counter() - t0
+        ours = dict(zip(zip(csr["pair_u"].tolist(), csr["pair_v"].tolist()), scores.tolist()))
+        scale = max(ref.values()) or 1.0
+        report["max_rel_diff"] = max(abs(ours.get(e, 0.0) - s) for e, s in ref.items()) / scale
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Edge betweenness benchmark (array Brandes vs networkx)")
+    parser.add_argument("--cache-dir", default="./cache", help="โฟลเดอร์ graph cache ของหน้า Rent_Gradient")
+    parser.add_argument("--synthetic", type=int, metavar="SIDE", help="ใช้กริด SIDE × SIDE แทนกราฟใน cache")
+    parser.add_argument("--k", type=int, help="จำนวน source ที่สุ่ม (ไม่ระบุ = exact)")
+    parser.add_argument("--workers", type=int, help="จำนวน process (ค่า default = จำนวน CPU)")
+    parser.add_argument("--no-compare", action="store_true", help="ไม่รัน networkx เทียบ")
+    args = parser.parse_args()
+
+    if args.synthetic:
+        graphs = [(f"grid {args.synthetic}x{args.synthetic}", *synthetic_grid(args.synthetic))]
+    else:
+        graphs = []
+        for meta_file in sorted(Path(args.cache_dir).glob("osm_graph_*/meta.json")):
+            meta, n, u, v, w = load_cached_network(meta_file.parent)
+            if meta.get("kind", "graph") == "graph":
+                graphs.append((f"{meta_file.parent.name} ({meta.get('network_type')})", n, u, v, w))
+        if not graphs:
+            parser.error(f"ไม่พบกราฟใน {args.cache_dir} — ใช้ --synthetic SIDE แทน")
+
+    print(f"numba: {'on' if HAS_NUMBA else 'off (pure Python kernel)'} | workers: {args.workers or os.cpu_count()}")
+    for name, n, u, v, w in graphs:
+        k = min(args.k, n) if args.k else None
+        r = benchmark(n, u, v, w, k, args.workers, compare=not args.no_compare)
+        line = f"{name}: {r['nodes']:,} nodes, {r['pairs']:,} edges, k={k or 'all'} → {r['seconds']:.2f} s"
+        if "networkx_seconds" in r:
+            line += (f" | networkx {r['networkx_seconds']:.2f} s"
+                     f" ({r['networkx_seconds'] / r['seconds']:.1f}×) | max diff {r['max_rel_diff']:.1e}")
+        print(line)
+
+
+if __name__ == "__main__":
+    main()